@@ -68,7 +68,10 @@ document.addEventListener('DOMContentLoaded', () => {
             }
             if (!response.ok) {
                 const errorData = await response.json().catch(() => ({ message: 'Falha na requisição à API' }));
-                throw new Error(errorData.message || 'Erro desconhecido');
+                const error = new Error(errorData.erro || errorData.message || 'Erro desconhecido');
+                error.status = response.status;
+                error.data = errorData;
+                throw error;
             }
             if (method !== 'DELETE' && response.status !== 204) return await response.json();
         } finally {
@@ -102,7 +105,6 @@ document.addEventListener('DOMContentLoaded', () => {
                 const singularEndpoint = state.currentSection.slice(0, -1);
                 await apiRequest(`${singularEndpoint}/${id}`, 'DELETE');
                 showToast('Item apagado com sucesso!', 'success');
-                state.cache[state.currentSection] = null;
                 await loadSection(`#${state.currentSection}`);
             } catch (error) {
                 showToast(`Falha ao apagar o item: ${error.message}`, 'error');
@@ -133,11 +135,18 @@ document.addEventListener('DOMContentLoaded', () => {
         state.charts[chartId] = new Chart(ctx, { type, data, options });
     };
 
+    // Os catálogos ficam em memória e são sincronizados com ?since_version=: o servidor só devolve
+    // as linhas alteradas/apagadas desde a versão guardada (ou 304 se nada mudou).
     const getCachedData = async (key) => {
-        if (state.cache[key]) return state.cache[key];
-        const data = await apiRequest(key);
-        state.cache[key] = data;
-        return data;
+        const cached = state.cache[key] || { versao: 0, itens: [] };
+        const delta = await apiRequest(`${key}?since_version=${cached.versao}`);
+        if (delta.versao !== cached.versao || !state.cache[key]) {
+            const porId = new Map(cached.itens.map(item => [item.id, item]));
+            delta.removidos.forEach(id => porId.delete(id));
+            delta.itens.forEach(item => porId.set(item.id, item));
+            state.cache[key] = { versao: delta.versao, itens: [...porId.values()].sort((a, b) => a.id - b.id) };
+        }
+        return state.cache[key].itens;
     };
 
     const handleFormSubmit = async (formData, endpointSingular, endpointPlural, loadDataFunction) => {
@@ -151,7 +160,6 @@ document.addEventListener('DOMContentLoaded', () => {
             const endpoint = state.editItemId ? `${endpointSingular}/${state.editItemId}` : endpointPlural;
             await apiRequest(endpoint, method, data);
             
-            state.cache[endpointPlural] = null;
             closeModal();
             showToast(`Registo ${state.editItemId ? 'atualizado' : 'adicionado'} com sucesso!`, 'success');
             await loadDataFunction();
@@ -250,7 +258,6 @@ document.addEventListener('DOMContentLoaded', () => {
         const newStatus = toggle.checked;
         try {
             await apiRequest(`tecnico/${tecnicoId}/status`, 'PUT', { de_plantao: newStatus });
-            state.cache.tecnicos = null;
             await loadTecnicosData();
             showToast('Status do técnico atualizado!', 'success');
         } catch (error) {
@@ -272,9 +279,14 @@ document.addEventListener('DOMContentLoaded', () => {
         openModal(isEditing ? `Editar Técnico #${item.id}` : 'Adicionar Novo Técnico', formHtml, handleTecnicoSubmit);
     };
 
-    const loadChamadosData = async (filters = {}) => {
-        const queryParams = new URLSearchParams(filters).toString();
-        const [chamados, tecnicos, clientes, elevadores] = await Promise.all([
+    const CHAMADOS_PAGE_SIZE = 100;
+    const CHAMADOS_FIELDS = 'id_chamado,status,endereco,tecnico_responsavel,data_abertura';
+
+    const loadChamadosData = async (filters = {}, cursor = null) => {
+        const params = { ...filters, limit: CHAMADOS_PAGE_SIZE, fields: CHAMADOS_FIELDS };
+        if (cursor) params.cursor = cursor;
+        const queryParams = new URLSearchParams(params).toString();
+        const [pagina, tecnicos, clientes, elevadores] = await Promise.all([
             apiRequest(`chamados?${queryParams}`), getCachedData('tecnicos'),
             getCachedData('clientes'), getCachedData('elevadores')
         ]);
@@ -295,8 +307,8 @@ document.addEventListener('DOMContentLoaded', () => {
         populateSelect('filter-tecnico', tecnicos, 'id', 'nome');
 
         const tableBody = document.getElementById('chamados-table-body');
-        tableBody.innerHTML = '';
-        chamados.forEach(c => {
+        if (!cursor) tableBody.innerHTML = '';
+        pagina.chamados.forEach(c => {
             const row = tableBody.insertRow();
             let tecnicoCellHtml = c.tecnico_responsavel;
             if (c.status === 'aberto') {
@@ -317,8 +329,19 @@ document.addEventListener('DOMContentLoaded', () => {
                 <td class="px-6 py-4 whitespace-nowrap">${tecnicoCellHtml}</td>
                 <td class="px-6 py-4 whitespace-nowrap">${c.data_abertura}</td>`;
         });
-        document.querySelectorAll('.assign-btn').forEach(button => button.addEventListener('click', handleManualAssignment));
-        
+        document.querySelectorAll('.assign-btn').forEach(button => button.onclick = handleManualAssignment);
+
+        let loadMoreBtn = document.getElementById('load-more-chamados-btn');
+        if (!loadMoreBtn) {
+            loadMoreBtn = document.createElement('button');
+            loadMoreBtn.id = 'load-more-chamados-btn';
+            loadMoreBtn.className = 'mt-4 bg-slate-200 text-slate-700 font-bold py-2 px-4 rounded-lg hover:bg-slate-300';
+            loadMoreBtn.textContent = 'Carregar mais';
+            tableBody.closest('.table-responsive').after(loadMoreBtn);
+        }
+        loadMoreBtn.classList.toggle('hidden', !pagina.next_cursor);
+        loadMoreBtn.onclick = () => loadChamadosData(filters, pagina.next_cursor);
+
         document.getElementById('apply-filters-btn').onclick = () => {
             const newFilters = {
                 data_inicio: document.getElementById('filter-data-inicio').value,
@@ -347,7 +370,13 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
         try {
-            await apiRequest(`chamado/${chamadoId}/atribuir`, 'POST', { tecnico_id: tecnicoId });
+            try {
+                await apiRequest(`chamado/${chamadoId}/atribuir`, 'POST', { tecnico_id: tecnicoId });
+            } catch (error) {
+                // Técnico na carga máxima: só o admin, de forma explícita, a pode ultrapassar.
+                if (error.status !== 409 || !error.data.carga_maxima || !confirm(`${error.message} Atribuir mesmo assim?`)) throw error;
+                await apiRequest(`chamado/${chamadoId}/atribuir`, 'POST', { tecnico_id: tecnicoId, forcar: true });
+            }
             showToast('Técnico atribuído com sucesso!', 'success');
             loadChamadosData();
         } catch (error) {
@@ -1,42 +1,105 @@
 # app.py
 # Backend para o sistema de chamados da UpLine Elevadores
 # Use os seguintes comandos para instalar as dependências:
-# pip install Flask Flask-SQLAlchemy flask-cors psycopg2-binary gunicorn PyJWT
+# pip install Flask Flask-SQLAlchemy flask-cors psycopg2-binary gunicorn PyJWT numpy
+# Em cada deploy, antes dos workers: flask --app app:criar_app esquema inicializar && gunicorn
 
 import os
-from flask import Flask, request, jsonify
+import atexit
+import time
+import threading
+from flask import Flask, Blueprint, current_app, request, jsonify, Response, stream_with_context, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from math import radians, sin, cos, sqrt, atan2
+from flask.cli import AppGroup
 import datetime
-from sqlalchemy import func, extract
+import base64
+import csv
+import io
+import json
+import re
+from sqlalchemy import func, extract, bindparam, or_, tuple_, event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+import click
 import jwt
-from functools import wraps
+import numpy as np
+from functools import partial, wraps
+from geo import calcular_distancia, matriz_distancias, IndiceEspacial
+from atribuicao import atribuir_em_lote
+from tempos_viagem import TemposViagem, construir_de_csv
+from localizacao import BufferLocalizacoes
+from historico_localizacoes import HistoricoLocalizacoes
+from cache import CacheTTL, AUSENTE
+from metricas import RegistoMetricas, LIMITES_SQL
+from respostas import ProvedorJSON, formatar_data, colunas, codificacao_aceite, comprimir
+from collections import namedtuple
 
 # --- CONFIGURAÇÃO INICIAL ---
+# A app é criada por criar_app(); as rotas ficam no blueprint `bp` e o estado em memória de
+# cada app (índice, caches, buffer de localizações, métricas) em app.extensions['upline'].
+# O import não cria nenhuma app nem abre ligações à base de dados: o esquema e os dados
+# iniciais preparam-se uma vez por deploy com 'flask --app app:criar_app esquema inicializar'.
 basedir = os.path.abspath(os.path.dirname(__file__))
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'sua-chave-secreta-super-segura')
-CORS(app, resources={r"/*": {"origins": "*"}})
+bp = Blueprint('upline', __name__)
 
 # --- CONFIGURAÇÃO DA BASE DE DADOS ---
-database_url = os.environ.get('DATABASE_URL')
-if database_url:
+def url_base_dados():
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        return 'sqlite:///' + os.path.join(basedir, 'upline.db')
     if database_url.startswith("postgres://"):
         database_url = database_url.replace("postgres://", "postgresql://", 1)
-    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'upline.db')
+    return database_url
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+# Perfil do engine: BD_PERFIL=padrao deixa os valores do SQLAlchemy (útil para comparar).
+# SQLite: WAL deixa os leitores trabalhar durante uma escrita e o busy timeout faz os
+# escritores de vários workers esperarem pela vez em vez de falharem com "database is locked".
+# PostgreSQL: o total de ligações é WEB_CONCURRENCY * (BD_POOL_TAMANHO + BD_POOL_EXTRA) e tem
+# de caber em max_connections.
+BD_PERFIL = os.environ.get('BD_PERFIL', 'producao')
+SQLITE_WAL = os.environ.get('SQLITE_WAL', '1').lower() in ('1', 'true', 'sim')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+SQLITE_ESPERA_MS = int(os.environ.get('SQLITE_ESPERA_MS', 15000))
+SQLITE_CACHE_KB = int(os.environ.get('SQLITE_CACHE_KB', 65536))
+
+def opcoes_engine(url):
+    if BD_PERFIL == 'padrao':
+        return {}
+    if url.startswith('sqlite'):
+        # O timeout do driver é o busy timeout do SQLite (em segundos).
+        return {'connect_args': {'timeout': SQLITE_ESPERA_MS / 1000}}
+    return {'pool_size': int(os.environ.get('BD_POOL_TAMANHO', 10)), 'max_overflow': int(os.environ.get('BD_POOL_EXTRA', 20)),
+            'pool_timeout': float(os.environ.get('BD_POOL_ESPERA', 10)), 'pool_recycle': int(os.environ.get('BD_POOL_RECICLAR', 1800)),
+            'pool_pre_ping': os.environ.get('BD_POOL_PRE_PING', '1').lower() in ('1', 'true', 'sim')}
+
+def configurar_ligacao_sqlite(ligacao_dbapi, registo_ligacao):
+    cursor = ligacao_dbapi.cursor()
+    if SQLITE_WAL:
+        cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_ESPERA_MS}')
+    cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KB}')
+    cursor.close()
+
+def configurar_engine(engine):
+    if BD_PERFIL != 'padrao' and engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', configurar_ligacao_sqlite):
+        event.listen(engine, 'connect', configurar_ligacao_sqlite)
+
+db = SQLAlchemy()
 
 # --- MODELOS DO BANCO DE DADOS (ESTRUTURA) ---
 class Cliente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
     possui_contrato = db.Column(db.Boolean, default=True)
-    elevadores = db.relationship('Elevador', backref='cliente', lazy=True, cascade="all, delete-orphan")
+    versao = db.Column(db.Integer, nullable=True)
+    # Preenchido quando o admin apaga o cliente: fica escondido até a purga o apagar de vez.
+    removido_em = db.Column(db.DateTime, nullable=True)
+    # Clientes e elevadores só saem pela purga em lotes (Core); passive_deletes='all' impede o ORM
+    # de carregar ou alterar os filhos se alguém fizer session.delete().
+    elevadores = db.relationship('Elevador', backref='cliente', lazy=True, passive_deletes='all')
 
 class Elevador(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -45,7 +108,10 @@ class Elevador(db.Model):
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
     cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), nullable=False)
-    chamados = db.relationship('Chamado', backref='elevador', lazy=True, cascade="all, delete-orphan")
+    versao = db.Column(db.Integer, nullable=True)
+    removido_em = db.Column(db.DateTime, nullable=True)
+    chamados = db.relationship('Chamado', backref='elevador', lazy=True, passive_deletes='all')
+    __table_args__ = (db.Index('ix_elevador_cliente_id', 'cliente_id'),)
 
 class Tecnico(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -55,11 +121,17 @@ class Tecnico(db.Model):
     de_plantao = db.Column(db.Boolean, default=False)
     last_latitude = db.Column(db.Float, nullable=True)
     last_longitude = db.Column(db.Float, nullable=True)
+    localizacao_atualizada_em = db.Column(db.DateTime, nullable=True)
+    versao = db.Column(db.Integer, nullable=True)
+    # Incrementada a cada reserva feita pelo despacho automático (controlo otimista da carga).
+    revisao_despacho = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     chamados = db.relationship('Chamado', backref='tecnico', lazy=True)
+    __table_args__ = (db.Index('ix_tecnico_de_plantao', 'de_plantao'),)
 
 class Chamado(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, server_default=db.func.now())
+    # O default em Python mantém o mesmo formato de data em todas as linhas do SQLite (a paginação compara timestamps).
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow, server_default=db.func.now())
     descricao_problema = db.Column(db.String(500), nullable=False)
     pessoa_presa = db.Column(db.Boolean, default=False)
     status = db.Column(db.String(50), default='aberto')
@@ -69,23 +141,919 @@ class Chamado(db.Model):
     pecas_trocadas = db.Column(db.Text, nullable=True)
     observacao_texto = db.Column(db.Text, nullable=True)
     data_finalizacao = db.Column(db.DateTime, nullable=True)
+    # Versão da linha: um UPDATE feito a partir de uma leitura desatualizada falha com StaleDataError.
+    revisao = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Um índice por padrão de acesso: histórico do técnico, histórico do elevador,
+    # fila por status e listagem/paginação do admin por (timestamp, id).
+    __table_args__ = (
+        db.Index('ix_chamado_tecnico_timestamp', 'tecnico_id', 'timestamp'),
+        db.Index('ix_chamado_elevador_timestamp', 'elevador_id', 'timestamp'),
+        db.Index('ix_chamado_status_timestamp', 'status', 'timestamp'),
+        db.Index('ix_chamado_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_chamado_tecnico_status', 'tecnico_id', 'status'),
+    )
+    __mapper_args__ = {'version_id_col': revisao}
+
+class ChamadoArquivo(db.Model):
+    # Chamados finalizados há mais de ARQUIVO_DIAS, movidos por arquivar_chamados. As mesmas
+    # colunas (e ids) de Chamado, sem chaves estrangeiras: apagar um técnico não reescreve o arquivo.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    timestamp = db.Column(db.DateTime)
+    descricao_problema = db.Column(db.String(500), nullable=False)
+    pessoa_presa = db.Column(db.Boolean, default=False)
+    status = db.Column(db.String(50))
+    elevador_id = db.Column(db.Integer, nullable=False)
+    tecnico_id = db.Column(db.Integer, nullable=True)
+    servicos_realizados = db.Column(db.Text, nullable=True)
+    pecas_trocadas = db.Column(db.Text, nullable=True)
+    observacao_texto = db.Column(db.Text, nullable=True)
+    data_finalizacao = db.Column(db.DateTime, nullable=True)
+    revisao = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    arquivado_em = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (
+        db.Index('ix_chamado_arquivo_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_chamado_arquivo_tecnico_timestamp', 'tecnico_id', 'timestamp'),
+        db.Index('ix_chamado_arquivo_elevador_timestamp', 'elevador_id', 'timestamp'),
+    )
+
+class UltimaAbertura(db.Model):
+    # Último chamado aberto por /chamado/abrir em cada elevador: a deduplicação lê esta linha pela
+    # chave primária, e bloqueá-la serializa as aberturas concorrentes do mesmo elevador.
+    elevador_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    chamado_id = db.Column(db.Integer, nullable=True)
+    aberto_em = db.Column(db.DateTime, nullable=False)
+
+class ChaveIdempotencia(db.Model):
+    # Idempotency-Key de /chamado/abrir -> chamado da primeira resposta; uma repetição devolve o mesmo.
+    chave = db.Column(db.String(100), primary_key=True)
+    chamado_id = db.Column(db.Integer, nullable=False)
+    criou = db.Column(db.Boolean, nullable=False, default=False)
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    __table_args__ = (db.Index('ix_chave_idempotencia_criado_em', 'criado_em'),)
 
 class Admin(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
 
+class ResumoChamado(db.Model):
+    # Contadores pré-agregados do dashboard: nº de chamados abertos em `dia` que estão
+    # agora em `status`. tecnico_id = 0 representa "sem técnico" (NULL quebraria a unicidade).
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    tecnico_id = db.Column(db.Integer, nullable=False, default=0)
+    elevador_id = db.Column(db.Integer, nullable=False)
+    cliente_id = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (db.UniqueConstraint('dia', 'status', 'tecnico_id', 'elevador_id', 'cliente_id', name='uq_resumo_chamado_chave'),)
+
+class EventoChamado(db.Model):
+    # Registo das alterações de chamados que interessam a cada técnico; o id serve de
+    # cursor para o stream SSE e para a consulta de alterações (ver EVENTOS_ATRASO).
+    id = db.Column(db.Integer, primary_key=True)
+    tecnico_id = db.Column(db.Integer, nullable=False)
+    chamado_id = db.Column(db.Integer, nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    __table_args__ = (db.Index('ix_evento_chamado_tecnico_id', 'tecnico_id', 'id'), db.Index('ix_evento_chamado_chamado_id', 'chamado_id'))
+
+class RejeicaoChamado(db.Model):
+    # Técnicos que rejeitaram um chamado ainda aberto: o despacho não lhos volta a dar. Fica
+    # fora de evento_chamado, que é podado, e sai quando o chamado é finalizado.
+    chamado_id = db.Column(db.Integer, primary_key=True)
+    tecnico_id = db.Column(db.Integer, primary_key=True)
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+class VersaoTabela(db.Model):
+    # Contador incrementado em cada escrita numa tabela de catálogo; permite a todos
+    # os workers saberem que as suas caches dessa tabela ficaram desatualizadas.
+    nome = db.Column(db.String(50), primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+
+class RemocaoCatalogo(db.Model):
+    # Registos apagados das tabelas de catálogo, para o ?since_version= das listagens.
+    id = db.Column(db.Integer, primary_key=True)
+    tabela = db.Column(db.String(50), nullable=False)
+    registo_id = db.Column(db.Integer, nullable=False)
+    versao = db.Column(db.Integer, nullable=False)
+    __table_args__ = (db.Index('ix_remocao_catalogo_tabela_versao', 'tabela', 'versao'),)
+
+class Purga(db.Model):
+    # Remoção de um cliente (com os seus elevadores) ou de um elevador: os chamados saem por
+    # lotes, fora do pedido quando são muitos, e o progresso fica aqui (GET /admin/purga/<id>).
+    id = db.Column(db.Integer, primary_key=True)
+    cliente_id = db.Column(db.Integer, nullable=True)
+    elevador_id = db.Column(db.Integer, nullable=True)
+    estado = db.Column(db.String(20), nullable=False, default='pendente')
+    chamados_total = db.Column(db.Integer, nullable=False, default=0)
+    chamados_apagados = db.Column(db.Integer, nullable=False, default=0)
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    concluido_em = db.Column(db.DateTime, nullable=True)
+    erro = db.Column(db.Text, nullable=True)
+    __table_args__ = (db.Index('ix_purga_estado', 'estado'),)
+
+# --- RESUMOS DO DASHBOARD ---
+# Os contadores são atualizados no mesmo flush/transação que grava o chamado, para
+# qualquer rota que abra, atribua, rejeite, finalize ou apague chamados pelo ORM.
+# Em after_flush os ids já existem e o histórico dos atributos ainda tem os valores antigos.
+def _valor_anterior(estado, atributo):
+    historico = estado.attrs[atributo].history
+    if historico.deleted:
+        return historico.deleted[0]
+    return getattr(estado.object, atributo)
+
+def _chave_resumo(timestamp, status, tecnico_id, elevador_id):
+    return (timestamp.date(), status or 'aberto', tecnico_id or 0, elevador_id)
+
+@event.listens_for(db.session, 'after_flush')
+def atualizar_resumos_chamados(session, flush_context):
+    deltas = {}
+    def somar(chave, valor):
+        deltas[chave] = deltas.get(chave, 0) + valor
+
+    for obj in session.new:
+        if isinstance(obj, Chamado):
+            somar(_chave_resumo(obj.timestamp, obj.status, obj.tecnico_id, obj.elevador_id), 1)
+    for obj in session.dirty:
+        if isinstance(obj, Chamado) and session.is_modified(obj, include_collections=False):
+            estado = inspect(obj)
+            antes = _chave_resumo(*[_valor_anterior(estado, a) for a in ('timestamp', 'status', 'tecnico_id', 'elevador_id')])
+            depois = _chave_resumo(obj.timestamp, obj.status, obj.tecnico_id, obj.elevador_id)
+            if antes != depois:
+                somar(antes, -1)
+                somar(depois, 1)
+    for obj in session.deleted:
+        if isinstance(obj, Chamado):
+            estado = inspect(obj)
+            somar(_chave_resumo(*[_valor_anterior(estado, a) for a in ('timestamp', 'status', 'tecnico_id', 'elevador_id')]), -1)
+
+    deltas = {chave: valor for chave, valor in deltas.items() if valor}
+    if deltas:
+        aplicar_deltas_resumo(session.connection(), deltas)
+
+def aplicar_deltas_resumo(conexao, deltas, clientes=None):
+    """Soma cada delta {(dia, status, tecnico_id, elevador_id): n} ao contador correspondente."""
+    clientes = dict(clientes or {})
+    elevador_ids = {chave[3] for chave in deltas if chave[3] is not None} - clientes.keys()
+    if elevador_ids:
+        clientes.update(conexao.execute(db.select(Elevador.id, Elevador.cliente_id).where(Elevador.id.in_(elevador_ids))).all())
+    tabela = ResumoChamado.__table__
+    dialeto = conexao.dialect.name
+    linhas = [{'dia': dia, 'status': status, 'tecnico_id': tecnico_id, 'elevador_id': elevador_id, 'cliente_id': clientes.get(elevador_id, 0), 'total': valor}
+              for (dia, status, tecnico_id, elevador_id), valor in deltas.items()]
+    if dialeto in ('postgresql', 'sqlite'):
+        # Um único upsert executado em lote (executemany) para todas as chaves.
+        insert = (postgresql if dialeto == 'postgresql' else sqlite).insert(tabela)
+        conexao.execute(insert.on_conflict_do_update(index_elements=['dia', 'status', 'tecnico_id', 'elevador_id', 'cliente_id'], set_={'total': tabela.c.total + insert.excluded.total}), linhas)
+        return
+    for valores in linhas:
+        chave = [tabela.c[coluna] == valores[coluna] for coluna in ('dia', 'status', 'tecnico_id', 'elevador_id', 'cliente_id')]
+        atualizado = conexao.execute(tabela.update().where(*chave).values(total=tabela.c.total + valores['total']))
+        if not atualizado.rowcount:
+            conexao.execute(tabela.insert().values(**valores))
+
+def mover_resumos_elevador(elevador_id, cliente_id):
+    """Passa os contadores do elevador para o cliente `cliente_id` (ao mudar de cliente), na transação atual."""
+    tabela = ResumoChamado.__table__
+    linhas = db.session.execute(tabela.delete().where(tabela.c.elevador_id == elevador_id, tabela.c.cliente_id != cliente_id)
+                                .returning(tabela.c.dia, tabela.c.status, tabela.c.tecnico_id, tabela.c.total)).all()
+    deltas = {}
+    for dia, status, tecnico_id, total in linhas:
+        deltas[(dia, status, tecnico_id, elevador_id)] = deltas.get((dia, status, tecnico_id, elevador_id), 0) + total
+    deltas = {chave: valor for chave, valor in deltas.items() if valor}
+    if deltas:
+        aplicar_deltas_resumo(db.session.connection(), deltas, {elevador_id: cliente_id})
+
+def _agregado_resumos():
+    # Os chamados arquivados continuam a contar no dashboard: agrega-se a tabela quente e o arquivo.
+    todos = db.union_all(*[db.select(t.c.timestamp, t.c.status, t.c.tecnico_id, t.c.elevador_id) for t in (Chamado.__table__, ChamadoArquivo.__table__)]).subquery()
+    dia, tecnico_id = func.date(todos.c.timestamp), func.coalesce(todos.c.tecnico_id, 0)
+    return db.select(dia, todos.c.status, tecnico_id, todos.c.elevador_id, Elevador.cliente_id, func.count()).join(Elevador, todos.c.elevador_id == Elevador.id).group_by(dia, todos.c.status, tecnico_id, todos.c.elevador_id, Elevador.cliente_id)
+
+def reconstruir_resumos():
+    tabela = ResumoChamado.__table__
+    db.session.execute(tabela.delete())
+    db.session.execute(tabela.insert().from_select(['dia', 'status', 'tecnico_id', 'elevador_id', 'cliente_id', 'total'], _agregado_resumos()))
+    db.session.commit()
+    return db.session.query(func.count(ResumoChamado.id)).scalar()
+
+def verificar_resumos():
+    """Compara os contadores com a agregação direta sobre Chamado e o arquivo; devolve as chaves divergentes."""
+    vivos = db.session.execute(_agregado_resumos()).all()
+    vivos = {(str(dia), status, tecnico_id, elevador_id, cliente_id): total for dia, status, tecnico_id, elevador_id, cliente_id, total in vivos}
+    resumos = db.session.query(ResumoChamado.dia, ResumoChamado.status, ResumoChamado.tecnico_id, ResumoChamado.elevador_id, ResumoChamado.cliente_id, ResumoChamado.total).filter(ResumoChamado.total != 0).all()
+    resumos = {(str(dia), status, tecnico_id, elevador_id, cliente_id): total for dia, status, tecnico_id, elevador_id, cliente_id, total in resumos}
+    return {chave: (vivos.get(chave, 0), resumos.get(chave, 0)) for chave in vivos.keys() | resumos.keys() if vivos.get(chave, 0) != resumos.get(chave, 0)}
+
+# --- EVENTOS PARA OS TÉCNICOS ---
+# Cada atribuição, reatribuição, rejeição ou alteração de um chamado gera eventos na
+# mesma transação. Depois do commit, os streams deste worker são acordados de imediato;
+# os de outros workers veem o evento na sua próxima verificação (EVENTOS_INTERVALO).
+# No PostgreSQL os ids da sequência não chegam por ordem de commit: um evento com id abaixo
+# do cursor pode ficar visível depois. Cada consulta volta a ler os eventos do técnico dos
+# últimos EVENTOS_ATRASO segundos; a lista do técnico aplica os chamados por id, por isso
+# repetir um chamado não tem efeito, e o stream não repete os eventos que já enviou.
+# Os eventos com mais de EVENTOS_RETENCAO_DIAS são apagados com o arquivo (podar_eventos);
+# um cursor anterior ao evento mais antigo que resta recebe a lista completa.
+EVENTOS_RETENCAO_DIAS = float(os.environ.get('EVENTOS_RETENCAO_DIAS', 7))
+EVENTOS_ATRASO = float(os.environ.get('EVENTOS_ATRASO', 30))
+
+@event.listens_for(db.session, 'after_flush')
+def registar_eventos_chamados(session, flush_context):
+    eventos, rejeicoes = [], []
+    for obj in session.new:
+        if isinstance(obj, Chamado) and obj.tecnico_id:
+            eventos.append({'tecnico_id': obj.tecnico_id, 'chamado_id': obj.id, 'tipo': 'atribuido'})
+    for obj in session.dirty:
+        if isinstance(obj, Chamado) and session.is_modified(obj, include_collections=False):
+            anterior = _valor_anterior(inspect(obj), 'tecnico_id')
+            if anterior != obj.tecnico_id:
+                if anterior:
+                    eventos.append({'tecnico_id': anterior, 'chamado_id': obj.id, 'tipo': 'reatribuido' if obj.tecnico_id else 'rejeitado'})
+                    if not obj.tecnico_id:
+                        rejeicoes.append({'chamado_id': obj.id, 'tecnico_id': anterior})
+                if obj.tecnico_id:
+                    eventos.append({'tecnico_id': obj.tecnico_id, 'chamado_id': obj.id, 'tipo': 'atribuido'})
+            elif obj.tecnico_id:
+                eventos.append({'tecnico_id': obj.tecnico_id, 'chamado_id': obj.id, 'tipo': 'atualizado'})
+    for obj in session.deleted:
+        if isinstance(obj, Chamado):
+            anterior = _valor_anterior(inspect(obj), 'tecnico_id')
+            if anterior:
+                eventos.append({'tecnico_id': anterior, 'chamado_id': obj.id, 'tipo': 'removido'})
+    if eventos:
+        agora = datetime.datetime.utcnow()
+        session.connection().execute(EventoChamado.__table__.insert(), [dict(e, criado_em=agora) for e in eventos])
+        session.info['eventos_pendentes'] = True
+    if rejeicoes:
+        registar_rejeicoes(session.connection(), rejeicoes)
+
+def registar_rejeicoes(conexao, rejeicoes):
+    """Grava [{chamado_id, tecnico_id}]; uma segunda rejeição do mesmo técnico não muda nada."""
+    tabela = RejeicaoChamado.__table__
+    agora = datetime.datetime.utcnow()
+    linhas = [dict(r, criado_em=agora) for r in rejeicoes]
+    dialeto = conexao.dialect.name
+    if dialeto in ('postgresql', 'sqlite'):
+        conexao.execute((postgresql if dialeto == 'postgresql' else sqlite).insert(tabela).on_conflict_do_nothing(index_elements=['chamado_id', 'tecnico_id']), linhas)
+        return
+    for linha in linhas:
+        if not conexao.execute(db.select(tabela.c.chamado_id).where(tabela.c.chamado_id == linha['chamado_id'], tabela.c.tecnico_id == linha['tecnico_id'])).first():
+            conexao.execute(tabela.insert().values(**linha))
+
+def podar_eventos(dias=EVENTOS_RETENCAO_DIAS, lote=2000, pausa=0):
+    """Apaga os eventos com mais de `dias` dias (menos o mais recente, que guarda a sequência de ids
+    no SQLite) e as rejeições de chamados já fechados; devolve (eventos, rejeições) apagados."""
+    tabela = EventoChamado.__table__
+    limite = datetime.datetime.utcnow() - datetime.timedelta(days=dias)
+    ultimo = db.session.query(func.max(EventoChamado.id)).scalar() or 0
+    eventos = 0
+    while True:
+        selecao = db.select(tabela.c.id).where(tabela.c.criado_em < limite, tabela.c.id < ultimo).limit(lote)
+        apagados = db.session.execute(tabela.delete().where(tabela.c.id.in_(selecao))).rowcount
+        db.session.commit()
+        eventos += apagados
+        if apagados < lote:
+            break
+        if pausa:
+            time.sleep(pausa)
+    rejeicoes = RejeicaoChamado.__table__
+    abertos = db.select(Chamado.id).where(Chamado.status.in_(ESTADOS_ABERTOS))
+    apagadas = db.session.execute(rejeicoes.delete().where(rejeicoes.c.chamado_id.notin_(abertos))).rowcount
+    db.session.commit()
+    return eventos, apagadas
+
+@event.listens_for(db.session, 'after_commit')
+def avisar_eventos_chamados(session):
+    if session.info.pop('eventos_pendentes', False):
+        aviso = estado_app().aviso_eventos
+        with aviso:
+            aviso.notify_all()
+
+@event.listens_for(db.session, 'after_rollback')
+def descartar_aviso_eventos(session):
+    session.info.pop('eventos_pendentes', None)
+
 # --- FUNÇÕES AUXILIARES ---
-def calcular_distancia(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    lat1_rad, lon1_rad, lat2_rad, lon2_rad = map(radians, [lat1, lon1, lat2, lon2])
-    dlon = lon2_rad - lon1_rad
-    dlat = lat2_rad - lat1_rad
-    a = sin(dlat / 2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
+# Índice em memória dos técnicos de plantão com posição conhecida. As rotas que alteram
+# plantão/posição atualizam-no diretamente; a recarga periódica a partir da base de dados
+# apanha as alterações feitas por outros workers.
+INDICE_TECNICOS_CELULA = float(os.environ.get('INDICE_TECNICOS_CELULA', 0.02))
+INDICE_TECNICOS_TTL = float(os.environ.get('INDICE_TECNICOS_TTL', 60))
+
+def obter_indice_tecnicos():
+    indice = estado_app().indice_tecnicos
+    if indice.expirado(INDICE_TECNICOS_TTL):
+        posicoes = db.session.query(Tecnico.id, Tecnico.last_latitude, Tecnico.last_longitude).filter(Tecnico.de_plantao.is_(True), Tecnico.last_latitude.isnot(None), Tecnico.last_longitude.isnot(None)).all()
+        indice.carregar(posicoes)
+    return indice
+
+def sincronizar_tecnico_no_indice(tecnico):
+    indice = estado_app().indice_tecnicos
+    if tecnico.de_plantao and tecnico.last_latitude is not None and tecnico.last_longitude is not None:
+        indice.atualizar(tecnico.id, tecnico.last_latitude, tecnico.last_longitude)
+    else:
+        indice.remover(tecnico.id)
+
+# Tempos de viagem pré-calculados (grelhas geradas com 'flask tempos construir', separadas
+# por os.pathsep em TEMPOS_VIAGEM_FICHEIROS). O despacho compara técnicos em km equivalentes:
+# com ETA, os segundos de viagem à velocidade de referência TEMPOS_VELOCIDADE_KMH; fora das
+# grelhas, a distância em linha reta. Sem ficheiros o despacho fica como antes.
+TEMPOS_VIAGEM_FICHEIROS = [c for c in os.environ.get('TEMPOS_VIAGEM_FICHEIROS', '').split(os.pathsep) if c]
+TEMPOS_VELOCIDADE_KMH = float(os.environ.get('TEMPOS_VELOCIDADE_KMH', 25))
+
+def abrir_tempos_viagem(app):
+    try:
+        estado_app(app).tempos_viagem = TemposViagem.abrir(TEMPOS_VIAGEM_FICHEIROS)
+    except (OSError, ValueError) as e:
+        app.logger.error(f"Grelhas de tempos de viagem ignoradas, o despacho usa a distância em linha reta: {e}")
+
+def custo_viagem_km(lat1, lon1, lat2, lon2):
+    segundos = estado_app().tempos_viagem.segundos(lat1, lon1, lat2, lon2)
+    if segundos is None:
+        return calcular_distancia(lat1, lon1, lat2, lon2)
+    return segundos / 3600 * TEMPOS_VELOCIDADE_KMH
+
+def matriz_custos_viagem(lat_chamados, lon_chamados, lat_tecnicos, lon_tecnicos):
+    """Versão vetorial de custo_viagem_km: chamados x técnicos, do técnico até ao chamado."""
+    distancias = matriz_distancias(lat_chamados, lon_chamados, lat_tecnicos, lon_tecnicos)
+    return estado_app().tempos_viagem.sobrepor(distancias, lat_chamados, lon_chamados, lat_tecnicos, lon_tecnicos, fator=TEMPOS_VELOCIDADE_KMH / 3600)
+
+# --- DESPACHO DE CHAMADOS ---
+# Os chamados em 'aberto' são a fila de despacho: pessoa presa primeiro, depois por ordem
+# de abertura. Cada técnico tem no máximo DESPACHO_CARGA_MAXIMA chamados 'atribuido' e a
+# escolha soma à distância DESPACHO_PENALIDADE_KM por chamado já atribuído. Pedidos
+# concorrentes nunca reservam o mesmo lugar: a reserva só incrementa Tecnico.revisao_despacho
+# se ainda tiver o valor lido com a carga, e Chamado.revisao faz o mesmo para o chamado.
+# No PostgreSQL a fila é lida com FOR UPDATE SKIP LOCKED; o SQLite já serializa as escritas.
+# A atribuição manual do admin também incrementa a revisão (um despacho simultâneo perde a
+# reserva) e respeita a carga máxima, salvo com "forcar": true, que a ultrapassa de propósito.
+DESPACHO_CARGA_MAXIMA = int(os.environ.get('DESPACHO_CARGA_MAXIMA', 3))
+DESPACHO_PENALIDADE_KM = float(os.environ.get('DESPACHO_PENALIDADE_KM', 10))
+DESPACHO_CANDIDATOS = int(os.environ.get('DESPACHO_CANDIDATOS', 10))
+# Com ETA o mais rápido pode não estar entre os mais próximos em linha reta: a pré-seleção alarga-se.
+DESPACHO_CANDIDATOS_ETA = int(os.environ.get('DESPACHO_CANDIDATOS_ETA', 30))
+DESPACHO_LOTE = int(os.environ.get('DESPACHO_LOTE', 5))
+DESPACHO_TENTATIVAS = int(os.environ.get('DESPACHO_TENTATIVAS', 5))
+DESPACHO_REBALANCEAR_MAXIMO = int(os.environ.get('DESPACHO_REBALANCEAR_MAXIMO', 20000))
+
+def pontuacao_despacho(custo_km, carga):
+    return custo_km + DESPACHO_PENALIDADE_KM * carga
+
+def candidatos_despacho(latitude, longitude, excluir=()):
+    """Técnicos de plantão com lugar livre, do melhor para o pior: [(pontuação, id, revisao_despacho)].
+
+    Só os DESPACHO_CANDIDATOS mais próximos (DESPACHO_CANDIDATOS_ETA com grelhas de tempos)
+    são pontuados; se estiverem todos cheios a procura alarga-se. Cada candidato é confirmado
+    na base de dados, porque o índice deste worker pode estar desatualizado.
+    """
+    indice = obter_indice_tecnicos()
+    k = DESPACHO_CANDIDATOS_ETA if estado_app().tempos_viagem else DESPACHO_CANDIDATOS
+    while True:
+        proximos = indice.mais_proximos(latitude, longitude, k=k, excluir=excluir)
+        if not proximos:
+            return []
+        ids = [tecnico_id for _, tecnico_id in proximos]
+        tecnicos = db.session.query(Tecnico.id, Tecnico.last_latitude, Tecnico.last_longitude, Tecnico.de_plantao, Tecnico.revisao_despacho).filter(Tecnico.id.in_(ids)).all()
+        cargas = dict(db.session.query(Chamado.tecnico_id, func.count(Chamado.id)).filter(Chamado.tecnico_id.in_(ids), Chamado.status == 'atribuido').group_by(Chamado.tecnico_id).all())
+        for tecnico_id in set(ids) - {t.id for t in tecnicos if t.de_plantao and t.last_latitude is not None and t.last_longitude is not None}:
+            indice.remover(tecnico_id)
+        candidatos = sorted(
+            (pontuacao_despacho(custo_viagem_km(t.last_latitude, t.last_longitude, latitude, longitude), cargas.get(t.id, 0)), t.id, t.revisao_despacho)
+            for t in tecnicos
+            if t.de_plantao and t.last_latitude is not None and t.last_longitude is not None and cargas.get(t.id, 0) < DESPACHO_CARGA_MAXIMA
+        )
+        if candidatos or len(proximos) < k:
+            return candidatos
+        k *= 4
+
+def reservar_tecnico(tecnico_id, revisao):
+    # Falha (0 linhas) se outro pedido atribuiu um chamado a este técnico depois da nossa leitura.
+    tabela = Tecnico.__table__
+    return db.session.execute(tabela.update().where(tabela.c.id == tecnico_id, tabela.c.revisao_despacho == revisao, tabela.c.de_plantao.is_(True)).values(revisao_despacho=revisao + 1)).rowcount == 1
+
+def despachar_fila(limite=DESPACHO_LOTE):
+    """Atribui até `limite` chamados da fila, por prioridade; devolve {chamado_id: tecnico_id}.
+
+    Para quando a fila esvazia, quando não há técnicos com lugar livre ou ao fim de
+    DESPACHO_TENTATIVAS conflitos com outros pedidos (o próximo despacho continua).
+    """
+    atribuidos, ignorados, conflitos = {}, set(), 0
+    while len(atribuidos) < limite and conflitos < DESPACHO_TENTATIVAS:
+        fila = db.select(Chamado.id, Elevador.latitude, Elevador.longitude).join(Elevador, Chamado.elevador_id == Elevador.id).where(Chamado.status == 'aberto')
+        if ignorados:
+            fila = fila.where(Chamado.id.notin_(ignorados))
+        try:
+            pendente = db.session.execute(fila.order_by(Chamado.pessoa_presa.desc(), Chamado.timestamp, Chamado.id).limit(1).with_for_update(of=Chamado, skip_locked=True)).first()
+            if pendente is None:
+                break
+            # Quem rejeitou o chamado não o volta a receber automaticamente.
+            rejeitaram = {t for t, in db.session.query(RejeicaoChamado.tecnico_id).filter(RejeicaoChamado.chamado_id == pendente.id)}
+            candidatos = candidatos_despacho(pendente.latitude, pendente.longitude, excluir=rejeitaram)
+            if not candidatos:
+                db.session.rollback()
+                if not rejeitaram:
+                    break
+                ignorados.add(pendente.id)
+                continue
+            tecnico_id = next((t for _, t, revisao in candidatos if reservar_tecnico(t, revisao)), None)
+            chamado = db.session.get(Chamado, pendente.id, populate_existing=True) if tecnico_id else None
+            if chamado is None or chamado.status != 'aberto':
+                raise StaleDataError(f"Chamado {pendente.id} ou os seus candidatos foram alterados por outro pedido.")
+            chamado.tecnico_id = tecnico_id
+            chamado.status = 'atribuido'
+            db.session.commit()
+            atribuidos[pendente.id] = tecnico_id
+        except (StaleDataError, OperationalError):
+            # Conflito com outro despacho (ou bloqueio/deadlock na base de dados): volta a ler a fila.
+            db.session.rollback()
+            conflitos += 1
+    return atribuidos
+
+def rebalancear_fila(limite=DESPACHO_REBALANCEAR_MAXIMO):
+    """Atribui de uma vez a fila inteira (até `limite` chamados) aos técnicos com lugar livre.
+
+    A matriz chamado x técnico é calculada com NumPy e resolvida em lote por atribuir_em_lote,
+    com a mesma pontuação de despachar_fila e pessoa presa primeiro. As atribuições são
+    gravadas numa só transação; se outro pedido alterar um dos chamados ou técnicos entretanto,
+    tudo é desfeito e recalculado (até DESPACHO_TENTATIVAS vezes). Devolve um resumo.
+    """
+    for _ in range(DESPACHO_TENTATIVAS):
+        try:
+            return _rebalancear_fila(limite)
+        except (StaleDataError, OperationalError):
+            db.session.rollback()
+    raise StaleDataError("A fila de despacho foi alterada por outros pedidos durante o rebalanceamento.")
+
+def _rebalancear_fila(limite):
+    inicio = time.perf_counter()
+    fila = db.session.execute(
+        db.select(Chamado.id, Chamado.revisao, Chamado.timestamp, Chamado.elevador_id, Chamado.pessoa_presa, Elevador.latitude, Elevador.longitude)
+        .join(Elevador, Chamado.elevador_id == Elevador.id).where(Chamado.status == 'aberto')
+        .order_by(Chamado.pessoa_presa.desc(), Chamado.timestamp, Chamado.id).limit(limite).with_for_update(of=Chamado, skip_locked=True)).all()
+    tecnicos = db.session.execute(db.select(Tecnico.id, Tecnico.revisao_despacho, Tecnico.last_latitude, Tecnico.last_longitude).where(Tecnico.de_plantao.is_(True), Tecnico.last_latitude.isnot(None), Tecnico.last_longitude.isnot(None))).all()
+    resumo = {'abertos': len(fila), 'tecnicos': len(tecnicos), 'atribuidos': 0, 'pessoa_presa_atribuidos': 0, 'custo_total_km': 0.0}
+    if fila and tecnicos:
+        cargas = dict(db.session.query(Chamado.tecnico_id, func.count(Chamado.id)).filter(Chamado.status == 'atribuido', Chamado.tecnico_id.isnot(None)).group_by(Chamado.tecnico_id).all())
+        inicio_calculo = time.perf_counter()
+        custos = matriz_custos_viagem([c.latitude for c in fila], [c.longitude for c in fila], [t.last_latitude for t in tecnicos], [t.last_longitude for t in tecnicos])
+        # Quem rejeitou o chamado não o volta a receber automaticamente.
+        linha_chamado, coluna_tecnico = {c.id: i for i, c in enumerate(fila)}, {t.id: j for j, t in enumerate(tecnicos)}
+        rejeicoes = db.session.query(RejeicaoChamado.chamado_id, RejeicaoChamado.tecnico_id).join(Chamado, Chamado.id == RejeicaoChamado.chamado_id).filter(Chamado.status == 'aberto').all()
+        for chamado_id, tecnico_id in rejeicoes:
+            if chamado_id in linha_chamado and tecnico_id in coluna_tecnico:
+                custos[linha_chamado[chamado_id], coluna_tecnico[tecnico_id]] = np.inf
+        escolhas, _ = atribuir_em_lote(custos, [cargas.get(t.id, 0) for t in tecnicos], DESPACHO_CARGA_MAXIMA, DESPACHO_PENALIDADE_KM, prioridades=[bool(c.pessoa_presa) for c in fila])
+        resumo['segundos_calculo'] = round(time.perf_counter() - inicio_calculo, 3)
+        linhas = np.flatnonzero(escolhas >= 0)
+        atribuicoes = [(fila[i], tecnicos[escolhas[i]]) for i in linhas.tolist()]
+        if atribuicoes:
+            gravar_atribuicoes_em_lote(atribuicoes)
+            resumo.update(atribuidos=len(atribuicoes), pessoa_presa_atribuidos=sum(1 for c, _ in atribuicoes if c.pessoa_presa),
+                          custo_total_km=round(float(custos[linhas, escolhas[linhas]].sum()), 1))
+    db.session.commit()
+    resumo['segundos_total'] = round(time.perf_counter() - inicio, 3)
+    return resumo
+
+def gravar_atribuicoes_em_lote(atribuicoes):
+    """Grava [(chamado, tecnico)] lidos na mesma transação com UPDATEs em lote pelo Core.
+
+    O Core não passa pelos eventos do ORM: revisao, resumos do dashboard e eventos para os
+    técnicos são tratados aqui. Lança StaleDataError se algum chamado ou técnico mudou.
+    """
+    conexao = db.session.connection()
+    chamados, tabela_tecnico = Chamado.__table__, Tecnico.__table__
+    resultado = conexao.execute(
+        chamados.update().where(chamados.c.id == bindparam('b_id'), chamados.c.revisao == bindparam('b_revisao'), chamados.c.status == 'aberto')
+        .values(tecnico_id=bindparam('b_tecnico'), status='atribuido', revisao=chamados.c.revisao + 1),
+        [{'b_id': c.id, 'b_revisao': c.revisao, 'b_tecnico': t.id} for c, t in atribuicoes])
+    if resultado.rowcount != len(atribuicoes) and conexao.dialect.supports_sane_multi_rowcount:
+        raise StaleDataError(f"{len(atribuicoes) - resultado.rowcount} chamados foram alterados por outro pedido.")
+    revisoes = {t.id: t.revisao_despacho for _, t in atribuicoes}
+    resultado = conexao.execute(
+        tabela_tecnico.update().where(tabela_tecnico.c.id == bindparam('b_id'), tabela_tecnico.c.revisao_despacho == bindparam('b_revisao'), tabela_tecnico.c.de_plantao.is_(True))
+        .values(revisao_despacho=bindparam('b_revisao') + 1),
+        [{'b_id': tecnico_id, 'b_revisao': revisao} for tecnico_id, revisao in revisoes.items()])
+    if resultado.rowcount != len(revisoes) and conexao.dialect.supports_sane_multi_rowcount:
+        raise StaleDataError(f"{len(revisoes) - resultado.rowcount} técnicos receberam chamados de outro pedido.")
+    deltas = {}
+    for c, t in atribuicoes:
+        for chave, valor in ((_chave_resumo(c.timestamp, 'aberto', None, c.elevador_id), -1), (_chave_resumo(c.timestamp, 'atribuido', t.id, c.elevador_id), 1)):
+            deltas[chave] = deltas.get(chave, 0) + valor
+    aplicar_deltas_resumo(conexao, {chave: valor for chave, valor in deltas.items() if valor})
+    agora = datetime.datetime.utcnow()
+    conexao.execute(EventoChamado.__table__.insert(), [{'tecnico_id': t.id, 'chamado_id': c.id, 'tipo': 'atribuido', 'criado_em': agora} for c, t in atribuicoes])
+    db.session.info['eventos_pendentes'] = True
+
+# Versões das tabelas de catálogo. Cada worker relê a versão da base de dados no máximo
+# a cada CATALOGO_VERSAO_INTERVALO segundos; as escritas feitas no próprio worker forçam a releitura.
+CATALOGO_VERSAO_INTERVALO = float(os.environ.get('CATALOGO_VERSAO_INTERVALO', 2))
+TABELAS_CATALOGO = ('cliente', 'elevador', 'tecnico')
+
+def versao_tabela(nome, max_idade=None):
+    versoes_conhecidas = estado_app().versoes_conhecidas
+    conhecida = versoes_conhecidas.get(nome)
+    agora = time.monotonic()
+    if conhecida is None or agora - conhecida[1] > (CATALOGO_VERSAO_INTERVALO if max_idade is None else max_idade):
+        versao = db.session.execute(db.select(VersaoTabela.versao).where(VersaoTabela.nome == nome)).scalar() or 0
+        conhecida = versoes_conhecidas[nome] = (versao, agora)
+    return conhecida[0]
+
+def incrementar_versao_tabela(nome):
+    # Corre na transação da escrita: a nova versão só fica visível com o commit.
+    tabela = VersaoTabela.__table__
+    if not db.session.execute(tabela.update().where(tabela.c.nome == nome).values(versao=tabela.c.versao + 1)).rowcount:
+        db.session.execute(tabela.insert().values(nome=nome, versao=1))
+    estado_app().versoes_conhecidas.pop(nome, None)
+    return db.session.execute(db.select(tabela.c.versao).where(tabela.c.nome == nome)).scalar()
+
+def registar_alteracao_catalogo(nome, alterados=(), removidos=()):
+    """Incrementa a versão da tabela e marca com ela os registos alterados e os ids apagados."""
+    versao = incrementar_versao_tabela(nome)
+    for obj in alterados:
+        obj.versao = versao
+    for registo_id in removidos:
+        db.session.add(RemocaoCatalogo(tabela=nome, registo_id=registo_id, versao=versao))
+    return versao
+
+def resposta_catalogo(nome, modelo, consulta, serializar):
+    """Listagem com ETag forte (If-None-Match -> 304) e delta opcional ?since_version=N."""
+    versao = versao_tabela(nome, max_idade=0)
+    desde = request.args.get('since_version', type=int)
+    etag = f"{nome}-{versao}" if desde is None else f"{nome}-{desde}-{versao}"
+    if request.if_none_match.contains_weak(etag):
+        resposta = Response(status=304)
+    elif desde is None:
+        resposta = jsonify(formatar_lista([serializar(r) for r in consulta.all()]))
+    else:
+        # since_version=0 é a carga inicial: inclui as linhas anteriores ao controlo de versões (versao NULL).
+        if desde <= 0:
+            itens, removidos = [serializar(r) for r in consulta.all()], []
+        elif desde < versao:
+            itens = [serializar(r) for r in consulta.filter(modelo.versao > desde).all()]
+            removidos = [i for i, in db.session.query(RemocaoCatalogo.registo_id).filter(RemocaoCatalogo.tabela == nome, RemocaoCatalogo.versao > desde)]
+        else:
+            itens, removidos = [], []
+        resposta = jsonify({'versao': versao, 'itens': formatar_lista(itens), 'removidos': removidos})
+    resposta.set_etag(etag)
+    # no-cache: o browser guarda a resposta mas revalida sempre com If-None-Match.
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+# Cache codigo_qr -> dados do elevador usados ao abrir chamados. Códigos desconhecidos
+# ficam em cache (como None) durante ELEVADOR_CACHE_TTL_NEGATIVO segundos.
+ElevadorResumo = namedtuple('ElevadorResumo', ['id', 'latitude', 'longitude', 'cliente_id'])
+ELEVADOR_CACHE_MAXIMO = int(os.environ.get('ELEVADOR_CACHE_MAXIMO', 20000))
+ELEVADOR_CACHE_TTL = float(os.environ.get('ELEVADOR_CACHE_TTL', 3600))
+ELEVADOR_CACHE_TTL_NEGATIVO = float(os.environ.get('ELEVADOR_CACHE_TTL_NEGATIVO', 30))
+
+def obter_elevador_por_qr(codigo_qr):
+    # A versão faz parte da chave: uma escrita em qualquer worker torna as entradas antigas inalcançáveis.
+    chave = (versao_tabela('elevador'), codigo_qr)
+    cache_elevadores = estado_app().cache_elevadores
+    elevador = cache_elevadores.obter(chave)
+    if elevador is AUSENTE:
+        linha = db.session.query(Elevador.id, Elevador.latitude, Elevador.longitude, Elevador.cliente_id).filter_by(codigo_qr=codigo_qr, removido_em=None).first()
+        elevador = ElevadorResumo(*linha) if linha else None
+        cache_elevadores.guardar(chave, elevador, ttl=None if elevador else ELEVADOR_CACHE_TTL_NEGATIVO)
+    return elevador
+
+def converter_ts(valor):
+    # Aceita epoch em segundos ou ISO 8601; devolve datetime UTC sem fuso, como o resto da base.
+    agora = datetime.datetime.utcnow()
+    if valor is None:
+        return agora
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        ts = datetime.datetime.fromtimestamp(valor, datetime.timezone.utc).replace(tzinfo=None)
+    else:
+        ts = datetime.datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+        if ts.tzinfo is not None:
+            ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    # Relógios adiantados no telemóvel não podem bloquear as amostras seguintes.
+    return min(ts, agora)
+
+def gravar_localizacoes(app, amostras):
+    tabela = Tecnico.__table__
+    stmt = tabela.update().where(tabela.c.id == bindparam('b_id')).where(or_(tabela.c.localizacao_atualizada_em.is_(None), tabela.c.localizacao_atualizada_em < bindparam('b_ts'))).values(last_latitude=bindparam('b_lat'), last_longitude=bindparam('b_lon'), localizacao_atualizada_em=bindparam('b_ts'))
+    with app.app_context():
+        try:
+            db.session.execute(stmt, [{'b_id': a['tecnico_id'], 'b_lat': a['latitude'], 'b_lon': a['longitude'], 'b_ts': a['ts']} for a in amostras])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Erro ao gravar localizações em lote: {e}")
+            raise
+        # Relê as posições gravadas, e não as amostras: as descartadas pelo UPDATE não chegam ao índice.
+        ids = [a['tecnico_id'] for a in amostras]
+        for tecnico in Tecnico.query.filter(Tecnico.id.in_(ids)).all():
+            sincronizar_tecnico_no_indice(tecnico)
+
+# Cada app tem o seu buffer (EstadoUpline), ligado a ela: o flush corre numa thread sem contexto.
+LOCALIZACAO_FLUSH_INTERVALO = float(os.environ.get('LOCALIZACAO_FLUSH_INTERVALO', 5))
+LOCALIZACAO_FLUSH_MAXIMO = int(os.environ.get('LOCALIZACAO_FLUSH_MAXIMO', 500))
+
+# Histórico de todas as amostras em ficheiros diários (historico_localizacoes.py), gravado no
+# flush do buffer e não no pedido. Os dias com mais de LOCALIZACAO_HISTORICO_DIAS_COMPLETOS
+# ficam com uma amostra por técnico a cada LOCALIZACAO_HISTORICO_INTERVALO segundos
+# ('flask localizacoes manter', num cron). LOCALIZACAO_HISTORICO_DIR vazio desliga o histórico.
+LOCALIZACAO_HISTORICO_DIR = os.environ.get('LOCALIZACAO_HISTORICO_DIR', os.path.join(basedir, 'historico_localizacoes'))
+LOCALIZACAO_HISTORICO_DIAS_COMPLETOS = int(os.environ.get('LOCALIZACAO_HISTORICO_DIAS_COMPLETOS', 7))
+LOCALIZACAO_HISTORICO_INTERVALO = int(os.environ.get('LOCALIZACAO_HISTORICO_INTERVALO', 60))
+LOCALIZACAO_HISTORICO_RETENCAO_DIAS = int(os.environ.get('LOCALIZACAO_HISTORICO_RETENCAO_DIAS', 365))
+
+def gravar_historico_localizacoes(app, amostras):
+    try:
+        estado_app(app).historico_localizacoes.acrescentar(amostras)
+    except (OSError, ValueError) as e:
+        app.logger.error(f"Histórico de localizações: {len(amostras)} amostras perdidas: {e}")
+
+def registar_localizacao(tecnico_id, latitude, longitude, ts):
+    # O índice espacial só muda no flush (gravar_localizacoes), com a posição que ficou gravada:
+    # uma amostra aceite aqui ainda pode ser descartada pelo UPDATE se outro worker gravou uma mais recente.
+    return estado_app().buffer_localizacoes.adicionar(tecnico_id, latitude, longitude, ts)
+
+def flush_localizacoes_ao_sair(app):
+    # Registada com atexit por criar_app, para cada app criada.
+    try:
+        estado_app(app).buffer_localizacoes.parar()
+    except Exception as e:
+        app.logger.error(f"Localizações pendentes perdidas ao encerrar: {e}")
+
+# --- ARQUIVO DE CHAMADOS FINALIZADOS ---
+# Os chamados finalizados há mais de ARQUIVO_DIAS passam para chamado_arquivo em lotes de
+# ARQUIVO_LOTE, um por transação: a fila, o despacho e a lista do técnico leem só a tabela
+# quente. O histórico e a exportação do admin juntam o arquivo quando o intervalo lá chega.
+# Corre com 'flask arquivo executar' (cron) ou, com ARQUIVO_INTERVALO > 0, numa thread de cada worker.
+ARQUIVO_DIAS = int(os.environ.get('ARQUIVO_DIAS', 180))
+ARQUIVO_LOTE = int(os.environ.get('ARQUIVO_LOTE', 2000))
+ARQUIVO_INTERVALO = float(os.environ.get('ARQUIVO_INTERVALO', 0))
+# Pausa entre lotes: no SQLite deixa os pedidos escreverem entre duas transações do arquivo.
+ARQUIVO_PAUSA = float(os.environ.get('ARQUIVO_PAUSA', 0.1))
+
+def arquivar_chamados(dias=ARQUIVO_DIAS, lote=ARQUIVO_LOTE, maximo=None, pausa=0):
+    """Move para chamado_arquivo os chamados finalizados há mais de `dias` dias; devolve quantos moveu.
+
+    Os resumos do dashboard não mudam (o chamado continua a contar no seu dia e status). Os
+    técnicos recebem um evento 'arquivado', que a app trata como remoção da lista.
+    """
+    quente, arquivo = Chamado.__table__, ChamadoArquivo.__table__
+    nomes = [coluna.name for coluna in quente.columns]
+    corte = datetime.datetime.utcnow() - datetime.timedelta(days=dias)
+    movidos = 0
+    while maximo is None or movidos < maximo:
+        tamanho = lote if maximo is None else min(lote, maximo - movidos)
+        # O maior id fica sempre na tabela quente: o SQLite dá max(id) + 1 ao próximo chamado e não pode reutilizar um id arquivado.
+        consulta = db.select(quente.c.id, quente.c.tecnico_id).where(quente.c.status == 'finalizado', quente.c.data_finalizacao < corte, quente.c.id < db.select(func.max(quente.c.id)).scalar_subquery()).order_by(quente.c.id).limit(tamanho).with_for_update(skip_locked=True)
+        selecionados = db.session.execute(consulta).all()
+        if not selecionados:
+            db.session.rollback()
+            break
+        ids = [chamado_id for chamado_id, _ in selecionados]
+        condicao = (quente.c.id.in_(ids), quente.c.status == 'finalizado')
+        agora = datetime.datetime.utcnow()
+        copiados = db.session.execute(arquivo.insert().from_select(nomes + ['arquivado_em'], db.select(*[quente.c[n] for n in nomes], db.literal(agora, db.DateTime)).where(*condicao))).rowcount
+        apagados = db.session.execute(quente.delete().where(*condicao)).rowcount
+        if copiados != apagados:
+            db.session.rollback()
+            raise RuntimeError(f"Lote de arquivo inconsistente ({copiados} copiados, {apagados} apagados); nada foi movido.")
+        eventos = [{'tecnico_id': tecnico_id, 'chamado_id': chamado_id, 'tipo': 'arquivado', 'criado_em': agora} for chamado_id, tecnico_id in selecionados if tecnico_id]
+        if eventos:
+            db.session.execute(EventoChamado.__table__.insert(), eventos)
+            db.session.info['eventos_pendentes'] = True
+        db.session.commit()
+        movidos += apagados
+        if pausa:
+            time.sleep(pausa)
+    return movidos
+
+def tabelas_historico(data_inicio=None):
+    """Tabelas que uma consulta de histórico a partir de `data_inicio` tem de ler."""
+    tabelas = [Chamado.__table__]
+    mais_recente = db.session.query(func.max(ChamadoArquivo.timestamp)).scalar()
+    if mais_recente is not None and (data_inicio is None or data_inicio <= mais_recente):
+        tabelas.append(ChamadoArquivo.__table__)
+    return tabelas
+
+def _ciclo_arquivo(app):
+    while True:
+        time.sleep(ARQUIVO_INTERVALO)
+        with app.app_context():
+            try:
+                movidos = arquivar_chamados(pausa=ARQUIVO_PAUSA)
+                if movidos:
+                    app.logger.info(f"{movidos} chamados finalizados movidos para o arquivo.")
+                eventos, rejeicoes = podar_eventos(pausa=ARQUIVO_PAUSA)
+                if eventos or rejeicoes:
+                    app.logger.info(f"{eventos} eventos e {rejeicoes} rejeições antigos apagados.")
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Erro ao arquivar chamados: {e}")
+
+@bp.before_app_request
+def iniciar_arquivo_periodico():
+    # Arranca no primeiro pedido e não em criar_app: com --preload a thread ficaria só no master.
+    estado = estado_app()
+    if ARQUIVO_INTERVALO <= 0 or estado.thread_arquivo is not None:
+        return
+    with estado.threads_lock:
+        if estado.thread_arquivo is None:
+            estado.thread_arquivo = threading.Thread(target=_ciclo_arquivo, args=(current_app._get_current_object(),), name='arquivo-chamados', daemon=True)
+            estado.thread_arquivo.start()
+
+# --- REMOÇÃO DE CLIENTES E ELEVADORES (PURGA EM LOTES) ---
+# Apagar um cliente pelo cascade do ORM carregava todos os elevadores e todos os chamados para
+# a sessão e apagava-os um a um. Agora o pedido só esconde o cliente/elevadores (removido_em,
+# lápides em remocao_catalogo), apaga os chamados ainda ativos e regista uma Purga; os restantes
+# chamados (quentes e arquivados) saem em lotes de PURGA_LOTE por transação, cada lote com os
+# seus resumos e eventos, e por fim os elevadores e o cliente. Até PURGA_NO_PEDIDO chamados a
+# purga termina no próprio pedido; acima disso corre numa thread do worker e responde 202. Uma
+# purga interrompida (worker reiniciado, erro) é retomada por 'flask purgas executar' ou pela
+# próxima remoção, depois de PURGA_EXPIRACAO segundos sem progresso.
+PURGA_LOTE = int(os.environ.get('PURGA_LOTE', 2000))
+PURGA_NO_PEDIDO = int(os.environ.get('PURGA_NO_PEDIDO', 2000))
+# Pausa entre lotes, como no arquivo: no SQLite deixa os pedidos escreverem entre duas transações.
+PURGA_PAUSA = float(os.environ.get('PURGA_PAUSA', 0.1))
+PURGA_EXPIRACAO = float(os.environ.get('PURGA_EXPIRACAO', 300))
+
+def elevadores_da_purga(cliente_id=None, elevador_id=None):
+    if cliente_id is not None:
+        return db.select(Elevador.id).where(Elevador.cliente_id == cliente_id)
+    return [elevador_id]
+
+def apagar_lote_chamados(tabela, elevadores, lote=None, *condicoes):
+    """Apaga até `lote` chamados dos `elevadores` em chamado ou chamado_arquivo, com os seus resumos; devolve quantos.
+
+    O DELETE ... RETURNING devolve as linhas tal como foram apagadas: os resumos não ficam
+    desacertados por uma atribuição que chegue entre a leitura e o DELETE.
+    """
+    selecao = db.select(tabela.c.id).where(tabela.c.elevador_id.in_(elevadores), *condicoes)
+    if lote:
+        selecao = selecao.limit(lote)
+    linhas = db.session.execute(tabela.delete().where(tabela.c.id.in_(selecao)).returning(tabela.c.id, tabela.c.timestamp, tabela.c.status, tabela.c.tecnico_id, tabela.c.elevador_id)).all()
+    if not linhas:
+        return 0
+    deltas = {}
+    for linha in linhas:
+        chave = _chave_resumo(linha.timestamp, linha.status, linha.tecnico_id, linha.elevador_id)
+        deltas[chave] = deltas.get(chave, 0) - 1
+    aplicar_deltas_resumo(db.session.connection(), deltas)
+    # Os arquivados já saíram da lista dos técnicos com o evento 'arquivado'.
+    if tabela is Chamado.__table__:
+        agora = datetime.datetime.utcnow()
+        eventos = [{'tecnico_id': l.tecnico_id, 'chamado_id': l.id, 'tipo': 'removido', 'criado_em': agora} for l in linhas if l.tecnico_id]
+        if eventos:
+            db.session.execute(EventoChamado.__table__.insert(), eventos)
+            db.session.info['eventos_pendentes'] = True
+    return len(linhas)
+
+def agendar_purga(cliente=None, elevador=None):
+    """Esconde o cliente (e os seus elevadores) ou o elevador, apaga os chamados ativos e regista a Purga."""
+    agora = datetime.datetime.utcnow()
+    if cliente is not None:
+        elevadores = [i for (i,) in db.session.query(Elevador.id).filter(Elevador.cliente_id == cliente.id)]
+        cliente.removido_em = agora
+        registar_alteracao_catalogo('cliente', removidos=[cliente.id])
+    else:
+        elevadores = [elevador.id]
+    db.session.execute(Elevador.__table__.update().where(Elevador.id.in_(elevadores)).values(removido_em=agora))
+    registar_alteracao_catalogo('elevador', removidos=elevadores)
+    # A fila não pode despachar técnicos para um elevador que já não existe.
+    apagar_lote_chamados(Chamado.__table__, elevadores, None, Chamado.status.in_(ESTADOS_ABERTOS))
+    total = db.session.query(func.coalesce(func.sum(ResumoChamado.total), 0)).filter(ResumoChamado.elevador_id.in_(elevadores)).scalar()
+    purga = Purga(cliente_id=cliente.id if cliente is not None else None, elevador_id=None if cliente is not None else elevador.id, chamados_total=total, criado_em=agora, atualizado_em=agora)
+    db.session.add(purga)
+    db.session.commit()
+    return purga
+
+def reclamar_purga(purga_id):
+    """Passa a purga para 'em_curso' se estiver livre (pendente, com erro ou abandonada); devolve True se a obteve."""
+    tabela = Purga.__table__
+    agora = datetime.datetime.utcnow()
+    abandonada = db.and_(tabela.c.estado == 'em_curso', tabela.c.atualizado_em < agora - datetime.timedelta(seconds=PURGA_EXPIRACAO))
+    obtida = db.session.execute(tabela.update().where(tabela.c.id == purga_id, or_(tabela.c.estado.in_(('pendente', 'erro')), abandonada)).values(estado='em_curso', atualizado_em=agora, erro=None)).rowcount
+    db.session.commit()
+    return bool(obtida)
+
+def concluir_purga(cliente_id, elevadores):
+    """Apaga os elevadores, os seus resumos (já a zero) e o cliente; devolve False, sem apagar nada,
+    se entretanto apareceram chamados (um QR lido antes de os outros workers verem a remoção)."""
+    ids = [i for (i,) in db.session.execute(db.select(Elevador.id).where(Elevador.id.in_(elevadores)))]
+    try:
+        for tabela, coluna in ((ResumoChamado.__table__, 'elevador_id'), (UltimaAbertura.__table__, 'elevador_id'), (Elevador.__table__, 'id')):
+            db.session.execute(tabela.delete().where(tabela.c[coluna].in_(ids)))
+        if cliente_id is not None:
+            db.session.execute(Cliente.__table__.delete().where(Cliente.id == cliente_id))
+        # Depois dos DELETE: a escrita já tem o lock do SQLite; no PostgreSQL a FK falha antes disto.
+        if any(db.session.execute(db.select(t.c.id).where(t.c.elevador_id.in_(ids)).limit(1)).first() for t in (Chamado.__table__, ChamadoArquivo.__table__)):
+            db.session.rollback()
+            return False
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+def executar_purga(purga_id, lote=PURGA_LOTE, pausa=0):
+    """Apaga por lotes os chamados da purga e depois os elevadores e o cliente; devolve quantos
+    chamados apagou, ou None se a purga já terminou ou está com outro processo."""
+    if not reclamar_purga(purga_id):
+        return None
+    purga = db.session.get(Purga, purga_id)
+    cliente_id = purga.cliente_id
+    elevadores = elevadores_da_purga(cliente_id, purga.elevador_id)
+    tabela = Purga.__table__
+    apagados = 0
+    try:
+        while True:
+            n = apagar_lote_chamados(Chamado.__table__, elevadores, lote) or apagar_lote_chamados(ChamadoArquivo.__table__, elevadores, lote)
+            agora = datetime.datetime.utcnow()
+            if not n and concluir_purga(cliente_id, elevadores):
+                db.session.execute(tabela.update().where(tabela.c.id == purga_id).values(estado='concluida', atualizado_em=agora, concluido_em=agora))
+                db.session.commit()
+                return apagados
+            db.session.execute(tabela.update().where(tabela.c.id == purga_id).values(chamados_apagados=tabela.c.chamados_apagados + n, atualizado_em=agora))
+            db.session.commit()
+            apagados += n
+            if pausa:
+                time.sleep(pausa)
+    except Exception as e:
+        db.session.rollback()
+        db.session.execute(tabela.update().where(tabela.c.id == purga_id).values(estado='erro', erro=str(e)[:2000], atualizado_em=datetime.datetime.utcnow()))
+        db.session.commit()
+        raise
+
+def executar_purgas_pendentes(lote=PURGA_LOTE, pausa=0):
+    """Executa as purgas pendentes, com erro ou abandonadas; devolve {purga_id: chamados apagados}."""
+    abandonadas = db.and_(Purga.estado == 'em_curso', Purga.atualizado_em < datetime.datetime.utcnow() - datetime.timedelta(seconds=PURGA_EXPIRACAO))
+    ids = [i for (i,) in db.session.query(Purga.id).filter(or_(Purga.estado.in_(('pendente', 'erro')), abandonadas)).order_by(Purga.id)]
+    resultados = {}
+    for purga_id in ids:
+        try:
+            apagados = executar_purga(purga_id, lote=lote, pausa=pausa)
+        except Exception as e:
+            current_app.logger.error(f"Erro na purga #{purga_id}: {e}")
+            continue
+        if apagados is not None:
+            resultados[purga_id] = apagados
+    return resultados
+
+def _ciclo_purgas(app):
+    estado = estado_app(app)
+    while True:
+        estado.purgas_pedidas.clear()
+        with app.app_context():
+            try:
+                for purga_id, apagados in executar_purgas_pendentes(pausa=PURGA_PAUSA).items():
+                    app.logger.info(f"Purga #{purga_id} concluída: {apagados} chamados apagados.")
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Erro ao executar purgas: {e}")
+        # Uma remoção pedida durante a volta anterior faz outra volta; sem pedidos, a thread termina.
+        with estado.threads_lock:
+            if not estado.purgas_pedidas.is_set():
+                estado.thread_purgas = None
+                return
+
+def iniciar_purgas(app):
+    estado = estado_app(app)
+    with estado.threads_lock:
+        estado.purgas_pedidas.set()
+        if estado.thread_purgas is None:
+            estado.thread_purgas = threading.Thread(target=_ciclo_purgas, args=(app,), name='purga-catalogo', daemon=True)
+            estado.thread_purgas.start()
+
+def cliente_ativo(cliente_id):
+    """True se o cliente existe e não foi removido. Chamada depois de gravar o elevador, na mesma
+    transação: no PostgreSQL o FOR SHARE impede a remoção até ao commit e no SQLite a escrita já
+    tem o lock, por isso uma purga agendada entretanto nunca apanha o elevador a meio."""
+    return db.session.query(Cliente.id).filter(Cliente.id == cliente_id, Cliente.removido_em.is_(None)).with_for_update(read=True).first() is not None
+
+def remover_do_catalogo(cliente=None, elevador=None):
+    purga = agendar_purga(cliente=cliente, elevador=elevador)
+    if purga.chamados_total <= PURGA_NO_PEDIDO and executar_purga(purga.id) is not None:
+        return jsonify({'mensagem': 'Operação concluída com sucesso.'})
+    iniciar_purgas(current_app._get_current_object())
+    return jsonify({'mensagem': f'Remoção em curso: {purga.chamados_total} chamados a apagar em segundo plano.', 'id_purga': purga.id, 'progresso': f'/admin/purga/{purga.id}'}), 202
+
+def serializar_purga(p):
+    progresso = min(1.0, p.chamados_apagados / p.chamados_total) if p.chamados_total else 0.0
+    return {'id_purga': p.id, 'cliente_id': p.cliente_id, 'elevador_id': p.elevador_id, 'estado': p.estado, 'chamados_total': p.chamados_total,
+            'chamados_apagados': p.chamados_apagados, 'progresso': 1.0 if p.estado == 'concluida' else round(progresso, 4),
+            'criado_em': formatar_data(p.criado_em), 'concluido_em': formatar_data(p.concluido_em), 'erro': p.erro}
 
 # --- LÓGICA DE AUTENTICAÇÃO JWT ---
+# Tokens já verificados -> identidade do admin. Cada entrada expira no `exp` do token
+# ou após TOKEN_CACHE_TTL segundos (limite para outros workers verem admins removidos).
+IdentidadeAdmin = namedtuple('IdentidadeAdmin', ['id', 'username'])
+TOKEN_CACHE_MAXIMO = int(os.environ.get('TOKEN_CACHE_MAXIMO', 2048))
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', 300))
+
+@event.listens_for(Admin, 'after_update')
+@event.listens_for(Admin, 'after_delete')
+def invalidar_tokens_admin(mapper, connection, admin):
+    estado_app().cache_tokens.remover_se(lambda identidade: identidade.id == admin.id)
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -94,72 +1062,369 @@ def token_required(f):
             token = request.headers['x-access-token']
         if not token:
             return jsonify({'message': 'Token está em falta!'}), 401
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = Admin.query.filter_by(id=data['id']).first()
-        except Exception as e:
-            app.logger.error(f"Erro de token: {e}")
-            return jsonify({'message': 'Token é inválido!'}), 401
+        cache_tokens = estado_app().cache_tokens
+        current_user = cache_tokens.obter(token)
+        if current_user is AUSENTE:
+            try:
+                data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+                admin = Admin.query.filter_by(id=data['id']).first()
+            except Exception as e:
+                current_app.logger.error(f"Erro de token: {e}")
+                return jsonify({'message': 'Token é inválido!'}), 401
+            if not admin:
+                return jsonify({'message': 'Token é inválido!'}), 401
+            current_user = IdentidadeAdmin(admin.id, admin.username)
+            cache_tokens.guardar(token, current_user, expira_em=data.get('exp'))
         return f(current_user, *args, **kwargs)
     return decorated
 
+# --- MÉTRICAS E INSTRUMENTAÇÃO ---
+# Latência por rota, número e tempo das instruções SQL de cada pedido e instruções lentas,
+# acumulados em memória por worker e expostos em GET /metrics no formato do Prometheus.
+# Com vários workers cada scrape vê só o worker que respondeu; as séries continuam
+# cumulativas, por isso rate() e os percentis por histograma continuam válidos.
+SQL_LENTA_SEGUNDOS = float(os.environ.get('SQL_LENTA_SEGUNDOS', 0.25))
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true', 'sim')
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
+
+def registar_metricas(estado):
+    """Cria o registo de métricas de uma app; as leituras consultam o estado dessa app."""
+    metricas = estado.metricas = RegistoMetricas()
+    estado.duracao_pedidos = metricas.histograma('upline_pedido_duracao_segundos', 'Tempo até à resposta de cada pedido HTTP (sem o corpo em streaming).', ('metodo', 'rota'))
+    estado.pedidos_total = metricas.contador('upline_pedidos_total', 'Pedidos HTTP por rota e código de estado.', ('metodo', 'rota', 'estado'))
+    estado.duracao_sql = metricas.histograma('upline_sql_duracao_segundos', 'Duração de cada instrução SQL.', ('rota',), limites=LIMITES_SQL)
+    estado.consultas_por_pedido = metricas.histograma('upline_sql_instrucoes_por_pedido', 'Número de instruções SQL executadas por pedido.', ('rota',), limites=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+    estado.sql_lentas = metricas.contador('upline_sql_lentas_total', 'Instruções SQL mais lentas do que SQL_LENTA_SEGUNDOS.', ('rota',))
+    metricas.leitura('upline_cache_entradas', 'Entradas em cada cache em memória.', lambda: {('tokens',): len(estado.cache_tokens), ('elevadores',): len(estado.cache_elevadores)}, ('cache',))
+    metricas.leitura('upline_cache_acertos_total', 'Leituras servidas pela cache.', lambda: {('tokens',): estado.cache_tokens.acertos, ('elevadores',): estado.cache_elevadores.acertos}, ('cache',), tipo='counter')
+    metricas.leitura('upline_cache_falhas_total', 'Leituras que tiveram de ir à base de dados.', lambda: {('tokens',): estado.cache_tokens.falhas, ('elevadores',): estado.cache_elevadores.falhas}, ('cache',), tipo='counter')
+    metricas.leitura('upline_localizacoes_pendentes', 'Amostras GPS à espera do próximo flush.', lambda: len(estado.buffer_localizacoes))
+    metricas.leitura('upline_localizacoes_descartadas_total', 'Amostras GPS que não entraram no histórico por o buffer estar cheio.', lambda: estado.buffer_localizacoes.descartadas, tipo='counter')
+    metricas.leitura('upline_indice_tecnicos', 'Técnicos de plantão no índice espacial deste worker.', lambda: len(estado.indice_tecnicos))
+
+def _inicio_instrucao(conexao, cursor, instrucao, parametros, contexto, executemany):
+    contexto._metricas_inicio = time.perf_counter()
+
+def _fim_instrucao(conexao, cursor, instrucao, parametros, contexto, executemany):
+    # Os listeners são do engine, que é de uma só app: fora de um contexto não há onde registar.
+    if not has_app_context():
+        return
+    duracao = time.perf_counter() - contexto._metricas_inicio
+    estado = g.get('metricas')
+    rota = estado['rota'] if estado else '-'
+    if estado:
+        estado['instrucoes'] += 1
+        estado['sql'] += duracao
+    estado_upline = estado_app()
+    estado_upline.duracao_sql.observar(duracao, rota)
+    if duracao >= SQL_LENTA_SEGUNDOS:
+        estado_upline.sql_lentas.incrementar(rota)
+        # Só o texto da instrução: os parâmetros podem ter dados pessoais.
+        current_app.logger.warning(f"SQL lenta ({duracao * 1000:.0f} ms) em {rota}: {' '.join(instrucao.split())[:1000]}")
+
+def instrumentar_engine(engine):
+    if not event.contains(engine, 'before_cursor_execute', _inicio_instrucao):
+        event.listen(engine, 'before_cursor_execute', _inicio_instrucao)
+        event.listen(engine, 'after_cursor_execute', _fim_instrucao)
+
+@bp.before_app_request
+def iniciar_metricas_pedido():
+    g.metricas = {'inicio': time.perf_counter(), 'rota': request.url_rule.rule if request.url_rule else 'sem_rota', 'instrucoes': 0, 'sql': 0.0}
+
+@bp.after_app_request
+def registar_metricas_pedido(resposta):
+    estado = g.pop('metricas', None)
+    if estado is None:
+        return resposta
+    duracao = time.perf_counter() - estado['inicio']
+    estado_upline = estado_app()
+    estado_upline.duracao_pedidos.observar(duracao, request.method, estado['rota'])
+    estado_upline.pedidos_total.incrementar(request.method, estado['rota'], str(resposta.status_code))
+    estado_upline.consultas_por_pedido.observar(estado['instrucoes'], estado['rota'])
+    if SERVER_TIMING:
+        resposta.headers.add('Server-Timing', f'app;dur={duracao * 1000:.1f}, sql;dur={estado["sql"] * 1000:.1f};desc="{estado["instrucoes"]} instrucoes SQL"')
+        resposta.headers['Timing-Allow-Origin'] = '*'
+    return resposta
+
+@bp.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    if METRICAS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICAS_TOKEN}':
+        return jsonify({'erro': 'Não autorizado.'}), 401
+    return Response(estado_app().metricas.texto(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# --- FORMATO E COMPRESSÃO DAS RESPOSTAS ---
+# JSON com orjson (ProvedorJSON), listas em colunas com ?formato=colunas e gzip/brotli
+# negociado pelo Accept-Encoding para respostas acima de COMPRESSAO_MINIMO bytes.
+COMPRESSAO_MINIMO = int(os.environ.get('COMPRESSAO_MINIMO', 1024))
+COMPRESSAO_NIVEL_GZIP = int(os.environ.get('COMPRESSAO_NIVEL_GZIP', 6))
+COMPRESSAO_QUALIDADE_BROTLI = int(os.environ.get('COMPRESSAO_QUALIDADE_BROTLI', 4))
+COMPRESSAO_ATIVA = os.environ.get('COMPRESSAO_ATIVA', '1').lower() in ('1', 'true', 'sim')
+
+def formatar_lista(itens):
+    """Com ?formato=colunas, os nomes dos campos vão uma só vez e cada linha é uma lista."""
+    return colunas(itens) if request.args.get('formato') == 'colunas' else itens
+
+@bp.after_app_request
+def comprimir_resposta(resposta):
+    if COMPRESSAO_ATIVA:
+        comprimir(resposta, codificacao_aceite(request.accept_encodings), minimo=COMPRESSAO_MINIMO, nivel_gzip=COMPRESSAO_NIVEL_GZIP, qualidade_brotli=COMPRESSAO_QUALIDADE_BROTLI)
+    return resposta
+
+# --- ABERTURA DE CHAMADOS: IDEMPOTÊNCIA E DEDUPLICAÇÃO ---
+# Um pedido repetido com a mesma Idempotency-Key (cabeçalho ou campo chave_idempotencia)
+# recebe o chamado da primeira resposta durante CHAMADO_IDEMPOTENCIA_HORAS. Um novo relato
+# de um elevador cujo último chamado foi aberto há menos de CHAMADO_DEDUP_MINUTOS (0 desliga)
+# e ainda está aberto ou atribuído junta-se a esse chamado, sem novo despacho; se agora há
+# pessoa presa, o chamado é escalado. O caso comum é uma leitura de ultima_abertura pela chave
+# primária, sem escritas. Antes de criar, a linha do elevador é bloqueada (upsert) e a leitura
+# repete-se: de dois pedidos simultâneos, o segundo espera pelo commit do primeiro e junta-se.
+CHAMADO_DEDUP_MINUTOS = float(os.environ.get('CHAMADO_DEDUP_MINUTOS', 30))
+CHAMADO_IDEMPOTENCIA_HORAS = float(os.environ.get('CHAMADO_IDEMPOTENCIA_HORAS', 24))
+ESTADOS_ABERTOS = ('aberto', 'atribuido')
+
+def chamado_da_chave(chave):
+    """(chamado_id, criou) da primeira resposta com esta chave de idempotência, ou None."""
+    limite = datetime.datetime.utcnow() - datetime.timedelta(hours=CHAMADO_IDEMPOTENCIA_HORAS)
+    return db.session.query(ChaveIdempotencia.chamado_id, ChaveIdempotencia.criou).filter(ChaveIdempotencia.chave == chave, ChaveIdempotencia.criado_em >= limite).first()
+
+def gravar_chave(chave, chamado_id, criou):
+    """Associa a chave ao chamado; uma linha expirada da mesma chave, ainda não limpa, é substituída."""
+    limite = datetime.datetime.utcnow() - datetime.timedelta(hours=CHAMADO_IDEMPOTENCIA_HORAS)
+    db.session.execute(ChaveIdempotencia.__table__.delete().where(ChaveIdempotencia.chave == chave, ChaveIdempotencia.criado_em < limite))
+    db.session.add(ChaveIdempotencia(chave=chave, chamado_id=chamado_id, criou=criou))
+
+def chamado_aberto_do_elevador(elevador_id, agora):
+    """(id, pessoa_presa) do chamado recente e ainda aberto do elevador, ou None."""
+    if CHAMADO_DEDUP_MINUTOS <= 0:
+        return None
+    limite = agora - datetime.timedelta(minutes=CHAMADO_DEDUP_MINUTOS)
+    return (db.session.query(Chamado.id, Chamado.pessoa_presa).join(UltimaAbertura, UltimaAbertura.chamado_id == Chamado.id)
+            .filter(UltimaAbertura.elevador_id == elevador_id, UltimaAbertura.aberto_em >= limite, Chamado.status.in_(ESTADOS_ABERTOS)).first())
+
+def bloquear_abertura(elevador_id, agora):
+    """Bloqueia até ao fim da transação a linha de ultima_abertura do elevador, criando-a se faltar."""
+    tabela = UltimaAbertura.__table__
+    dialeto = db.session.connection().dialect.name
+    if dialeto in ('postgresql', 'sqlite'):
+        # O DO UPDATE que não muda nada bloqueia a linha existente; o SQLite já serializa as escritas.
+        insert = (postgresql if dialeto == 'postgresql' else sqlite).insert(tabela).values(elevador_id=elevador_id, aberto_em=agora)
+        db.session.execute(insert.on_conflict_do_update(index_elements=['elevador_id'], set_={'chamado_id': tabela.c.chamado_id}))
+    elif not db.session.execute(db.select(tabela.c.elevador_id).where(tabela.c.elevador_id == elevador_id).with_for_update()).first():
+        db.session.execute(tabela.insert().values(elevador_id=elevador_id, aberto_em=agora))
+
+def escalar_chamado(chamado_id):
+    """Marca pessoa presa num chamado ainda aberto; devolve o status se o alterou, ou None."""
+    tabela = Chamado.__table__
+    linha = db.session.execute(tabela.update().where(tabela.c.id == chamado_id, tabela.c.pessoa_presa.isnot(True), tabela.c.status.in_(ESTADOS_ABERTOS))
+                               .values(pessoa_presa=True, revisao=tabela.c.revisao + 1).returning(tabela.c.tecnico_id, tabela.c.status)).first()
+    if linha and linha.tecnico_id:
+        # UPDATE direto, fora dos eventos do ORM: o aviso ao técnico é gravado aqui.
+        db.session.execute(EventoChamado.__table__.insert().values(tecnico_id=linha.tecnico_id, chamado_id=chamado_id, tipo='atualizado', criado_em=datetime.datetime.utcnow()))
+        db.session.info['eventos_pendentes'] = True
+    return linha.status if linha else None
+
+def registar_abertura(elevador_id, descricao, pessoa_presa, chave=None):
+    """Abre um chamado ou junta o relato ao chamado aberto do elevador; devolve (chamado_id, criou, despachar)."""
+    agora = datetime.datetime.utcnow()
+    existente = chamado_aberto_do_elevador(elevador_id, agora)
+    if existente is None and CHAMADO_DEDUP_MINUTOS > 0:
+        bloquear_abertura(elevador_id, agora)
+        existente = chamado_aberto_do_elevador(elevador_id, agora)
+    if existente is not None:
+        status = escalar_chamado(existente.id) if pessoa_presa and not existente.pessoa_presa else None
+        if chave:
+            gravar_chave(chave, existente.id, False)
+        db.session.commit()
+        # Com pessoa presa, um chamado ainda na fila passa à frente: o despacho volta a correr.
+        return existente.id, False, status == 'aberto'
+    chamado = Chamado(descricao_problema=descricao, pessoa_presa=pessoa_presa, elevador_id=elevador_id, status='aberto')
+    db.session.add(chamado)
+    db.session.flush()
+    if CHAMADO_DEDUP_MINUTOS > 0:
+        db.session.execute(UltimaAbertura.__table__.update().where(UltimaAbertura.elevador_id == elevador_id).values(chamado_id=chamado.id, aberto_em=agora))
+    if chave:
+        gravar_chave(chave, chamado.id, True)
+    db.session.commit()
+    return chamado.id, True, True
+
+def resposta_abertura(chamado_id, criou):
+    tecnico = db.session.query(Tecnico.nome).join(Chamado, Chamado.tecnico_id == Tecnico.id).filter(Chamado.id == chamado_id, Chamado.status == 'atribuido').first()
+    if not criou:
+        corpo = {'mensagem': f'Este elevador já tem um chamado aberto; o seu relato foi associado ao chamado #{chamado_id}.', 'id_chamado': chamado_id, 'duplicado': True}
+    elif tecnico:
+        corpo = {'mensagem': 'Chamado aberto com sucesso!', 'id_chamado': chamado_id}
+    else:
+        corpo = {'mensagem': 'Chamado aberto! Nenhum técnico disponível, o chamado aguarda na fila de despacho.', 'id_chamado': chamado_id}
+    if tecnico:
+        corpo['tecnico_atribuido'] = tecnico.nome
+    return jsonify(corpo), 201 if criou else 200
+
+def limpar_chaves_idempotencia():
+    """Apaga as chaves de idempotência expiradas; devolve quantas apagou."""
+    limite = datetime.datetime.utcnow() - datetime.timedelta(hours=CHAMADO_IDEMPOTENCIA_HORAS)
+    apagadas = db.session.execute(ChaveIdempotencia.__table__.delete().where(ChaveIdempotencia.criado_em < limite)).rowcount
+    db.session.commit()
+    return apagadas
+
 # --- ROTAS PÚBLICAS ---
-@app.route('/')
+@bp.route('/')
 def index():
     return "API da UpLine Elevadores está no ar!"
 
-@app.route('/chamado/abrir', methods=['POST'])
+@bp.route('/chamado/abrir', methods=['POST'])
 def abrir_chamado():
     dados = request.json
     if not all(k in dados for k in ['codigo_qr', 'pessoa_presa', 'descricao']):
         return jsonify({'erro': 'Dados incompletos fornecidos.'}), 400
+    chave = str(request.headers.get('Idempotency-Key') or dados.get('chave_idempotencia') or '').strip()[:100] or None
     try:
-        elevador = Elevador.query.filter_by(codigo_qr=dados['codigo_qr']).first()
+        anterior = chamado_da_chave(chave) if chave else None
+        if anterior:
+            return resposta_abertura(*anterior)
+        elevador = obter_elevador_por_qr(dados['codigo_qr'])
         if not elevador:
             return jsonify({'erro': f"O elevador com o código '{dados['codigo_qr']}' não foi encontrado."}), 404
-        tecnicos_disponiveis = Tecnico.query.filter_by(de_plantao=True).filter(Tecnico.last_latitude.isnot(None)).all()
-        if not tecnicos_disponiveis:
-            novo_chamado_aberto = Chamado(descricao_problema=dados['descricao'], pessoa_presa=bool(dados['pessoa_presa']), elevador_id=elevador.id, status='aberto')
-            db.session.add(novo_chamado_aberto)
-            db.session.commit()
-            return jsonify({'mensagem': 'Chamado aberto! Nenhum técnico disponível, aguardando atribuição manual.', 'id_chamado': novo_chamado_aberto.id}), 201
-        
-        tecnico_mais_proximo = min(tecnicos_disponiveis, key=lambda t: calcular_distancia(elevador.latitude, elevador.longitude, t.last_latitude, t.last_longitude))
-        novo_chamado = Chamado(descricao_problema=dados['descricao'], pessoa_presa=bool(dados['pessoa_presa']), elevador_id=elevador.id, tecnico_id=tecnico_mais_proximo.id, status='atribuido')
-        db.session.add(novo_chamado)
-        db.session.commit()
-        return jsonify({'mensagem': 'Chamado aberto com sucesso!', 'id_chamado': novo_chamado.id, 'tecnico_atribuido': tecnico_mais_proximo.nome}), 201
+        try:
+            chamado_id, criou, despachar = registar_abertura(elevador.id, dados['descricao'], bool(dados['pessoa_presa']), chave)
+        except IntegrityError:
+            # Um pedido simultâneo com a mesma chave gravou-a primeiro: a resposta é a dele. Se a
+            # chave dele não é legível (expirou entretanto), o relato abre-se sem chave, como os outros.
+            db.session.rollback()
+            anterior = chamado_da_chave(chave) if chave else None
+            if anterior:
+                return resposta_abertura(*anterior)
+            chamado_id, criou, despachar = registar_abertura(elevador.id, dados['descricao'], bool(dados['pessoa_presa']))
+        # O chamado entra na fila e é despachado por ordem de prioridade, não de chegada.
+        if despachar:
+            despachar_fila()
+        return resposta_abertura(chamado_id, criou)
     except Exception as e:
-        app.logger.error(f"Erro inesperado em /chamado/abrir: {e}")
+        current_app.logger.error(f"Erro inesperado em /chamado/abrir: {e}")
         return jsonify({'erro': 'Ocorreu um erro interno no servidor.'}), 500
 
-@app.route('/tecnico/login', methods=['POST'])
+@bp.route('/tecnico/login', methods=['POST'])
 def tecnico_login():
     dados = request.json
     tecnico = Tecnico.query.filter_by(username=dados.get('username')).first()
     if tecnico and tecnico.password == dados.get('password'):
         tecnico.de_plantao = True
+        registar_alteracao_catalogo('tecnico', alterados=[tecnico])
         db.session.commit()
+        sincronizar_tecnico_no_indice(tecnico)
+        despachar_fila()
         return jsonify({'mensagem': 'Login bem-sucedido.', 'tecnico_id': tecnico.id, 'nome': tecnico.nome})
     return jsonify({'erro': 'Credenciais inválidas.'}), 401
     
-@app.route('/tecnico/atualizar_localizacao', methods=['POST'])
+@bp.route('/tecnico/atualizar_localizacao', methods=['POST'])
 def atualizar_localizacao():
     dados = request.json
-    tecnico = Tecnico.query.get(dados.get('tecnico_id'))
-    if tecnico:
-        tecnico.last_latitude = dados.get('latitude')
-        tecnico.last_longitude = dados.get('longitude')
-        db.session.commit()
+    tecnico_id = db.session.query(Tecnico.id).filter_by(id=dados.get('tecnico_id')).scalar()
+    if tecnico_id:
+        try:
+            registar_localizacao(tecnico_id, float(dados['latitude']), float(dados['longitude']), converter_ts(dados.get('ts')))
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'erro': 'Latitude, longitude ou ts inválidos.'}), 400
         return jsonify({'mensagem': 'Localização atualizada.'})
     return jsonify({'erro': 'Técnico não encontrado.'}), 404
 
-@app.route('/tecnico/<int:tecnico_id>/chamados', methods=['GET'])
+@bp.route('/tecnico/atualizar_localizacao/lote', methods=['POST'])
+def atualizar_localizacao_lote():
+    dados = request.json
+    amostras = dados.get('amostras') if isinstance(dados, dict) else dados
+    if not isinstance(amostras, list):
+        return jsonify({'erro': 'Envie uma lista de amostras {tecnico_id, latitude, longitude, ts}.'}), 400
+    aceites, descartadas, invalidas = 0, 0, []
+    for posicao, amostra in enumerate(amostras):
+        try:
+            aceite = registar_localizacao(int(amostra['tecnico_id']), float(amostra['latitude']), float(amostra['longitude']), converter_ts(amostra.get('ts')))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            invalidas.append(posicao)
+            continue
+        if aceite:
+            aceites += 1
+        else:
+            descartadas += 1
+    return jsonify({'mensagem': 'Amostras recebidas.', 'aceites': aceites, 'descartadas': descartadas, 'invalidas': invalidas}), 202
+
+def consultar_chamados_tecnico(tecnico_id):
+    # Projeção com joins: uma única consulta, sem carregar elevador/cliente por linha.
+    return db.session.query(Chamado.id, Elevador.endereco, Chamado.descricao_problema, Chamado.pessoa_presa, Chamado.status, Cliente.nome.label('cliente_nome'), Chamado.servicos_realizados, Chamado.pecas_trocadas, Chamado.observacao_texto, Chamado.data_finalizacao).join(Elevador, Chamado.elevador_id == Elevador.id).join(Cliente, Elevador.cliente_id == Cliente.id).filter(Chamado.tecnico_id == tecnico_id).order_by(Chamado.timestamp.desc())
+
+def serializar_chamado_tecnico(c):
+    return {'id_chamado': c.id, 'endereco': c.endereco, 'descricao': c.descricao_problema, 'pessoa_presa': c.pessoa_presa, 'status': c.status, 'cliente': c.cliente_nome, 'servicos_realizados': c.servicos_realizados, 'pecas_trocadas': c.pecas_trocadas, 'observacao_texto': c.observacao_texto, 'data_finalizacao': formatar_data(c.data_finalizacao)}
+
+def alteracoes_tecnico(tecnico_id, desde=None, vistos=None):
+    """Chamados do técnico alterados depois do evento `desde` (todos, se desde for None).
+
+    `vistos`, se indicado, é o conjunto dos eventos já enviados na janela de EVENTOS_ATRASO;
+    esses não voltam a contar e o conjunto fica com os eventos da janela atual.
+    """
+    primeiro, ultimo = db.session.query(func.min(EventoChamado.id), func.max(EventoChamado.id)).one()
+    ultimo = ultimo or 0
+    # Cursor de antes da poda: os eventos que faltam já não existem, a lista vai completa.
+    if desde is None or (primeiro is not None and desde < primeiro - 1):
+        chamados = [serializar_chamado_tecnico(c) for c in consultar_chamados_tecnico(tecnico_id).all()]
+        return {'chamados': chamados, 'removidos': [], 'cursor': ultimo, 'completo': True}
+    limite = datetime.datetime.utcnow() - datetime.timedelta(seconds=EVENTOS_ATRASO)
+    eventos = db.session.query(EventoChamado.id, EventoChamado.chamado_id).filter(EventoChamado.tecnico_id == tecnico_id, EventoChamado.id <= ultimo,
+                                                                                   or_(EventoChamado.id > desde, EventoChamado.criado_em >= limite)).all()
+    ids = {chamado_id for evento_id, chamado_id in eventos if vistos is None or evento_id not in vistos}
+    if vistos is not None:
+        vistos.clear()
+        vistos.update(evento_id for evento_id, _ in eventos)
+    chamados = [serializar_chamado_tecnico(c) for c in consultar_chamados_tecnico(tecnico_id).filter(Chamado.id.in_(ids)).all()] if ids else []
+    removidos = sorted(ids - {c['id_chamado'] for c in chamados})
+    return {'chamados': chamados, 'removidos': removidos, 'cursor': max(ultimo, desde), 'completo': False}
+
+@bp.route('/tecnico/<int:tecnico_id>/chamados', methods=['GET'])
 def get_chamados_tecnico(tecnico_id):
-    chamados = Chamado.query.filter_by(tecnico_id=tecnico_id).order_by(Chamado.timestamp.desc()).all()
-    return jsonify([{'id_chamado': c.id, 'endereco': c.elevador.endereco, 'descricao': c.descricao_problema, 'pessoa_presa': c.pessoa_presa, 'status': c.status, 'cliente': c.elevador.cliente.nome, 'servicos_realizados': c.servicos_realizados, 'pecas_trocadas': c.pecas_trocadas, 'observacao_texto': c.observacao_texto, 'data_finalizacao': c.data_finalizacao.strftime('%d/%m/%Y %H:%M') if c.data_finalizacao else None} for c in chamados])
+    return jsonify(formatar_lista([serializar_chamado_tecnico(c) for c in consultar_chamados_tecnico(tecnico_id).all()]))
+
+@bp.route('/tecnico/<int:tecnico_id>/chamados/alteracoes', methods=['GET'])
+def get_alteracoes_chamados_tecnico(tecnico_id):
+    desde = request.args.get('desde', type=int)
+    alteracoes = alteracoes_tecnico(tecnico_id, desde)
+    return jsonify(dict(alteracoes, chamados=formatar_lista(alteracoes['chamados'])))
+
+EVENTOS_INTERVALO = float(os.environ.get('EVENTOS_INTERVALO', 3))
+EVENTOS_HEARTBEAT = float(os.environ.get('EVENTOS_HEARTBEAT', 15))
+EVENTOS_DURACAO_MAXIMA = float(os.environ.get('EVENTOS_DURACAO_MAXIMA', 55))
+
+@bp.route('/tecnico/<int:tecnico_id>/eventos', methods=['GET'])
+def stream_eventos_tecnico(tecnico_id):
+    # Server-Sent Events. A ligação fecha-se ao fim de EVENTOS_DURACAO_MAXIMA segundos e o
+    # EventSource do browser volta a ligar com Last-Event-ID, retomando do mesmo cursor.
+    desde = request.headers.get('Last-Event-ID', type=int)
+    if desde is None:
+        desde = request.args.get('desde', type=int)
+    if desde is None:
+        desde = db.session.query(func.max(EventoChamado.id)).scalar() or 0
+    db.session.remove()
+    estado = estado_app()
 
-@app.route('/chamado/<int:chamado_id>/finalizar', methods=['POST'])
+    def gerar(cursor):
+        yield f"retry: 3000\n: ligado ao cursor {cursor}\n\n"
+        inicio = ultimo_envio = time.monotonic()
+        vistos = set()
+        while time.monotonic() - inicio < EVENTOS_DURACAO_MAXIMA:
+            try:
+                alteracoes = alteracoes_tecnico(tecnico_id, cursor, vistos)
+                cursor = alteracoes['cursor']
+                if alteracoes['chamados'] or alteracoes['removidos'] or alteracoes['completo']:
+                    ultimo_envio = time.monotonic()
+                    yield f"id: {cursor}\nevent: alteracoes\ndata: {json.dumps(alteracoes, ensure_ascii=False)}\n\n"
+            finally:
+                # Devolve a ligação ao pool enquanto espera: um stream aberto não prende conexões.
+                db.session.remove()
+            if time.monotonic() - ultimo_envio >= EVENTOS_HEARTBEAT:
+                ultimo_envio = time.monotonic()
+                yield ": ping\n\n"
+            with estado.aviso_eventos:
+                estado.aviso_eventos.wait(EVENTOS_INTERVALO)
+
+    return Response(stream_with_context(gerar(desde)), content_type='text/event-stream; charset=utf-8', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/chamado/<int:chamado_id>/finalizar', methods=['POST'])
 def finalizar_chamado(chamado_id):
     chamado = Chamado.query.get_or_404(chamado_id)
     dados = request.json
@@ -169,19 +1434,26 @@ def finalizar_chamado(chamado_id):
     chamado.observacao_texto = dados.get('observacao_texto')
     chamado.data_finalizacao = datetime.datetime.utcnow()
     db.session.commit()
+    despachar_fila()
     return jsonify({'mensagem': f'Chamado #{chamado_id} finalizado com sucesso.'})
 
-@app.route('/chamado/<int:chamado_id>/rejeitar', methods=['POST'])
+@bp.route('/chamado/<int:chamado_id>/rejeitar', methods=['POST'])
 def rejeitar_chamado(chamado_id):
     chamado = Chamado.query.get_or_404(chamado_id)
     chamado.status = 'aberto'
     chamado.tecnico_id = None
     db.session.commit()
+    despachar_fila()
     return jsonify({'mensagem': f'Chamado #{chamado_id} rejeitado e devolvido à fila.'})
 
 
+@bp.app_errorhandler(StaleDataError)
+def conflito_de_versao(e):
+    db.session.rollback()
+    return jsonify({'erro': 'O chamado foi alterado por outro pedido. Atualize e tente novamente.'}), 409
+
 # --- ROTAS DE GESTÃO (ADMIN) ---
-@app.route('/admin/login', methods=['POST'])
+@bp.route('/admin/login', methods=['POST'])
 def admin_login():
     auth = request.json
     if not auth or not auth.get('username') or not auth.get('password'):
@@ -189,75 +1461,268 @@ def admin_login():
     admin = Admin.query.filter_by(username=auth.get('username')).first()
     if not admin or not admin.password == auth.get('password'):
         return jsonify({'message': 'Credenciais inválidas!'}), 401
-    token = jwt.encode({'id': admin.id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)}, app.config['SECRET_KEY'], "HS256")
+    token = jwt.encode({'id': admin.id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)}, current_app.config['SECRET_KEY'], "HS256")
     return jsonify({'token': token})
 
-@app.route('/admin/clientes', methods=['GET', 'POST'])
+@bp.route('/admin/clientes', methods=['GET', 'POST'])
 @token_required
 def gerir_clientes(current_user):
     if request.method == 'GET':
-        return jsonify([{'id': c.id, 'nome': c.nome, 'possui_contrato': c.possui_contrato} for c in Cliente.query.order_by(Cliente.id).all()])
+        consulta = db.session.query(Cliente.id, Cliente.nome, Cliente.possui_contrato).filter(Cliente.removido_em.is_(None)).order_by(Cliente.id)
+        return resposta_catalogo('cliente', Cliente, consulta, lambda c: {'id': c.id, 'nome': c.nome, 'possui_contrato': c.possui_contrato})
     elif request.method == 'POST':
         dados = request.json
         novo_cliente = Cliente(nome=dados['nome'], possui_contrato=dados.get('possui_contrato', False))
         db.session.add(novo_cliente)
+        registar_alteracao_catalogo('cliente', alterados=[novo_cliente])
         db.session.commit()
         return jsonify({'id': novo_cliente.id, 'nome': novo_cliente.nome}), 201
 
-@app.route('/admin/cliente/<int:id>', methods=['PUT', 'DELETE'])
+@bp.route('/admin/cliente/<int:id>', methods=['PUT', 'DELETE'])
 @token_required
 def gerir_cliente_especifico(current_user, id):
-    cliente = Cliente.query.get_or_404(id)
+    cliente = Cliente.query.filter_by(id=id, removido_em=None).first_or_404()
     if request.method == 'PUT':
         dados = request.json
         cliente.nome = dados['nome']
         cliente.possui_contrato = dados.get('possui_contrato', cliente.possui_contrato)
+        registar_alteracao_catalogo('cliente', alterados=[cliente])
+        # A listagem de elevadores mostra o nome do cliente.
+        registar_alteracao_catalogo('elevador', alterados=cliente.elevadores)
     elif request.method == 'DELETE':
-        db.session.delete(cliente)
+        return remover_do_catalogo(cliente=cliente)
     db.session.commit()
     return jsonify({'mensagem': 'Operação concluída com sucesso.'})
 
-@app.route('/admin/elevadores', methods=['GET', 'POST'])
+@bp.route('/admin/elevadores', methods=['GET', 'POST'])
 @token_required
 def gerir_elevadores(current_user):
     if request.method == 'GET':
-        return jsonify([{'id': e.id, 'codigo_qr': e.codigo_qr, 'endereco': e.endereco, 'latitude': e.latitude, 'longitude': e.longitude, 'cliente_id': e.cliente_id, 'cliente_nome': e.cliente.nome} for e in Elevador.query.order_by(Elevador.id).all()])
+        consulta = db.session.query(Elevador.id, Elevador.codigo_qr, Elevador.endereco, Elevador.latitude, Elevador.longitude, Elevador.cliente_id, Cliente.nome.label('cliente_nome')).join(Cliente, Elevador.cliente_id == Cliente.id).filter(Elevador.removido_em.is_(None)).order_by(Elevador.id)
+        return resposta_catalogo('elevador', Elevador, consulta, lambda e: {'id': e.id, 'codigo_qr': e.codigo_qr, 'endereco': e.endereco, 'latitude': e.latitude, 'longitude': e.longitude, 'cliente_id': e.cliente_id, 'cliente_nome': e.cliente_nome})
     elif request.method == 'POST':
         dados = request.json
         novo_elevador = Elevador(codigo_qr=dados['codigo_qr'], endereco=dados['endereco'], latitude=dados['latitude'], longitude=dados['longitude'], cliente_id=dados['cliente_id'])
         db.session.add(novo_elevador)
+        db.session.flush()
+        # A purga de um cliente removido apaga os elevadores que ele tiver quando correr.
+        if not cliente_ativo(novo_elevador.cliente_id):
+            db.session.rollback()
+            return jsonify({'erro': f"Cliente {dados['cliente_id']} não encontrado."}), 400
+        registar_alteracao_catalogo('elevador', alterados=[novo_elevador])
         db.session.commit()
         return jsonify({'id': novo_elevador.id, 'codigo_qr': novo_elevador.codigo_qr}), 201
 
-@app.route('/admin/elevador/<int:id>', methods=['PUT', 'DELETE'])
+@bp.route('/admin/elevador/<int:id>', methods=['PUT', 'DELETE'])
 @token_required
 def gerir_elevador_especifico(current_user, id):
-    elevador = Elevador.query.get_or_404(id)
+    elevador = Elevador.query.filter_by(id=id, removido_em=None).first_or_404()
     if request.method == 'PUT':
         dados = request.json
         elevador.codigo_qr = dados['codigo_qr']
         elevador.endereco = dados['endereco']
         elevador.latitude = float(dados['latitude'])
         elevador.longitude = float(dados['longitude'])
-        elevador.cliente_id = int(dados['cliente_id'])
+        if int(dados['cliente_id']) != elevador.cliente_id:
+            # Os contadores do dashboard guardam o cliente: os deste elevador mudam com ele.
+            mover_resumos_elevador(elevador.id, int(dados['cliente_id']))
+            elevador.cliente_id = int(dados['cliente_id'])
+            db.session.flush()
+            if not cliente_ativo(elevador.cliente_id):
+                db.session.rollback()
+                return jsonify({'erro': f"Cliente {dados['cliente_id']} não encontrado."}), 400
+        registar_alteracao_catalogo('elevador', alterados=[elevador])
     elif request.method == 'DELETE':
-        db.session.delete(elevador)
+        return remover_do_catalogo(elevador=elevador)
     db.session.commit()
     return jsonify({'mensagem': 'Operação concluída com sucesso.'})
 
-@app.route('/admin/tecnicos', methods=['GET', 'POST'])
+@bp.route('/admin/purga/<int:id>', methods=['GET'])
+@token_required
+def progresso_purga(current_user, id):
+    return jsonify(serializar_purga(Purga.query.get_or_404(id)))
+
+# --- IMPORTAÇÃO EM MASSA DE CLIENTES E ELEVADORES ---
+# Cada linha do ficheiro (CSV com cabeçalho ou NDJSON) é um elevador com o nome do seu
+# cliente ou o cliente_id; uma linha sem codigo_qr regista só o cliente. Os clientes que
+# ainda não existem são criados. O ficheiro é todo validado antes de qualquer escrita e as
+# inserções são feitas com executemany em transações de IMPORTACAO_LOTE linhas.
+IMPORTACAO_LOTE = int(os.environ.get('IMPORTACAO_LOTE', 5000))
+IMPORTACAO_MAX_ERROS = 1000
+VALORES_VERDADEIROS = ('1', 'true', 'sim', 's', 'yes', 'y')
+VALORES_FALSOS = ('0', 'false', 'nao', 'não', 'n', 'no')
+
+def ler_linhas_importacao(fluxo, formato):
+    texto = io.TextIOWrapper(fluxo, encoding='utf-8-sig', newline='')
+    if formato == 'csv':
+        # A linha 1 é o cabeçalho.
+        yield from enumerate(csv.DictReader(texto), start=2)
+        return
+    for numero, linha in enumerate(texto, start=1):
+        if linha.strip():
+            try:
+                yield numero, json.loads(linha)
+            except ValueError:
+                yield numero, None
+
+def validar_linha_importacao(linha):
+    """Devolve (dados normalizados, [erros]) de uma linha do ficheiro de importação."""
+    if not isinstance(linha, dict):
+        return None, ['A linha não é um objeto JSON válido.']
+    erros = []
+    def texto(campo):
+        valor = linha.get(campo)
+        return '' if valor is None else str(valor).strip()
+    dados = {'cliente': texto('cliente'), 'cliente_id': None, 'possui_contrato': True}
+    if texto('cliente_id'):
+        try:
+            dados['cliente_id'] = int(texto('cliente_id'))
+        except ValueError:
+            erros.append('cliente_id inválido.')
+    elif not dados['cliente']:
+        erros.append('Indique o nome do cliente ou o cliente_id.')
+    elif len(dados['cliente']) > 100:
+        erros.append('Nome do cliente com mais de 100 caracteres.')
+    contrato = texto('possui_contrato').lower()
+    if contrato in VALORES_FALSOS:
+        dados['possui_contrato'] = False
+    elif contrato and contrato not in VALORES_VERDADEIROS:
+        erros.append('possui_contrato deve ser verdadeiro ou falso.')
+
+    codigo_qr, endereco = texto('codigo_qr'), texto('endereco')
+    if not codigo_qr:
+        if endereco or texto('latitude') or texto('longitude'):
+            erros.append('codigo_qr é obrigatório para registar um elevador.')
+        elif dados['cliente_id'] is not None:
+            erros.append('Linha sem elevador e sem cliente novo: nada a importar.')
+        return dados, erros
+    if len(codigo_qr) > 50:
+        erros.append('codigo_qr com mais de 50 caracteres.')
+    if not endereco:
+        erros.append('endereco é obrigatório.')
+    elif len(endereco) > 200:
+        erros.append('endereco com mais de 200 caracteres.')
+    dados.update(codigo_qr=codigo_qr, endereco=endereco)
+    for campo, limite in (('latitude', 90), ('longitude', 180)):
+        try:
+            dados[campo] = float(texto(campo))
+        except ValueError:
+            erros.append(f'{campo} inválida.')
+            continue
+        if not -limite <= dados[campo] <= limite:
+            erros.append(f'{campo} fora do intervalo [-{limite}, {limite}].')
+    return dados, erros
+
+@bp.route('/admin/importar', methods=['POST'])
+@token_required
+def importar_catalogo(current_user):
+    """Importa clientes e elevadores de um ficheiro CSV/NDJSON (campo 'ficheiro' ou corpo do pedido).
+
+    Com erros em alguma linha nada é gravado e a resposta (400) lista os erros por linha;
+    com ?parcial=1 as linhas válidas são importadas e as restantes reportadas.
+    """
+    ficheiro = request.files.get('ficheiro')
+    nome_ficheiro = (ficheiro.filename or '') if ficheiro else ''
+    formato = request.args.get('formato') or ('ndjson' if nome_ficheiro.endswith(('.ndjson', '.jsonl')) or request.mimetype == 'application/x-ndjson' else 'csv')
+    if formato not in ('csv', 'ndjson'):
+        return jsonify({'erro': 'Formato inválido. Use csv ou ndjson.'}), 400
+    parcial = request.args.get('parcial', '').lower() in VALORES_VERDADEIROS
+
+    validas, erros, linhas_por_qr, total = [], {}, {}, 0
+    try:
+        for numero, linha in ler_linhas_importacao(ficheiro.stream if ficheiro else io.BytesIO(request.get_data()), formato):
+            total += 1
+            dados, problemas = validar_linha_importacao(linha)
+            if dados and dados.get('codigo_qr'):
+                if dados['codigo_qr'] in linhas_por_qr:
+                    problemas.append(f"codigo_qr repetido no ficheiro (linha {linhas_por_qr[dados['codigo_qr']]}).")
+                else:
+                    linhas_por_qr[dados['codigo_qr']] = numero
+            if problemas:
+                erros[numero] = problemas
+            else:
+                validas.append((numero, dados))
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'erro': f'Não foi possível ler o ficheiro: {e}'}), 400
+    if not total:
+        return jsonify({'erro': 'O ficheiro não tem linhas.'}), 400
+
+    # Verificações contra a base de dados, uma consulta por lote em vez de uma por linha.
+    codigos = [d['codigo_qr'] for _, d in validas if d.get('codigo_qr')]
+    existentes = set()
+    for i in range(0, len(codigos), IMPORTACAO_LOTE):
+        existentes.update(c for c, in db.session.query(Elevador.codigo_qr).filter(Elevador.codigo_qr.in_(codigos[i:i + IMPORTACAO_LOTE])))
+    ids_indicados = list({d['cliente_id'] for _, d in validas if d['cliente_id'] is not None})
+    ids_existentes = set()
+    for i in range(0, len(ids_indicados), IMPORTACAO_LOTE):
+        ids_existentes.update(c for c, in db.session.query(Cliente.id).filter(Cliente.id.in_(ids_indicados[i:i + IMPORTACAO_LOTE]), Cliente.removido_em.is_(None)))
+    nomes = list({d['cliente'] for _, d in validas if d['cliente_id'] is None})
+    clientes_por_nome = {}
+    for i in range(0, len(nomes), IMPORTACAO_LOTE):
+        for cliente_id, nome in db.session.query(Cliente.id, Cliente.nome).filter(Cliente.nome.in_(nomes[i:i + IMPORTACAO_LOTE]), Cliente.removido_em.is_(None)):
+            clientes_por_nome.setdefault(nome, []).append(cliente_id)
+
+    aceites = []
+    for numero, dados in validas:
+        problemas = []
+        if dados.get('codigo_qr') in existentes:
+            problemas.append('Já existe um elevador com este codigo_qr.')
+        if dados['cliente_id'] is not None and dados['cliente_id'] not in ids_existentes:
+            problemas.append(f"Cliente {dados['cliente_id']} não encontrado.")
+        if dados['cliente_id'] is None and len(clientes_por_nome.get(dados['cliente'], ())) > 1:
+            problemas.append(f"Existe mais do que um cliente chamado '{dados['cliente']}'; indique o cliente_id.")
+        if problemas:
+            erros[numero] = problemas
+        else:
+            aceites.append(dados)
+    relatorio = [{'linha': numero, 'erros': erros[numero]} for numero in sorted(erros)]
+    resumo = {'linhas': total, 'total_erros': len(relatorio), 'erros': relatorio[:IMPORTACAO_MAX_ERROS]}
+    if relatorio and not parcial:
+        return jsonify(dict(resumo, importado=False, clientes_criados=0, elevadores_criados=0)), 400
+
+    # Clientes novos: um INSERT com executemany (e RETURNING para obter os ids).
+    novos = {}
+    for dados in aceites:
+        if dados['cliente_id'] is None and dados['cliente'] not in clientes_por_nome:
+            novos.setdefault(dados['cliente'], dados['possui_contrato'])
+    elevadores_criados = 0
+    try:
+        if novos:
+            versao = incrementar_versao_tabela('cliente')
+            tabela = Cliente.__table__
+            for i, nome in db.session.execute(tabela.insert().returning(tabela.c.id, tabela.c.nome), [{'nome': nome, 'possui_contrato': contrato, 'versao': versao} for nome, contrato in novos.items()]):
+                clientes_por_nome[nome] = [i]
+            db.session.commit()
+        linhas = [{'codigo_qr': d['codigo_qr'], 'endereco': d['endereco'], 'latitude': d['latitude'], 'longitude': d['longitude'],
+                   'cliente_id': d['cliente_id'] if d['cliente_id'] is not None else clientes_por_nome[d['cliente']][0]} for d in aceites if d.get('codigo_qr')]
+        for i in range(0, len(linhas), IMPORTACAO_LOTE):
+            lote = linhas[i:i + IMPORTACAO_LOTE]
+            versao = incrementar_versao_tabela('elevador')
+            db.session.execute(Elevador.__table__.insert(), [dict(linha, versao=versao) for linha in lote])
+            db.session.commit()
+            elevadores_criados += len(lote)
+    except IntegrityError as e:
+        # Um codigo_qr gravado por outro pedido entre a validação e a inserção: os lotes anteriores ficam gravados.
+        db.session.rollback()
+        current_app.logger.error(f"Importação interrompida: {e}")
+        return jsonify(dict(resumo, importado=False, clientes_criados=len(novos), elevadores_criados=elevadores_criados, erro='Conflito com dados gravados durante a importação; repita a importação das linhas em falta.')), 409
+    return jsonify(dict(resumo, importado=True, clientes_criados=len(novos), elevadores_criados=elevadores_criados)), 201
+
+@bp.route('/admin/tecnicos', methods=['GET', 'POST'])
 @token_required
 def gerir_tecnicos(current_user):
     if request.method == 'GET':
-        return jsonify([{'id': t.id, 'nome': t.nome, 'username': t.username, 'de_plantao': t.de_plantao} for t in Tecnico.query.order_by(Tecnico.id).all()])
+        consulta = db.session.query(Tecnico.id, Tecnico.nome, Tecnico.username, Tecnico.de_plantao).order_by(Tecnico.id)
+        return resposta_catalogo('tecnico', Tecnico, consulta, lambda t: {'id': t.id, 'nome': t.nome, 'username': t.username, 'de_plantao': t.de_plantao})
     elif request.method == 'POST':
         dados = request.json
         novo_tecnico = Tecnico(nome=dados['nome'], username=dados['username'], password=dados['password'])
         db.session.add(novo_tecnico)
+        registar_alteracao_catalogo('tecnico', alterados=[novo_tecnico])
         db.session.commit()
         return jsonify({'id': novo_tecnico.id, 'nome': novo_tecnico.nome}), 201
 
-@app.route('/admin/tecnico/<int:id>/status', methods=['PUT'])
+@bp.route('/admin/tecnico/<int:id>/status', methods=['PUT'])
 @token_required
 def toggle_tecnico_status(current_user, id):
     tecnico = Tecnico.query.get_or_404(id)
@@ -266,10 +1731,14 @@ def toggle_tecnico_status(current_user, id):
     if novo_status is None:
         return jsonify({'erro': 'Status "de_plantao" é obrigatório.'}), 400
     tecnico.de_plantao = novo_status
+    registar_alteracao_catalogo('tecnico', alterados=[tecnico])
     db.session.commit()
+    sincronizar_tecnico_no_indice(tecnico)
+    if novo_status:
+        despachar_fila()
     return jsonify({'mensagem': f'Status de {tecnico.nome} atualizado para {"de plantão" if novo_status else "inativo"}.'})
 
-@app.route('/admin/tecnico/<int:id>', methods=['PUT', 'DELETE'])
+@bp.route('/admin/tecnico/<int:id>', methods=['PUT', 'DELETE'])
 @token_required
 def gerir_tecnico_especifico(current_user, id):
     tecnico = Tecnico.query.get_or_404(id)
@@ -279,36 +1748,312 @@ def gerir_tecnico_especifico(current_user, id):
         tecnico.username = dados['username']
         if dados.get('password'):
             tecnico.password = dados['password']
+        registar_alteracao_catalogo('tecnico', alterados=[tecnico])
     elif request.method == 'DELETE':
         db.session.delete(tecnico)
+        estado_app().indice_tecnicos.remover(id)
+        registar_alteracao_catalogo('tecnico', removidos=[id])
     db.session.commit()
     return jsonify({'mensagem': 'Operação concluída com sucesso.'})
 
-@app.route('/admin/chamados', methods=['GET'])
+# --- HISTÓRICO DE LOCALIZAÇÕES ---
+HISTORICO_MAXIMO_DIAS = 31
+
+@bp.route('/admin/tecnico/<int:id>/trajeto', methods=['GET'])
 @token_required
-def get_todos_chamados(current_user):
-    query = Chamado.query
-    cliente_id = request.args.get('cliente_id')
-    elevador_id = request.args.get('elevador_id')
-    tecnico_id = request.args.get('tecnico_id')
-    data_inicio = request.args.get('data_inicio')
-    data_fim = request.args.get('data_fim')
+def trajeto_tecnico(current_user, id):
+    """Posições do técnico entre ?inicio= e ?fim= (ISO 8601, UTC; fim por omissão é agora)."""
+    historico_localizacoes = estado_app().historico_localizacoes
+    if not historico_localizacoes:
+        return jsonify({'erro': 'O histórico de localizações está desligado.'}), 501
+    try:
+        inicio = converter_ts(request.args['inicio'])
+        fim = converter_ts(request.args.get('fim'))
+    except (KeyError, ValueError):
+        return jsonify({'erro': 'Indique inicio (e opcionalmente fim) em ISO 8601.'}), 400
+    if not inicio <= fim <= inicio + datetime.timedelta(days=HISTORICO_MAXIMO_DIAS):
+        return jsonify({'erro': f'O intervalo tem de ter entre 0 e {HISTORICO_MAXIMO_DIAS} dias.'}), 400
+    posicoes = [{'ts': ts.isoformat(), 'latitude': lat, 'longitude': lon} for ts, lat, lon in historico_localizacoes.posicoes(id, inicio, fim)]
+    return jsonify({'tecnico_id': id, 'posicoes': formatar_lista(posicoes)})
+
+def resposta_tecnicos_proximos(latitude, longitude, instante):
+    try:
+        instante = converter_ts(request.args.get('instante')) if request.args.get('instante') else instante
+        raio_km = float(request.args.get('raio_km', 2))
+        janela = datetime.timedelta(minutes=float(request.args.get('janela_min', 10)))
+    except ValueError:
+        return jsonify({'erro': 'instante, raio_km ou janela_min inválidos.'}), 400
+    proximos = estado_app().historico_localizacoes.proximos(latitude, longitude, raio_km, instante, janela)
+    nomes = dict(db.session.query(Tecnico.id, Tecnico.nome).filter(Tecnico.id.in_([p[0] for p in proximos]))) if proximos else {}
+    tecnicos = [{'tecnico_id': t, 'nome': nomes.get(t), 'distancia_km': round(d, 3), 'ts': ts.isoformat(), 'latitude': lat, 'longitude': lon} for t, d, ts, lat, lon in proximos]
+    return jsonify({'instante': instante.isoformat(), 'raio_km': raio_km, 'tecnicos': formatar_lista(tecnicos)})
+
+@bp.route('/admin/elevador/<int:id>/tecnicos_proximos', methods=['GET'])
+@token_required
+def tecnicos_proximos_elevador(current_user, id):
+    """Quem estava a até ?raio_km= do elevador em ?instante= (última posição nos ?janela_min= anteriores)."""
+    if not estado_app().historico_localizacoes:
+        return jsonify({'erro': 'O histórico de localizações está desligado.'}), 501
+    elevador = Elevador.query.get_or_404(id)
+    return resposta_tecnicos_proximos(elevador.latitude, elevador.longitude, datetime.datetime.utcnow())
+
+@bp.route('/admin/chamado/<int:chamado_id>/tecnicos_proximos', methods=['GET'])
+@token_required
+def tecnicos_proximos_chamado(current_user, chamado_id):
+    """Como a rota do elevador, no momento em que o chamado foi aberto."""
+    if not estado_app().historico_localizacoes:
+        return jsonify({'erro': 'O histórico de localizações está desligado.'}), 501
+    chamado = db.session.get(Chamado, chamado_id) or db.session.get(ChamadoArquivo, chamado_id)
+    elevador = db.session.get(Elevador, chamado.elevador_id) if chamado else None
+    if elevador is None:
+        return jsonify({'erro': 'Chamado não encontrado.'}), 404
+    return resposta_tecnicos_proximos(elevador.latitude, elevador.longitude, chamado.timestamp)
+
+# Campos disponíveis em /admin/chamados?fields=...: coluna e conversão para JSON. As colunas
+# do chamado vão pelo nome: tanto podem vir de Chamado como de ChamadoArquivo.
+CAMPOS_CHAMADO_ADMIN = {
+    'id_chamado': ('id', None),
+    'status': ('status', None),
+    'endereco': (Elevador.endereco, None),
+    'tecnico_responsavel': (Tecnico.nome, lambda v: v or 'N/A'),
+    'data_abertura': ('timestamp', formatar_data),
+    'descricao': ('descricao_problema', None),
+    'pessoa_presa': ('pessoa_presa', None),
+    'elevador_id': ('elevador_id', None),
+    'tecnico_id': ('tecnico_id', None),
+}
+CAMPOS_CHAMADO_ADMIN_PADRAO = ['id_chamado', 'status', 'endereco', 'tecnico_responsavel', 'data_abertura']
+LIMITE_PAGINA_PADRAO = 100
+LIMITE_PAGINA_MAXIMO = 500
+
+def _coluna_chamado(tabela, coluna):
+    return tabela.c[coluna] if isinstance(coluna, str) else coluna
+
+def _data_filtro(args, nome):
+    return datetime.datetime.strptime(args[nome], '%Y-%m-%d') if args.get(nome) else None
+
+def filtrar_chamados(query, args, tabela=Chamado.__table__):
+    cliente_id = args.get('cliente_id')
+    elevador_id = args.get('elevador_id')
+    tecnico_id = args.get('tecnico_id')
+    data_inicio = _data_filtro(args, 'data_inicio')
+    data_fim = _data_filtro(args, 'data_fim')
 
     if cliente_id:
-        query = query.join(Elevador).filter(Elevador.cliente_id == cliente_id)
+        query = query.filter(tabela.c.elevador_id.in_(db.select(Elevador.id).where(Elevador.cliente_id == cliente_id)))
     if elevador_id:
-        query = query.filter(Chamado.elevador_id == elevador_id)
+        query = query.filter(tabela.c.elevador_id == elevador_id)
     if tecnico_id:
-        query = query.filter(Chamado.tecnico_id == tecnico_id)
+        query = query.filter(tabela.c.tecnico_id == tecnico_id)
     if data_inicio:
-        query = query.filter(Chamado.timestamp >= datetime.datetime.strptime(data_inicio, '%Y-%m-%d'))
+        query = query.filter(tabela.c.timestamp >= data_inicio)
     if data_fim:
-        query = query.filter(Chamado.timestamp <= datetime.datetime.strptime(data_fim, '%Y-%m-%d').replace(hour=23, minute=59, second=59))
+        query = query.filter(tabela.c.timestamp <= data_fim.replace(hour=23, minute=59, second=59))
+    return query
+
+def unir_historico(consultas, *ordem):
+    """Uma consulta por tabela (quente e arquivo) numa só, pela `ordem` dada em nomes de colunas.
+
+    Cada parte já vem filtrada, ordenada e limitada: a base de dados percorre o índice de cada
+    tabela em vez de materializar a união inteira.
+    """
+    if len(consultas) == 1:
+        return consultas[0]
+    uniao = db.union_all(*[db.select(consulta.subquery()) for consulta in consultas]).subquery()
+    return db.select(uniao).order_by(*[uniao.c[nome].desc() if descendente else uniao.c[nome] for nome, descendente in ordem])
+
+def codificar_cursor(timestamp, chamado_id):
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{chamado_id}".encode()).decode().rstrip('=')
+
+def decodificar_cursor(cursor):
+    texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    timestamp, chamado_id = texto.split('|')
+    return datetime.datetime.fromisoformat(timestamp), int(chamado_id)
+
+@bp.route('/admin/chamados', methods=['GET'])
+@token_required
+def get_todos_chamados(current_user):
+    # Sem limit/cursor/fields mantém-se a resposta antiga (lista completa) para clientes existentes.
+    paginado = any(k in request.args for k in ('limit', 'cursor', 'fields'))
+    campos = CAMPOS_CHAMADO_ADMIN_PADRAO
+    if request.args.get('fields'):
+        campos = [c.strip() for c in request.args['fields'].split(',') if c.strip()]
+        desconhecidos = [c for c in campos if c not in CAMPOS_CHAMADO_ADMIN]
+        if desconhecidos or not campos:
+            return jsonify({'erro': f"Campos inválidos: {', '.join(desconhecidos)}. Disponíveis: {', '.join(CAMPOS_CHAMADO_ADMIN)}."}), 400
+    try:
+        limite = min(int(request.args.get('limit', LIMITE_PAGINA_PADRAO)), LIMITE_PAGINA_MAXIMO)
+        cursor = decodificar_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return jsonify({'erro': 'Parâmetros de paginação inválidos.'}), 400
+    if limite < 1:
+        return jsonify({'erro': 'O limite deve ser positivo.'}), 400
+    try:
+        tabelas = tabelas_historico(_data_filtro(request.args, 'data_inicio'))
+    except ValueError:
+        return jsonify({'erro': 'Datas devem estar no formato AAAA-MM-DD.'}), 400
+
+    consultas = []
+    for tabela in tabelas:
+        # id e timestamp vão sempre na consulta: são a chave do cursor.
+        colunas = [tabela.c.id.label('_id'), tabela.c.timestamp.label('_timestamp')] + [_coluna_chamado(tabela, CAMPOS_CHAMADO_ADMIN[c][0]).label(c) for c in campos]
+        query = db.select(*colunas).select_from(tabela)
+        if 'endereco' in campos:
+            query = query.join(Elevador, tabela.c.elevador_id == Elevador.id)
+        if 'tecnico_responsavel' in campos:
+            query = query.outerjoin(Tecnico, tabela.c.tecnico_id == Tecnico.id)
+        query = filtrar_chamados(query, request.args, tabela)
+        if cursor:
+            query = query.filter(tuple_(tabela.c.timestamp, tabela.c.id) < tuple_(*cursor))
+        query = query.order_by(tabela.c.timestamp.desc(), tabela.c.id.desc())
+        consultas.append(query.limit(limite + 1) if paginado else query)
+    query = unir_historico(consultas, ('_timestamp', True), ('_id', True))
+    if paginado:
+        query = query.limit(limite + 1)
+
+    linhas = db.session.execute(query).all()
+    proximo_cursor = None
+    if paginado and len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo_cursor = codificar_cursor(linhas[-1]._timestamp, linhas[-1]._id)
+    conversoes = [(c, CAMPOS_CHAMADO_ADMIN[c][1]) for c in campos]
+    chamados = [{c: (converter(getattr(linha, c)) if converter else getattr(linha, c)) for c, converter in conversoes} for linha in linhas]
+    if not paginado:
+        return jsonify(formatar_lista(chamados))
+    return jsonify({'chamados': formatar_lista(chamados), 'next_cursor': proximo_cursor})
 
-    chamados = query.order_by(Chamado.timestamp.desc()).all()
-    return jsonify([{'id_chamado': c.id, 'status': c.status, 'endereco': c.elevador.endereco, 'tecnico_responsavel': c.tecnico.nome if c.tecnico else 'N/A', 'data_abertura': c.timestamp.strftime('%d/%m/%Y %H:%M')} for c in chamados])
+# Colunas da exportação para faturação, pela ordem em que aparecem no CSV (as do chamado pelo nome).
+COLUNAS_EXPORTACAO = [
+    ('id_chamado', 'id'), ('data_abertura', 'timestamp'), ('status', 'status'), ('pessoa_presa', 'pessoa_presa'),
+    ('descricao', 'descricao_problema'), ('elevador_id', 'elevador_id'), ('codigo_qr', Elevador.codigo_qr), ('endereco', Elevador.endereco),
+    ('cliente_id', Cliente.id), ('cliente', Cliente.nome), ('possui_contrato', Cliente.possui_contrato), ('tecnico_id', 'tecnico_id'),
+    ('tecnico', Tecnico.nome), ('servicos_realizados', 'servicos_realizados'), ('pecas_trocadas', 'pecas_trocadas'),
+    ('observacao_texto', 'observacao_texto'), ('data_finalizacao', 'data_finalizacao'),
+]
+EXPORTACAO_LOTE = 1000
 
-@app.route('/admin/chamado/<int:chamado_id>/atribuir', methods=['POST'])
+def linhas_exportacao(query, formato):
+    nomes = [nome for nome, _ in COLUNAS_EXPORTACAO]
+    saida = io.StringIO()
+    escritor = csv.writer(saida)
+    if formato == 'csv':
+        escritor.writerow(nomes)
+        yield saida.getvalue()
+        saida.seek(0)
+        saida.truncate()
+    # yield_per usa um cursor do lado do servidor no PostgreSQL: a memória não cresce com a exportação.
+    pendentes = 0
+    for linha in db.session.execute(query.execution_options(yield_per=EXPORTACAO_LOTE)):
+        valores = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in linha]
+        if formato == 'csv':
+            escritor.writerow(valores)
+        else:
+            saida.write(json.dumps(dict(zip(nomes, valores)), ensure_ascii=False) + '\n')
+        pendentes += 1
+        if pendentes >= EXPORTACAO_LOTE:
+            yield saida.getvalue()
+            saida.seek(0)
+            saida.truncate()
+            pendentes = 0
+    if formato != 'csv' or pendentes:
+        yield saida.getvalue()
+
+@bp.route('/admin/chamados/exportar', methods=['GET'])
+@token_required
+def exportar_chamados(current_user):
+    formato = request.args.get('formato', 'ndjson')
+    if formato not in ('ndjson', 'csv'):
+        return jsonify({'erro': 'Formato inválido. Use ndjson ou csv.'}), 400
+    consultas = []
+    try:
+        for tabela in tabelas_historico(_data_filtro(request.args, 'data_inicio')):
+            query = db.select(*[_coluna_chamado(tabela, coluna).label(nome) for nome, coluna in COLUNAS_EXPORTACAO]).select_from(tabela).join(Elevador, tabela.c.elevador_id == Elevador.id).join(Cliente, Elevador.cliente_id == Cliente.id).outerjoin(Tecnico, tabela.c.tecnico_id == Tecnico.id)
+            consultas.append(filtrar_chamados(query, request.args, tabela).order_by(tabela.c.timestamp, tabela.c.id))
+    except ValueError:
+        return jsonify({'erro': 'Datas devem estar no formato AAAA-MM-DD.'}), 400
+    query = unir_historico(consultas, ('data_abertura', False), ('id_chamado', False))
+    mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    nome_ficheiro = f"chamados-{datetime.datetime.utcnow():%Y%m%d-%H%M%S}.{formato}"
+    return Response(stream_with_context(linhas_exportacao(query, formato)), content_type=f'{mimetype}; charset=utf-8', headers={'Content-Disposition': f'attachment; filename={nome_ficheiro}'})
+
+# --- BUSCA DE TEXTO NOS CHAMADOS ---
+# Procura em descricao_problema, servicos_realizados, pecas_trocadas e observacao_texto dos
+# chamados quentes e arquivados (índice criado por preparar_busca), por relevância.
+BUSCA_LIMITE_PADRAO = 20
+# Só os BUSCA_CANDIDATOS resultados mais recentes de cada tabela são ordenados por relevância:
+# um termo que aparece em metade dos chamados não obriga a pontuar milhões de linhas.
+BUSCA_CANDIDATOS = int(os.environ.get('BUSCA_CANDIDATOS', 1000))
+
+class BuscaIndisponivel(Exception):
+    """A base de dados não tem busca de texto (só SQLite com FTS5 e PostgreSQL); a rota responde 503."""
+
+def consulta_fts5(texto):
+    """Converte o texto do utilizador numa consulta FTS5 segura: cada palavra é um prefixo
+    (fecha -> fechar, fechado; o FTS5 não tem stemming em português) e "entre aspas" ou
+    códigos como AB-1234 são frases. Todos os termos são obrigatórios."""
+    partes = []
+    for frase, palavra in re.findall(r'"([^"]*)"|(\S+)', texto):
+        tokens = re.findall(r'\w+', frase or palavra)
+        if tokens:
+            partes.append('"' + ' '.join(tokens) + '"' + ('' if frase else '*'))
+    return ' '.join(partes)
+
+def buscar_chamados(texto, args, limite, deslocamento=0):
+    """Uma página de resultados ordenada por relevância (maior primeiro); aceita os filtros de filtrar_chamados."""
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto == 'sqlite':
+        texto = consulta_fts5(texto)
+        fts = db.table('chamado_busca', db.column('rowid'))
+    elif dialeto != 'postgresql':
+        raise BuscaIndisponivel(f"Busca de texto não suportada em {dialeto}.")
+    if not texto:
+        return []
+    consultas = []
+    for tabela in tabelas_historico(_data_filtro(args, 'data_inicio')):
+        if dialeto == 'sqlite':
+            # bm25 é menor para os melhores resultados; pesos por coluna, como o setweight do PostgreSQL.
+            chave, relevancia = fts.c.rowid, -db.literal_column('bm25(chamado_busca, 4.0, 2.0, 2.0, 1.0)')
+            origem, condicao = fts.join(tabela, tabela.c.id == fts.c.rowid), db.text('chamado_busca MATCH :consulta')
+        else:
+            vetor, consulta = db.literal_column(f'{tabela.name}.busca'), func.websearch_to_tsquery(db.literal_column("'upline_pt'"), db.bindparam('consulta'))
+            chave, relevancia, origem, condicao = tabela.c.id, func.ts_rank_cd(vetor, consulta), tabela, vetor.op('@@')(consulta)
+        # O índice cobre as duas tabelas: o teto evita percorrer os chamados quentes ao procurar no arquivo.
+        teto = chave <= db.select(func.max(tabela.c.id)).correlate(None).scalar_subquery()
+        janela = filtrar_chamados(db.select(chave).select_from(origem).where(condicao, teto), args, tabela).order_by(chave.desc()).offset(BUSCA_CANDIDATOS - 1).limit(1).correlate(None)
+        colunas = [tabela.c[c] for c in ('id', 'timestamp', 'status', 'elevador_id', 'tecnico_id') + CAMPOS_BUSCA] + [db.literal(tabela is ChamadoArquivo.__table__).label('arquivado')]
+        query = db.select(*colunas, relevancia.label('relevancia')).select_from(origem).where(condicao, teto, chave >= func.coalesce(janela.scalar_subquery(), 0))
+        query = filtrar_chamados(query, args, tabela)
+        consultas.append(query.order_by(db.desc('relevancia'), tabela.c.id.desc()).limit(deslocamento + limite))
+    query = unir_historico(consultas, ('relevancia', True), ('id', True)).offset(deslocamento).limit(limite)
+    return db.session.execute(query, {'consulta': texto}).all()
+
+@bp.route('/admin/chamados/busca', methods=['GET'])
+@token_required
+def buscar_chamados_rota(current_user):
+    texto = request.args.get('q', '').strip()
+    if not texto:
+        return jsonify({'erro': 'Indique o texto a procurar em ?q=.'}), 400
+    try:
+        limite = min(int(request.args.get('limit', BUSCA_LIMITE_PADRAO)), LIMITE_PAGINA_MAXIMO)
+        deslocamento = int(request.args.get('cursor') or 0)
+    except ValueError:
+        return jsonify({'erro': 'Parâmetros de paginação inválidos.'}), 400
+    if limite < 1 or deslocamento < 0:
+        return jsonify({'erro': 'Parâmetros de paginação inválidos.'}), 400
+    try:
+        linhas = buscar_chamados(texto, request.args, limite + 1, deslocamento)
+    except ValueError:
+        return jsonify({'erro': 'Datas devem estar no formato AAAA-MM-DD.'}), 400
+    except (BuscaIndisponivel, OperationalError) as e:
+        current_app.logger.error(f"Busca de texto indisponível: {e}")
+        return jsonify({'erro': 'Busca de texto indisponível.'}), 503
+    proximo_cursor = str(deslocamento + limite) if len(linhas) > limite else None
+    chamados = [{'id_chamado': c.id, 'status': c.status, 'data_abertura': formatar_data(c.timestamp), 'elevador_id': c.elevador_id, 'tecnico_id': c.tecnico_id,
+                 'descricao': c.descricao_problema, 'servicos_realizados': c.servicos_realizados, 'pecas_trocadas': c.pecas_trocadas, 'observacao_texto': c.observacao_texto,
+                 'arquivado': bool(c.arquivado), 'relevancia': round(float(c.relevancia), 4)} for c in linhas[:limite]]
+    return jsonify({'chamados': formatar_lista(chamados), 'next_cursor': proximo_cursor})
+
+@bp.route('/admin/chamado/<int:chamado_id>/atribuir', methods=['POST'])
 @token_required
 def atribuir_tecnico_chamado(current_user, chamado_id):
     chamado = Chamado.query.get_or_404(chamado_id)
@@ -318,16 +2063,35 @@ def atribuir_tecnico_chamado(current_user, chamado_id):
         return jsonify({'erro': 'ID do técnico é obrigatório.'}), 400
     
     tecnico = Tecnico.query.get_or_404(tecnico_id)
+    # A revisão sobe antes de contar a carga: a partir daqui nenhum despacho reserva este técnico.
+    tabela = Tecnico.__table__
+    db.session.execute(tabela.update().where(tabela.c.id == tecnico.id).values(revisao_despacho=tabela.c.revisao_despacho + 1))
+    carga = db.session.query(func.count(Chamado.id)).filter(Chamado.tecnico_id == tecnico.id, Chamado.status == 'atribuido', Chamado.id != chamado.id).scalar()
+    if carga >= DESPACHO_CARGA_MAXIMA and not dados.get('forcar'):
+        db.session.rollback()
+        return jsonify({'erro': f'{tecnico.nome} já tem {carga} chamados atribuídos (máximo {DESPACHO_CARGA_MAXIMA}).', 'carga': carga, 'carga_maxima': DESPACHO_CARGA_MAXIMA}), 409
     chamado.tecnico_id = tecnico.id
     chamado.status = 'atribuido'
     db.session.commit()
     return jsonify({'mensagem': f'Chamado #{chamado.id} atribuído a {tecnico.nome}.'})
 
-@app.route('/admin/dashboard/stats', methods=['GET'])
+@bp.route('/admin/despacho/rebalancear', methods=['POST'])
+@token_required
+def rebalancear_despacho(current_user):
+    return jsonify(rebalancear_fila())
+
+@bp.route('/admin/cache/estatisticas', methods=['GET'])
+@token_required
+def get_estatisticas_cache(current_user):
+    estado = estado_app()
+    return jsonify({'tokens': estado.cache_tokens.estatisticas(), 'elevadores': estado.cache_elevadores.estatisticas()})
+
+@bp.route('/admin/dashboard/stats', methods=['GET'])
 @token_required
 def get_dashboard_stats(current_user):
     try:
-        base_query = Chamado.query
+        # Tudo sai de resumo_chamado, que tem uma linha por dia/status/técnico/elevador em vez de uma por chamado.
+        base_query = ResumoChamado.query.filter(ResumoChamado.total != 0)
         cliente_id = request.args.get('cliente_id')
         elevador_id = request.args.get('elevador_id')
         tecnico_id = request.args.get('tecnico_id')
@@ -335,49 +2099,272 @@ def get_dashboard_stats(current_user):
         data_fim = request.args.get('data_fim')
 
         if cliente_id:
-            base_query = base_query.join(Elevador).filter(Elevador.cliente_id == cliente_id)
+            base_query = base_query.filter(ResumoChamado.cliente_id == cliente_id)
         if elevador_id:
-            base_query = base_query.filter(Chamado.elevador_id == elevador_id)
+            base_query = base_query.filter(ResumoChamado.elevador_id == elevador_id)
         if tecnico_id:
-            base_query = base_query.filter(Chamado.tecnico_id == tecnico_id)
+            base_query = base_query.filter(ResumoChamado.tecnico_id == tecnico_id)
         if data_inicio:
-            base_query = base_query.filter(Chamado.timestamp >= datetime.datetime.strptime(data_inicio, '%Y-%m-%d'))
+            base_query = base_query.filter(ResumoChamado.dia >= datetime.datetime.strptime(data_inicio, '%Y-%m-%d').date())
         if data_fim:
-            base_query = base_query.filter(Chamado.timestamp <= datetime.datetime.strptime(data_fim, '%Y-%m-%d').replace(hour=23, minute=59, second=59))
+            base_query = base_query.filter(ResumoChamado.dia <= datetime.datetime.strptime(data_fim, '%Y-%m-%d').date())
 
-        status_counts_query = base_query.with_entities(Chamado.status, func.count(Chamado.id)).group_by(Chamado.status)
-        status_counts = status_counts_query.all()
-        chamados_por_status = {status: count for status, count in status_counts}
+        soma = func.sum(ResumoChamado.total)
+        status_counts = base_query.with_entities(ResumoChamado.status, soma).group_by(ResumoChamado.status).having(soma > 0).all()
+        chamados_por_status = {status: int(count) for status, count in status_counts}
 
-        tecnico_counts_query = base_query.join(Tecnico).with_entities(Tecnico.nome, func.count(Chamado.id)).group_by(Tecnico.nome).order_by(func.count(Chamado.id).desc())
-        tecnico_counts = tecnico_counts_query.all()
-        chamados_por_tecnico = {nome: count for nome, count in tecnico_counts}
+        tecnico_counts = base_query.join(Tecnico, ResumoChamado.tecnico_id == Tecnico.id).with_entities(Tecnico.nome, soma).group_by(Tecnico.nome).having(soma > 0).order_by(soma.desc()).all()
+        chamados_por_tecnico = {nome: int(count) for nome, count in tecnico_counts}
 
-        chamados_mes_result = base_query.with_entities(extract('year', Chamado.timestamp).label('ano'), extract('month', Chamado.timestamp).label('mes'), func.count(Chamado.id)).group_by('ano', 'mes').order_by('ano', 'mes').all()
-        chamados_por_mes = [{'mes': f"{int(mes):02d}/{int(ano)}", 'total': total} for ano, mes, total in chamados_mes_result]
+        chamados_mes_result = base_query.with_entities(extract('year', ResumoChamado.dia).label('ano'), extract('month', ResumoChamado.dia).label('mes'), soma).group_by('ano', 'mes').having(soma > 0).order_by('ano', 'mes').all()
+        chamados_por_mes = [{'mes': f"{int(mes):02d}/{int(ano)}", 'total': int(total)} for ano, mes, total in chamados_mes_result]
 
-        total_chamados_filtrado = base_query.count()
+        total_chamados_filtrado = int(base_query.with_entities(soma).scalar() or 0)
         total_tecnicos = Tecnico.query.count()
-        total_elevadores = Elevador.query.count()
+        total_elevadores = Elevador.query.filter(Elevador.removido_em.is_(None)).count()
 
         return jsonify({
             'total_chamados': total_chamados_filtrado, 'total_tecnicos': total_tecnicos, 'total_elevadores': total_elevadores,
             'chamados_por_status': chamados_por_status, 'chamados_por_tecnico': chamados_por_tecnico, 'chamados_por_mes': chamados_por_mes
         })
     except Exception as e:
-        app.logger.error(f"Erro ao gerar estatísticas do dashboard: {e}")
+        current_app.logger.error(f"Erro ao gerar estatísticas do dashboard: {e}")
         return jsonify({"erro": "Não foi possível carregar as estatísticas."}), 500
 
+# --- MIGRAÇÃO DO ESQUEMA ---
+# db.create_all() só cria tabelas novas. migrar_esquema compara os modelos com a base de
+# dados e aplica as alterações aditivas em falta: tabelas, colunas anuláveis (ou com
+# server_default) e índices. Alterações destrutivas continuam a ser feitas à mão.
+def migrar_esquema(executar=True):
+    alteracoes = []
+    with db.engine.begin() as conexao:
+        inspetor = inspect(conexao)
+        preparador = conexao.dialect.identifier_preparer
+        existentes = set(inspetor.get_table_names())
+        # As rejeições passaram de evento_chamado (que é podado) para a sua tabela.
+        copiar_rejeicoes = 'evento_chamado' in existentes and 'rejeicao_chamado' not in existentes
+        for tabela in db.metadata.sorted_tables:
+            if tabela.name not in existentes:
+                alteracoes.append(f"CREATE TABLE {tabela.name}")
+                if executar:
+                    tabela.create(conexao)
+                continue
+            colunas = {c['name'] for c in inspetor.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name in colunas:
+                    continue
+                if not coluna.nullable and coluna.server_default is None:
+                    raise RuntimeError(f"A coluna {tabela.name}.{coluna.name} é NOT NULL sem server_default; migre-a manualmente.")
+                ddl = f"ALTER TABLE {preparador.quote(tabela.name)} ADD COLUMN {preparador.quote(coluna.name)} {coluna.type.compile(dialect=conexao.dialect)}"
+                if coluna.server_default is not None:
+                    ddl += f" DEFAULT {coluna.server_default.arg.compile(dialect=conexao.dialect) if hasattr(coluna.server_default.arg, 'compile') else coluna.server_default.arg}"
+                alteracoes.append(ddl)
+                if executar:
+                    conexao.execute(db.text(ddl))
+            indices = {i['name'] for i in inspetor.get_indexes(tabela.name)}
+            for indice in tabela.indexes:
+                if indice.name not in indices:
+                    alteracoes.append(f"CREATE INDEX {indice.name} ON {tabela.name}")
+                    if executar:
+                        indice.create(conexao)
+        if copiar_rejeicoes:
+            alteracoes.append("Copiar as rejeições de evento_chamado para rejeicao_chamado")
+        if copiar_rejeicoes and executar:
+            conexao.execute(RejeicaoChamado.__table__.insert().from_select(['chamado_id', 'tecnico_id', 'criado_em'],
+                db.select(EventoChamado.chamado_id, EventoChamado.tecnico_id, func.min(EventoChamado.criado_em)).where(EventoChamado.tipo == 'rejeitado').group_by(EventoChamado.chamado_id, EventoChamado.tecnico_id)))
+        alteracoes.extend(normalizar_datas_sqlite(conexao, executar))
+        alteracoes.extend(preparar_busca(conexao, executar))
+    return alteracoes
+
+# Os chamados gravados pelo server_default (func.now()) do SQLite ficaram como 'AAAA-MM-DD HH:MM:SS',
+# sem os microssegundos que o SQLAlchemy escreve. As datas são texto no SQLite e a forma curta é
+# sempre "menor": o cursor de /admin/chamados e os filtros por data compará-las-iam mal.
+DATAS_A_NORMALIZAR = (('chamado', 'timestamp'), ('chamado', 'data_finalizacao'), ('chamado_arquivo', 'timestamp'), ('chamado_arquivo', 'data_finalizacao'))
+
+def normalizar_datas_sqlite(conexao, executar=True):
+    if conexao.dialect.name != 'sqlite':
+        return []
+    alteracoes = []
+    for tabela, coluna in DATAS_A_NORMALIZAR:
+        curtas = f"FROM {tabela} WHERE length({coluna}) = 19"
+        total = conexao.exec_driver_sql(f"SELECT count(*) {curtas}").scalar()
+        if total:
+            alteracoes.append(f"Normalizar {total} datas em {tabela}.{coluna}")
+            if executar:
+                conexao.exec_driver_sql(f"UPDATE {tabela} SET {coluna} = {coluna} || '.000000' WHERE length({coluna}) = 19")
+    return alteracoes
+
+# Busca de texto. SQLite: um só índice FTS5 para chamado e chamado_arquivo (o bm25 usa as
+# estatísticas de todos os documentos), lido da vista chamado_busca_origem e mantido por
+# triggers; arquivar um chamado não o tira nem volta a pôr no índice. PostgreSQL: coluna
+# tsvector gerada (português, sem acentos) com índice GIN em cada tabela; acrescentá-la
+# reescreve a tabela, por isso só acontece em 'flask esquema inicializar/migrar'.
+CAMPOS_BUSCA = ('descricao_problema', 'servicos_realizados', 'pecas_trocadas', 'observacao_texto')
+VETOR_BUSCA_PG = ("setweight(to_tsvector('upline_pt', coalesce(descricao_problema, '')), 'A') || "
+                  "setweight(to_tsvector('upline_pt', coalesce(servicos_realizados, '') || ' ' || coalesce(pecas_trocadas, '')), 'B') || "
+                  "setweight(to_tsvector('upline_pt', coalesce(observacao_texto, '')), 'C')")
+
+def _ddl_busca_sqlite():
+    campos = ', '.join(CAMPOS_BUSCA)
+    inserir = f"INSERT INTO chamado_busca(rowid, {campos}) SELECT new.id, {', '.join('new.' + c for c in CAMPOS_BUSCA)}"
+    apagar = f"INSERT INTO chamado_busca(chamado_busca, rowid, {campos}) SELECT 'delete', old.id, {', '.join('old.' + c for c in CAMPOS_BUSCA)}"
+    ddl = [('chamado_busca_origem', f"CREATE VIEW chamado_busca_origem AS SELECT id, {campos} FROM chamado UNION ALL SELECT id, {campos} FROM chamado_arquivo"),
+           ('chamado_busca', f"CREATE VIRTUAL TABLE chamado_busca USING fts5({campos}, content='chamado_busca_origem', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='3 4 5 6')")]
+    # Um chamado só entra/sai do índice se não estiver na outra tabela: mover para o arquivo
+    # (INSERT no arquivo e depois DELETE em chamado) não mexe no índice.
+    for tabela, outra in (('chamado', 'chamado_arquivo'), ('chamado_arquivo', 'chamado')):
+        ddl += [(f'{tabela}_busca_ai', f"CREATE TRIGGER {tabela}_busca_ai AFTER INSERT ON {tabela} BEGIN {inserir} WHERE NOT EXISTS (SELECT 1 FROM {outra} WHERE id = new.id); END"),
+                (f'{tabela}_busca_au', f"CREATE TRIGGER {tabela}_busca_au AFTER UPDATE OF {campos} ON {tabela} BEGIN {apagar}; {inserir}; END"),
+                (f'{tabela}_busca_ad', f"CREATE TRIGGER {tabela}_busca_ad AFTER DELETE ON {tabela} BEGIN {apagar} WHERE NOT EXISTS (SELECT 1 FROM {outra} WHERE id = old.id); END")]
+    return ddl
+
+def preparar_busca(conexao, executar=True):
+    """Cria o que faltar do índice de texto; devolve as alterações (vazia noutros dialetos)."""
+    dialeto = conexao.dialect.name
+    passos = []
+    if dialeto == 'sqlite':
+        existentes = {nome for (nome,) in conexao.exec_driver_sql("SELECT name FROM sqlite_master")}
+        passos = [(ddl.split(nome)[0] + nome, ddl) for nome, ddl in _ddl_busca_sqlite() if nome not in existentes]
+        if 'chamado_busca' not in existentes:
+            passos.append(("Indexar os chamados existentes em chamado_busca", "INSERT INTO chamado_busca(chamado_busca) VALUES('rebuild')"))
+    elif dialeto == 'postgresql':
+        if not conexao.exec_driver_sql("SELECT 1 FROM pg_ts_config WHERE cfgname = 'upline_pt'").first():
+            passos += [("CREATE EXTENSION unaccent", "CREATE EXTENSION IF NOT EXISTS unaccent"),
+                       ("CREATE TEXT SEARCH CONFIGURATION upline_pt", "CREATE TEXT SEARCH CONFIGURATION upline_pt (COPY = pg_catalog.portuguese)"),
+                       ("ALTER TEXT SEARCH CONFIGURATION upline_pt", "ALTER TEXT SEARCH CONFIGURATION upline_pt ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem")]
+        inspetor = inspect(conexao)
+        for tabela in ('chamado', 'chamado_arquivo'):
+            if 'busca' not in {c['name'] for c in inspetor.get_columns(tabela)}:
+                passos.append((f"ALTER TABLE {tabela} ADD COLUMN busca", f"ALTER TABLE {tabela} ADD COLUMN busca tsvector GENERATED ALWAYS AS ({VETOR_BUSCA_PG}) STORED"))
+            if f'ix_{tabela}_busca' not in {i['name'] for i in inspetor.get_indexes(tabela)}:
+                passos.append((f"CREATE INDEX ix_{tabela}_busca ON {tabela}", f"CREATE INDEX ix_{tabela}_busca ON {tabela} USING gin (busca)"))
+    if executar and passos:
+        try:
+            with conexao.begin_nested():
+                for _, ddl in passos:
+                    conexao.exec_driver_sql(ddl)
+        except Exception as e:
+            # Sem FTS5 no SQLite ou sem permissão para a extensão no PostgreSQL: o resto da migração continua.
+            current_app.logger.error(f"Índice de busca de texto não criado; /admin/chamados/busca fica indisponível: {e}")
+            return [f"{descricao} (falhou)" for descricao, _ in passos]
+    return [descricao for descricao, _ in passos]
+
+# --- COMANDOS DE MANUTENÇÃO (flask --app app:criar_app <comando>) ---
+esquema_cli = AppGroup('esquema', help='Migração e inicialização da base de dados.')
+
+@esquema_cli.command('migrar')
+@click.option('--simular', is_flag=True, help='Apenas lista as alterações, sem as aplicar.')
+def migrar_esquema_comando(simular):
+    """Cria as tabelas, colunas e índices que faltam na base de dados."""
+    alteracoes = migrar_esquema(executar=not simular)
+    for alteracao in alteracoes:
+        click.echo(alteracao)
+    click.echo(f"{len(alteracoes)} alterações {'pendentes' if simular else 'aplicadas'}.")
+
+resumos_cli = AppGroup('resumos', help='Contadores pré-agregados do dashboard.')
+
+@resumos_cli.command('reconstruir')
+def reconstruir_resumos_comando():
+    """Recalcula resumo_chamado a partir de todos os chamados existentes."""
+    click.echo(f"{reconstruir_resumos()} linhas de resumo gravadas.")
+
+@resumos_cli.command('verificar')
+def verificar_resumos_comando():
+    """Compara os resumos com a agregação direta sobre Chamado."""
+    divergencias = verificar_resumos()
+    for chave, (vivo, resumo) in sorted(divergencias.items(), key=str):
+        click.echo(f"{chave}: chamados={vivo} resumo={resumo}")
+    if divergencias:
+        raise click.ClickException(f"{len(divergencias)} chaves divergentes. Execute 'flask resumos reconstruir'.")
+    click.echo("Resumos consistentes com os chamados.")
+
+despacho_cli = AppGroup('despacho', help='Fila de despacho de chamados.')
+
+@despacho_cli.command('rebalancear')
+@click.option('--limite', type=int, default=DESPACHO_REBALANCEAR_MAXIMO, show_default=True, help='Máximo de chamados da fila considerados.')
+def rebalancear_fila_comando(limite):
+    """Atribui de uma vez todos os chamados em aberto aos técnicos de plantão com lugar livre."""
+    resumo = rebalancear_fila(limite=limite)
+    click.echo(', '.join(f"{chave}={valor}" for chave, valor in resumo.items()))
+
+arquivo_cli = AppGroup('arquivo', help='Arquivo dos chamados finalizados antigos.')
+
+@arquivo_cli.command('executar')
+@click.option('--dias', type=int, default=ARQUIVO_DIAS, show_default=True, help='Arquiva os chamados finalizados há mais destes dias.')
+@click.option('--lote', type=int, default=ARQUIVO_LOTE, show_default=True, help='Chamados movidos por transação.')
+@click.option('--maximo', type=int, default=None, help='Para depois de mover este número de chamados.')
+@click.option('--eventos-dias', type=float, default=EVENTOS_RETENCAO_DIAS, show_default=True, help='Apaga os eventos dos técnicos com mais destes dias.')
+def arquivar_chamados_comando(dias, lote, maximo, eventos_dias):
+    """Move os chamados finalizados antigos para chamado_arquivo, lote a lote, e poda os eventos."""
+    inicio = time.perf_counter()
+    movidos = arquivar_chamados(dias=dias, lote=lote, maximo=maximo, pausa=ARQUIVO_PAUSA)
+    eventos, rejeicoes = podar_eventos(dias=eventos_dias, lote=lote, pausa=ARQUIVO_PAUSA)
+    click.echo(f"{movidos} chamados arquivados, {eventos} eventos e {rejeicoes} rejeições apagados em {time.perf_counter() - inicio:.1f}s.")
+
+localizacoes_cli = AppGroup('localizacoes', help='Histórico de localizações dos técnicos.')
+
+@localizacoes_cli.command('manter')
+@click.option('--dias-completos', type=int, default=LOCALIZACAO_HISTORICO_DIAS_COMPLETOS, show_default=True, help='Dias recentes guardados com todas as amostras.')
+@click.option('--intervalo', type=int, default=LOCALIZACAO_HISTORICO_INTERVALO, show_default=True, help='Segundos entre amostras de um técnico nos dias mais antigos.')
+@click.option('--retencao', type=int, default=LOCALIZACAO_HISTORICO_RETENCAO_DIAS, show_default=True, help='Apaga os dias com mais destes dias (0 = nunca).')
+def manter_historico_localizacoes_comando(dias_completos, intervalo, retencao):
+    """Compacta os dias antigos do histórico e apaga os que passaram da retenção."""
+    historico_localizacoes = estado_app().historico_localizacoes
+    if not historico_localizacoes:
+        raise click.ClickException('LOCALIZACAO_HISTORICO_DIR está vazio: o histórico está desligado.')
+    inicio = time.perf_counter()
+    resumo = historico_localizacoes.manter(datetime.datetime.utcnow().date(), dias_completos, intervalo, retencao)
+    click.echo(f"{resumo['dias_compactados']} dias compactados ({resumo['registos_antes']} -> {resumo['registos_depois']} amostras), "
+               f"{resumo['dias_apagados']} dias apagados em {time.perf_counter() - inicio:.1f}s.")
+
+purgas_cli = AppGroup('purgas', help='Remoção em lotes dos clientes e elevadores apagados.')
+
+@purgas_cli.command('executar')
+@click.option('--lote', type=int, default=PURGA_LOTE, show_default=True, help='Chamados apagados por transação.')
+def executar_purgas_comando(lote):
+    """Termina as purgas pendentes, interrompidas ou com erro."""
+    inicio = time.perf_counter()
+    resultados = executar_purgas_pendentes(lote=lote, pausa=PURGA_PAUSA)
+    for purga_id, apagados in resultados.items():
+        click.echo(f"Purga #{purga_id}: {apagados} chamados apagados.")
+    click.echo(f"{len(resultados)} purgas concluídas em {time.perf_counter() - inicio:.1f}s.")
+
+chamados_cli = AppGroup('chamados', help='Abertura de chamados.')
+
+@chamados_cli.command('limpar-chaves')
+def limpar_chaves_idempotencia_comando():
+    """Apaga as chaves de idempotência com mais de CHAMADO_IDEMPOTENCIA_HORAS."""
+    click.echo(f"{limpar_chaves_idempotencia()} chaves de idempotência expiradas apagadas.")
+
+tempos_cli = AppGroup('tempos', help='Grelhas de tempos de viagem para o despacho.')
+
+@tempos_cli.command('construir')
+@click.argument('entrada', type=click.Path(exists=True, dir_okay=False))
+@click.argument('saida', type=click.Path(dir_okay=False))
+@click.option('--celula', type=float, default=0.01, show_default=True, help='Lado de cada célula, em graus.')
+@click.option('--limites', nargs=4, type=float, default=None, metavar='LAT_MIN LAT_MAX LON_MIN LON_MAX', help='Área da grelha (por omissão, a do CSV).')
+def construir_tempos_comando(entrada, saida, celula, limites):
+    """Gera a grelha binária SAIDA a partir de um CSV lat_origem,lon_origem,lat_destino,lon_destino,segundos."""
+    try:
+        resumo = construir_de_csv(entrada, saida, celula=celula, limites=limites or None)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(', '.join(f"{chave}={valor}" for chave, valor in resumo.items()))
+    click.echo(f"Acrescente {os.path.abspath(saida)} a TEMPOS_VIAGEM_FICHEIROS para o despacho usar estes tempos.")
+
 # --- LÓGICA DE INICIALIZAÇÃO DA APLICAÇÃO ---
-with app.app_context():
-    db.create_all()
+def inicializar_base_dados():
+    """Migra o esquema e cria o que faltar: admin padrão, dados de exemplo, resumos e versões
+    dos catálogos. Idempotente; corre uma vez por deploy ('flask esquema inicializar') e não
+    em cada worker, que assim não disputam a mesma base de dados nova. Devolve os passos feitos."""
+    passos = [f"Esquema: {alteracao}" for alteracao in migrar_esquema()]
     if not Admin.query.first():
-        print("Criando utilizador admin padrão...")
+        passos.append("Criando utilizador admin padrão...")
         admin_user = Admin(username='admin', password='password')
         db.session.add(admin_user)
         db.session.commit()
     if not Cliente.query.first():
-        print("Base de dados vazia. Populando com dados de exemplo...")
+        passos.append("Base de dados vazia. Populando com dados de exemplo...")
         c1 = Cliente(nome='Condomínio Edifício Central', possui_contrato=True)
         c2 = Cliente(nome='Shopping Plaza Norte', possui_contrato=True)
         c3 = Cliente(nome='Torre Empresarial Faria Lima', possui_contrato=True)
@@ -391,7 +2378,74 @@ with app.app_context():
         t3 = Tecnico(nome='João Pereira', username='joao', password='123', de_plantao=False)
         db.session.add_all([t1, t2, t3])
         db.session.commit()
-        print("Banco de dados inicializado com dados de exemplo.")
+        passos.append("Banco de dados inicializado com dados de exemplo.")
+    if not ResumoChamado.query.first() and Chamado.query.first():
+        passos.append("Preenchendo resumos do dashboard a partir dos chamados existentes...")
+        reconstruir_resumos()
+    for nome in TABELAS_CATALOGO:
+        if not db.session.get(VersaoTabela, nome):
+            db.session.add(VersaoTabela(nome=nome, versao=0))
+    db.session.commit()
+    return passos
+
+@esquema_cli.command('inicializar')
+def inicializar_base_dados_comando():
+    """Prepara a base de dados para o arranque dos workers (esquema, admin, dados de exemplo)."""
+    inicio = time.perf_counter()
+    for passo in inicializar_base_dados():
+        click.echo(passo)
+    click.echo(f"Base de dados pronta em {time.perf_counter() - inicio:.2f}s.")
+
+# --- ESTADO EM MEMÓRIA DE CADA APP ---
+# Tudo o que vive em memória entre pedidos fica num EstadoUpline em app.extensions['upline'],
+# criado por criar_app: duas apps no mesmo processo (testes, benchmarks) não partilham índice,
+# caches, buffer de localizações nem métricas. Os listeners da sessão e dos modelos são
+# registados uma vez, no import, e chegam ao estado pela app do contexto.
+class EstadoUpline:
+    def __init__(self, app):
+        self.indice_tecnicos = IndiceEspacial(tamanho_celula=INDICE_TECNICOS_CELULA)
+        self.tempos_viagem = TemposViagem()
+        self.versoes_conhecidas = {}
+        self.cache_elevadores = CacheTTL(tamanho_maximo=ELEVADOR_CACHE_MAXIMO, ttl=ELEVADOR_CACHE_TTL)
+        self.cache_tokens = CacheTTL(tamanho_maximo=TOKEN_CACHE_MAXIMO, ttl=TOKEN_CACHE_TTL)
+        self.historico_localizacoes = HistoricoLocalizacoes(LOCALIZACAO_HISTORICO_DIR)
+        self.buffer_localizacoes = BufferLocalizacoes(partial(gravar_localizacoes, app), intervalo=LOCALIZACAO_FLUSH_INTERVALO, tamanho_maximo=LOCALIZACAO_FLUSH_MAXIMO,
+                                                      gravar_historico=partial(gravar_historico_localizacoes, app) if self.historico_localizacoes else None)
+        self.aviso_eventos = threading.Condition()
+        self.threads_lock = threading.Lock()
+        self.thread_arquivo = None
+        self.thread_purgas = None
+        self.purgas_pedidas = threading.Event()
+        registar_metricas(self)
+
+def estado_app(app=None):
+    return (app or current_app).extensions['upline']
+
+def criar_app(config=None):
+    """Cria e configura a app. Não faz nenhuma consulta: o engine só liga no primeiro pedido."""
+    app = Flask(__name__)
+    app.json = ProvedorJSON(app)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'sua-chave-secreta-super-segura')
+    app.config['SQLALCHEMY_DATABASE_URI'] = url_base_dados()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', opcoes_engine(app.config['SQLALCHEMY_DATABASE_URI']))
+    CORS(app, resources={r"/*": {"origins": "*"}})
+    db.init_app(app)
+    app.extensions['upline'] = EstadoUpline(app)
+    app.register_blueprint(bp)
+    for grupo in (esquema_cli, resumos_cli, despacho_cli, arquivo_cli, localizacoes_cli, purgas_cli, chamados_cli, tempos_cli):
+        app.cli.add_command(grupo)
+    with app.app_context():
+        configurar_engine(db.engine)
+        instrumentar_engine(db.engine)
+    abrir_tempos_viagem(app)
+    atexit.register(flush_localizacoes_ao_sair, app)
+    return app
 
 if __name__ == '__main__':
+    app = criar_app()
+    with app.app_context():
+        for passo in inicializar_base_dados():
+            print(passo)
     app.run(debug=True, host='0.0.0.0')
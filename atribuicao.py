@@ -0,0 +1,55 @@
+# atribuicao.py
+# Atribuição em lote de chamados a técnicos com capacidade limitada, sobre uma matriz de distâncias
+
+import numpy as np
+
+def _melhor_coluna(distancias, linhas, extra, bloco=64):
+    """argmin e mínimo de distancias[linhas] + extra, por blocos de linhas que cabem na cache."""
+    escolha = np.empty(len(linhas), dtype=np.int64)
+    valor = np.empty(len(linhas), dtype=distancias.dtype)
+    reserva = np.empty((bloco, distancias.shape[1]), dtype=distancias.dtype)
+    for i in range(0, len(linhas), bloco):
+        custo = reserva[:len(linhas[i:i + bloco])]
+        np.take(distancias, linhas[i:i + bloco], axis=0, out=custo)
+        custo += extra
+        escolha[i:i + bloco] = melhor = custo.argmin(axis=1)
+        valor[i:i + bloco] = custo[np.arange(len(custo)), melhor]
+    return escolha, valor
+
+def atribuir_em_lote(distancias, cargas, capacidade, penalidade, prioridades=None):
+    """Atribui linhas (chamados) a colunas (técnicos) minimizando distancia + penalidade * carga.
+
+    `distancias` é uma matriz n x m com np.inf nos pares proibidos; `cargas` é a carga atual
+    de cada técnico e nenhum passa de `capacidade`. As linhas com maior `prioridades` são
+    todas servidas antes das restantes. Em cada ronda cada linha propõe-se à coluna mais
+    barata e cada coluna aceita só a proposta mais barata, o que mantém a penalidade exata;
+    é um emparelhamento guloso, não o ótimo do problema de transporte.
+    Devolve (coluna de cada linha, -1 se ficou por atribuir; novas cargas).
+    """
+    cargas = np.array(cargas, dtype=np.int64)
+    extra = np.where(cargas >= capacidade, np.inf, penalidade * cargas).astype(distancias.dtype)
+    escolhas = np.full(distancias.shape[0], -1, dtype=np.int64)
+    if prioridades is None:
+        niveis = [np.arange(distancias.shape[0])]
+    else:
+        prioridades = np.asarray(prioridades)
+        niveis = [np.flatnonzero(prioridades == p) for p in np.unique(prioridades)[::-1]]
+    for pendentes in niveis:
+        while pendentes.size:
+            escolha, valor = _melhor_coluna(distancias, pendentes, extra)
+            possiveis = np.isfinite(valor)
+            if not possiveis.any():
+                break
+            linhas = np.flatnonzero(possiveis)
+            ordem = linhas[np.lexsort((valor[linhas], escolha[linhas]))]
+            colunas = escolha[ordem]
+            primeira = np.ones(len(ordem), dtype=bool)
+            primeira[1:] = colunas[1:] != colunas[:-1]
+            aceites, colunas = ordem[primeira], colunas[primeira]
+            escolhas[pendentes[aceites]] = colunas
+            cargas[colunas] += 1
+            extra[colunas] = np.where(cargas[colunas] >= capacidade, np.inf, penalidade * cargas[colunas])
+            # Linhas sem nenhum técnico possível saem da ronda seguinte.
+            possiveis[aceites] = False
+            pendentes = pendentes[possiveis]
+    return escolhas, cargas
@@ -0,0 +1,164 @@
+# benchmarks/bench_abertura_idempotente.py
+# Simula "tempestades" de QR code (várias pessoas a relatar o mesmo elevador ao mesmo tempo)
+# e repetições do chatbot com a mesma Idempotency-Key, em várias threads contra a app. Compara
+# chamados criados, escritas na base de dados e despachos com e sem deduplicação, e confirma
+# que cada elevador fica com um só chamado, que um relato com pessoa presa escala o chamado
+# existente e que repetições simultâneas com a mesma chave devolvem todas o mesmo chamado.
+# Uso: python benchmarks/bench_abertura_idempotente.py [--elevadores 200] [--relatos 8] [--threads 12]
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-abertura-'), 'abertura.db')
+# A fase sem deduplicação disputa o SQLite de propósito; os avisos de SQL lenta só enchem a saída.
+os.environ.setdefault('SQL_LENTA_SEGUNDOS', '5')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event, func
+import app as upline
+from app import db, Cliente, Elevador, Tecnico, Chamado, EventoChamado
+
+app = upline.criar_app()
+
+escritas = {'total': 0}
+bloqueio_contagem = threading.Lock()
+
+def contar_escritas(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+        with bloqueio_contagem:
+            escritas['total'] += 1
+
+def popular(args, rng):
+    with app.app_context():
+        upline.inicializar_base_dados()
+        cliente = Cliente(nome='Cliente Tempestade', possui_contrato=True)
+        db.session.add(cliente)
+        db.session.flush()
+        db.session.execute(Elevador.__table__.insert(), [{'codigo_qr': f'QR-{i}', 'endereco': f'Rua {i}', 'latitude': -23.5 + rng.uniform(-0.3, 0.3), 'longitude': -46.6 + rng.uniform(-0.3, 0.3), 'cliente_id': cliente.id} for i in range(args.elevadores * 2)])
+        db.session.execute(Tecnico.__table__.insert(), [{'nome': f'Técnico {i}', 'username': f'tempestade{i}', 'password': 'x', 'de_plantao': True, 'last_latitude': -23.5 + rng.uniform(-0.3, 0.3), 'last_longitude': -46.6 + rng.uniform(-0.3, 0.3)} for i in range(args.tecnicos)])
+        db.session.commit()
+        event.listen(db.engine, 'before_cursor_execute', contar_escritas)
+
+def em_paralelo(pedidos, threads):
+    """Executa [(json, cabeçalhos)] em POST /chamado/abrir; devolve [(status, corpo, segundos)]."""
+    locais = threading.local()
+    def executar(pedido):
+        if not hasattr(locais, 'cliente'):
+            locais.cliente = app.test_client()
+        corpo, cabecalhos = pedido
+        inicio = time.perf_counter()
+        resposta = locais.cliente.post('/chamado/abrir', json=corpo, headers=cabecalhos)
+        return resposta.status_code, resposta.get_json(), time.perf_counter() - inicio
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(executar, pedidos))
+
+def tempestade(args, rng, elevadores, presos):
+    """Cada elevador recebe `relatos` relatos intercalados com os dos outros; nos de `presos` um deles tem pessoa presa."""
+    pedidos = []
+    for i in elevadores:
+        preso = rng.randrange(args.relatos) if i in presos else -1
+        pedidos += [({'codigo_qr': f'QR-{i}', 'pessoa_presa': r == preso, 'descricao': 'Elevador parado'}, {}) for r in range(args.relatos)]
+    rng.shuffle(pedidos)
+    return pedidos
+
+def medir(rotulo, args, pedidos):
+    despachos = {'total': 0}
+    despachar = upline.despachar_fila
+    def contar_despacho(*a, **k):
+        with bloqueio_contagem:
+            despachos['total'] += 1
+        return despachar(*a, **k)
+    upline.despachar_fila = contar_despacho
+    with app.app_context():
+        antes = db.session.query(func.count(Chamado.id)).scalar()
+    escritas['total'] = 0
+    inicio = time.perf_counter()
+    resultados = em_paralelo(pedidos, args.threads)
+    duracao = time.perf_counter() - inicio
+    upline.despachar_fila = despachar
+    with app.app_context():
+        criados = db.session.query(func.count(Chamado.id)).scalar() - antes
+    tempos = sorted(t for _, _, t in resultados)
+    print(f"{rotulo:<24} {len(pedidos)} relatos em {duracao:.1f}s, p50 {statistics.median(tempos) * 1000:.1f} ms: "
+          f"{criados} chamados criados, {escritas['total']} escritas SQL, {despachos['total']} despachos")
+    return resultados, criados
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--elevadores', type=int, default=200)
+    parser.add_argument('--relatos', type=int, default=8, help='relatos por elevador em cada tempestade')
+    parser.add_argument('--tecnicos', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    falhas = []
+    popular(args, rng)
+    presos = set(rng.sample(range(args.elevadores * 2), args.elevadores // 2))
+
+    # Sem deduplicação (o comportamento anterior): um chamado e um despacho por relato.
+    upline.CHAMADO_DEDUP_MINUTOS = 0
+    _, criados = medir('sem deduplicação', args, tempestade(args, rng, range(args.elevadores), presos))
+    if criados != args.elevadores * args.relatos:
+        falhas.append(f"sem deduplicação foram criados {criados} chamados")
+
+    upline.CHAMADO_DEDUP_MINUTOS = 30
+    elevadores = range(args.elevadores, args.elevadores * 2)
+    resultados, criados = medir('com deduplicação', args, tempestade(args, rng, elevadores, presos))
+    if criados != args.elevadores:
+        falhas.append(f"com deduplicação foram criados {criados} chamados para {args.elevadores} elevadores")
+    if any(status not in (200, 201) for status, _, _ in resultados):
+        falhas.append(f"{sum(1 for status, _, _ in resultados if status not in (200, 201))} relatos falharam")
+    with app.app_context():
+        elevador_ids = [e for (e,) in db.session.query(Elevador.id).filter(Elevador.codigo_qr.in_([f'QR-{i}' for i in elevadores]))]
+        por_elevador = dict(db.session.query(Chamado.elevador_id, func.count(Chamado.id)).filter(Chamado.elevador_id.in_(elevador_ids)).group_by(Chamado.elevador_id).all())
+        presa = {codigo: bool(p) for codigo, p in db.session.query(Elevador.codigo_qr, Chamado.pessoa_presa).join(Chamado, Chamado.elevador_id == Elevador.id).filter(Elevador.id.in_(elevador_ids))}
+        atribuicoes = db.session.query(EventoChamado.chamado_id, func.count()).filter(EventoChamado.tipo == 'atribuido').group_by(EventoChamado.chamado_id).having(func.count() > 1).all()
+    if any(n != 1 for n in por_elevador.values()) or len(por_elevador) != args.elevadores:
+        falhas.append("há elevadores com mais de um chamado (ou sem nenhum)")
+    if any(presa[f'QR-{i}'] != (i in presos) for i in elevadores):
+        falhas.append("a pessoa presa não escalou o chamado existente (ou escalou o errado)")
+    if atribuicoes:
+        falhas.append(f"{len(atribuicoes)} chamados atribuídos mais do que uma vez")
+    for status, resposta, _ in resultados:
+        if status == 201 and resposta.get('duplicado'):
+            falhas.append("uma resposta 201 veio marcada como duplicada")
+
+    # Repetições do chatbot: a mesma chave enviada várias vezes em simultâneo, sem deduplicação
+    # por elevador, para a chave ser a única proteção.
+    upline.CHAMADO_DEDUP_MINUTOS = 0
+    chaves = [str(uuid.uuid4()) for _ in range(args.elevadores)]
+    pedidos = [({'codigo_qr': f'QR-{i % args.elevadores}', 'pessoa_presa': False, 'descricao': 'Repetição'}, {'Idempotency-Key': chave}) for i, chave in enumerate(chaves) for _ in range(args.relatos)]
+    rng.shuffle(pedidos)
+    resultados, criados = medir('repetições (mesma chave)', args, pedidos)
+    if criados != len(chaves):
+        falhas.append(f"{len(chaves)} chaves criaram {criados} chamados")
+    por_chave = {}
+    for (_, cabecalhos), (status, resposta, _) in zip(pedidos, resultados):
+        por_chave.setdefault(cabecalhos['Idempotency-Key'], set()).add((status, resposta.get('id_chamado')))
+    if any(len(respostas) != 1 for respostas in por_chave.values()):
+        falhas.append("repetições com a mesma chave receberam respostas diferentes")
+    upline.CHAMADO_DEDUP_MINUTOS = 30
+
+    with app.app_context():
+        if upline.verificar_resumos():
+            falhas.append("resumos divergentes")
+        if upline.limpar_chaves_idempotencia():
+            falhas.append("chaves recentes apagadas pela limpeza")
+
+    upline.estado_app(app).buffer_localizacoes.parar()
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    print("Abertura idempotente OK." if not falhas else f"{len(falhas)} verificações falharam.")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# benchmarks/bench_arquivo.py
+# Gera anos de histórico, mede as consultas quentes (lista do técnico, fila, página do admin),
+# arquiva os chamados finalizados antigos e volta a medir. Confirma que a exportação, a
+# paginação do histórico e o dashboard devolvem exatamente o mesmo que antes do arquivo.
+# Uso: python benchmarks/bench_arquivo.py [--elevadores 5000] [--anos 3] [--dias 180] [--lote 2000]
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-arquivo-'), 'arquivo.db')
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import func
+import app as upline
+from app import db, Chamado, ChamadoArquivo, Elevador, ResumoChamado
+import frota_sintetica
+
+app = upline.criar_app()
+
+def medir(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+def paginas(cliente, cabecalhos, consulta, maximo=20):
+    linhas, cursor = [], None
+    for _ in range(maximo):
+        corpo = cliente.get(f'/admin/chamados?{consulta}&limit=200' + (f'&cursor={cursor}' if cursor else ''), headers=cabecalhos).get_json()
+        linhas.extend(corpo['chamados'])
+        cursor = corpo['next_cursor']
+        if not cursor:
+            break
+    return linhas
+
+def fotografia(cliente, cabecalhos, historico):
+    """Tudo o que o arquivo não pode alterar."""
+    return {
+        'exportacao': cliente.get('/admin/chamados/exportar?formato=csv', headers=cabecalhos).get_data(),
+        'exportacao_antiga': cliente.get(f'/admin/chamados/exportar?data_inicio={historico:%Y-%m-%d}&data_fim={historico + datetime.timedelta(days=30):%Y-%m-%d}', headers=cabecalhos).get_data(),
+        'paginas': paginas(cliente, cabecalhos, 'fields=id_chamado,status,data_abertura,tecnico_responsavel'),
+        'paginas_intervalo': paginas(cliente, cabecalhos, f'data_inicio={historico:%Y-%m-%d}&fields=id_chamado,endereco'),
+        'lista_completa': cliente.get('/admin/chamados', headers=cabecalhos).get_json(),
+        'dashboard': cliente.get('/admin/dashboard/stats', headers=cabecalhos).get_json(),
+    }
+
+def consultas_quentes(cliente, cabecalhos, tecnicos, repeticoes):
+    return {
+        'lista do técnico': medir(lambda: [cliente.get(f'/tecnico/{t}/chamados') for t in tecnicos], repeticoes) / len(tecnicos),
+        'fila de despacho': medir(lambda: db.session.query(Chamado.id).filter(Chamado.status == 'aberto', Chamado.tecnico_id.is_(None)).order_by(Chamado.pessoa_presa.desc(), Chamado.timestamp).limit(100).all(), repeticoes),
+        'admin 1ª página (30 dias)': medir(lambda: cliente.get(f'/admin/chamados?data_inicio={datetime.datetime.utcnow() - datetime.timedelta(days=30):%Y-%m-%d}&limit=100', headers=cabecalhos), repeticoes),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--elevadores', type=int, default=5000)
+    parser.add_argument('--tecnicos', type=int, default=300)
+    parser.add_argument('--anos', type=int, default=3)
+    parser.add_argument('--dias', type=int, default=upline.ARQUIVO_DIAS)
+    parser.add_argument('--lote', type=int, default=upline.ARQUIVO_LOTE)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    falhas = []
+
+    with app.app_context():
+        upline.inicializar_base_dados()
+    cliente = app.test_client()
+    cabecalhos = {'x-access-token': cliente.post('/admin/login', json={'username': 'admin', 'password': 'password'}).get_json()['token']}
+    with app.app_context():
+        agora = datetime.datetime.utcnow()
+        resumo = frota_sintetica.gerar(elevadores=args.elevadores, tecnicos=args.tecnicos, anos=args.anos, ate=agora, seed=args.seed)
+        print(f"frota: {resumo['chamados']} chamados em {args.anos} anos")
+        total = db.session.query(func.count(Chamado.id)).scalar()
+        tecnicos = rng.sample([t for (t,) in db.session.query(Chamado.tecnico_id).filter(Chamado.tecnico_id.isnot(None)).distinct()], 20)
+        historico = agora - datetime.timedelta(days=365 * args.anos - 60)
+        antes = fotografia(cliente, cabecalhos, historico)
+        tempos_antes = consultas_quentes(cliente, cabecalhos, tecnicos, args.repeticoes)
+
+        inicio = time.perf_counter()
+        movidos = upline.arquivar_chamados(dias=args.dias, lote=args.lote)
+        duracao = time.perf_counter() - inicio
+        quentes = db.session.query(func.count(Chamado.id)).scalar()
+        arquivados = db.session.query(func.count(ChamadoArquivo.id)).scalar()
+        print(f"arquivo: {movidos} chamados em {duracao:.2f}s ({movidos / duracao:.0f}/s, lotes de {args.lote}); tabela quente {total} -> {quentes}")
+        if quentes + arquivados != total or arquivados != movidos:
+            falhas.append(f"{quentes} quentes + {arquivados} arquivados != {total}")
+        if upline.arquivar_chamados(dias=args.dias, lote=args.lote):
+            falhas.append("uma segunda execução voltou a mover chamados")
+
+        depois = fotografia(cliente, cabecalhos, historico)
+        for chave in antes:
+            if antes[chave] != depois[chave]:
+                falhas.append(f"'{chave}' mudou depois do arquivo")
+        tempos_depois = consultas_quentes(cliente, cabecalhos, tecnicos, args.repeticoes)
+        for nome in tempos_antes:
+            print(f"{nome:<28} {tempos_antes[nome]:8.2f} ms -> {tempos_depois[nome]:8.2f} ms")
+        if upline.verificar_resumos():
+            falhas.append("resumos divergentes depois do arquivo")
+
+        # Um chamado novo não pode reutilizar um id arquivado.
+        codigo_qr = db.session.query(Elevador.codigo_qr).first()[0]
+        novo = cliente.post('/chamado/abrir', json={'codigo_qr': codigo_qr, 'pessoa_presa': False, 'descricao': 'Depois do arquivo'}).get_json()
+        if novo.get('id_chamado') is None or db.session.get(ChamadoArquivo, novo['id_chamado']) is not None:
+            falhas.append(f"abrir_chamado depois do arquivo: {novo}")
+
+        # Apagar um elevador leva também os seus chamados arquivados e os resumos correspondentes.
+        elevador_id = db.session.query(ChamadoArquivo.elevador_id).first()[0]
+        cliente.delete(f'/admin/elevador/{elevador_id}', headers=cabecalhos)
+        restantes = db.session.query(func.count(ChamadoArquivo.id)).filter(ChamadoArquivo.elevador_id == elevador_id).scalar()
+        resumos = db.session.query(func.coalesce(func.sum(ResumoChamado.total), 0)).filter(ResumoChamado.elevador_id == elevador_id).scalar()
+        if restantes or resumos or upline.verificar_resumos():
+            falhas.append(f"elevador apagado deixou {restantes} chamados arquivados e {resumos} nos resumos")
+
+    upline.estado_app(app).buffer_localizacoes.parar()
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    print("Arquivo OK." if not falhas else f"{len(falhas)} verificações falharam.")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/bench_arranque.py
+# Mede o arranque de um worker: tempo do import de app.py e da criação da app, instruções SQL
+# feitas até aí e tempo do primeiro pedido (que abre a primeira ligação). Mede também vários workers a
+# arrancar ao mesmo tempo contra uma base de dados nova, como num deploy.
+# Uso: python benchmarks/bench_arranque.py [--repeticoes 10] [--workers 4] [--raiz DIRETORIO_DA_APP]
+# (--raiz permite medir outra versão da app, p.ex. um 'git worktree' do commit anterior)
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def obter_app(upline):
+    # As versões anteriores à fábrica criam a app no import; as atuais só com criar_app().
+    return upline.app if hasattr(upline, 'app') else upline.criar_app()
+
+def parar_buffer(upline, app):
+    estado = app.extensions.get('upline')
+    buffer = estado.buffer_localizacoes if estado else getattr(upline, 'buffer_localizacoes', None)
+    if buffer is not None:
+        buffer.parar()
+
+def filho(raiz, barreira=None):
+    """Corre num processo novo: devolve {import_ms, instrucoes_sql, primeiro_pedido_ms, erro}."""
+    sys.path.insert(0, raiz)
+    import logging
+    logging.disable(logging.CRITICAL)
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    instrucoes = []
+    event.listen(Engine, 'before_cursor_execute', lambda *args: instrucoes.append(1))
+    if barreira is not None:
+        barreira.wait()
+    inicio = time.perf_counter()
+    try:
+        import app as upline
+        app = obter_app(upline)
+    except Exception as e:
+        return {'erro': f'{type(e).__name__}: {e}'.splitlines()[0][:120]}
+    importacao = (time.perf_counter() - inicio) * 1000
+    no_import = len(instrucoes)
+    inicio = time.perf_counter()
+    resposta = app.test_client().get('/tecnico/1/chamados')
+    primeiro = (time.perf_counter() - inicio) * 1000
+    parar_buffer(upline, app)
+    return {'import_ms': importacao, 'instrucoes_sql': no_import, 'primeiro_pedido_ms': primeiro,
+            'erro': None if resposta.status_code == 200 else f'GET respondeu {resposta.status_code}'}
+
+def _filho_concorrente(raiz, barreira, saida):
+    with open(os.devnull, 'w') as nulo:
+        sys.stdout = sys.stderr = nulo
+        saida.put(filho(raiz, barreira))
+
+def inicializar(raiz, ambiente):
+    """Prepara a base de dados como num deploy: 'flask esquema inicializar' se existir, senão o import."""
+    codigo = ("import sys; sys.path.insert(0, sys.argv[1]); sys.path.insert(0, sys.argv[2]); import app as upline, bench_arranque\n"
+              "app = bench_arranque.obter_app(upline)\n"
+              "if hasattr(upline, 'inicializar_base_dados'):\n"
+              "    with app.app_context(): upline.inicializar_base_dados()\n"
+              "bench_arranque.parar_buffer(upline, app)")
+    subprocess.run([sys.executable, '-c', codigo, raiz, os.path.dirname(os.path.abspath(__file__))], env=ambiente, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeticoes', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4, help='workers a arrancar ao mesmo tempo numa base de dados nova')
+    parser.add_argument('--raiz', default=RAIZ, help='diretório com o app.py a medir')
+    parser.add_argument('--filho', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    raiz = os.path.abspath(args.raiz)
+    if args.filho:
+        print(json.dumps(filho(raiz)))
+        return
+
+    # Arranque normal: a base de dados já foi preparada.
+    ambiente = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-arranque-'), 'arranque.db'))
+    inicializar(raiz, ambiente)
+    medidas = []
+    for _ in range(args.repeticoes):
+        saida = subprocess.run([sys.executable, os.path.abspath(__file__), '--filho', '--raiz', raiz], env=ambiente, check=True, capture_output=True, text=True).stdout
+        medidas.append(json.loads(saida.strip().splitlines()[-1]))
+    print(f"{raiz}: {args.repeticoes} arranques")
+    print(f"  import e criar_app     {statistics.median(m['import_ms'] for m in medidas):8.1f} ms (mediana)")
+    print(f"  instruções SQL no arranque {statistics.median(m['instrucoes_sql'] for m in medidas):4.0f}")
+    print(f"  primeiro pedido        {statistics.median(m['primeiro_pedido_ms'] for m in medidas):8.1f} ms (mediana)")
+
+    # Deploy: vários workers arrancam ao mesmo tempo contra uma base de dados nova.
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-arranque-novo-'), 'novo.db')
+    # Nas versões em que o import cria o esquema, são os próprios workers a prepará-la (em corrida).
+    inicio = time.perf_counter()
+    with open(os.path.join(raiz, 'app.py'), encoding='utf-8') as ficheiro:
+        if 'def inicializar_base_dados' in ficheiro.read():
+            inicializar(raiz, dict(os.environ))
+    contexto = multiprocessing.get_context('spawn')
+    barreira, saida = contexto.Barrier(args.workers), contexto.Queue()
+    processos = [contexto.Process(target=_filho_concorrente, args=(raiz, barreira, saida)) for _ in range(args.workers)]
+    for processo in processos:
+        processo.start()
+    resultados = [saida.get() for _ in processos]
+    for processo in processos:
+        processo.join()
+    erros = [r['erro'] for r in resultados if r.get('erro')]
+    print(f"  deploy com {args.workers} workers numa base nova: {(time.perf_counter() - inicio):.2f}s até todos responderem, {len(erros)} falharam"
+          + (f" ({'; '.join(sorted(set(erros)))})" if erros else ''))
+    sys.exit(1 if erros else 0)
+
+if __name__ == '__main__':
+    main()
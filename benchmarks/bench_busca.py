@@ -0,0 +1,150 @@
+# benchmarks/bench_busca.py
+# Gera muitos chamados com texto variado (descrições, serviços, códigos de peças, observações),
+# arquiva os antigos e mede /admin/chamados/busca contra um LIKE '%...%' nas duas tabelas.
+# Confirma que a busca ignora acentos e que o índice acompanha abrir, finalizar, arquivar e
+# apagar o elevador.
+# Uso: python benchmarks/bench_busca.py [--chamados 1000000] [--repeticoes 20]
+
+import argparse
+import datetime
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-busca-'), 'busca.db')
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as upline
+from app import db, Chamado, ChamadoArquivo, Elevador
+import frota_sintetica
+
+app = upline.criar_app()
+
+PECAS = ['Botoeira', 'Contator', 'Rolete de porta', 'Sapata de freio', 'Cabo de tração', 'Placa de comando', 'Sensor de porta', 'Fusível']
+OBSERVACOES = ['Cliente informou que o problema é recorrente', 'Síndico acompanhou a visita', 'Necessário retorno para revisão',
+               'Casa de máquinas sem iluminação', 'Peça substituída em garantia', 'Acesso ao poço liberado pela portaria', '']
+CODIGOS_PECA = 50000
+LOTE = 20000
+
+def gerar_chamados(total, elevadores, tecnicos, ate, rng):
+    """Insere `total` chamados finalizados ao longo de 3 anos, por lotes e por ordem de timestamp."""
+    inicio = ate - datetime.timedelta(days=3 * 365)
+    passo = (ate - inicio) / total
+    for base in range(0, total, LOTE):
+        linhas = []
+        for i in range(base, min(base + LOTE, total)):
+            timestamp = inicio + passo * i
+            pecas = ', '.join(f'{rng.choice(PECAS)} XR-{rng.randrange(CODIGOS_PECA):05d}' for _ in range(rng.randint(0, 2)))
+            linhas.append({'timestamp': timestamp, 'descricao_problema': rng.choice(frota_sintetica.PROBLEMAS), 'pessoa_presa': False,
+                           'elevador_id': rng.choice(elevadores), 'tecnico_id': rng.choice(tecnicos), 'status': 'finalizado',
+                           'servicos_realizados': rng.choice(frota_sintetica.SERVICOS), 'pecas_trocadas': pecas or None,
+                           'observacao_texto': rng.choice(OBSERVACOES) or None, 'data_finalizacao': timestamp + datetime.timedelta(hours=2)})
+        db.session.execute(Chamado.__table__.insert(), linhas)
+        db.session.commit()
+
+def like(termo):
+    """A alternativa sem índice: LIKE em todas as colunas de texto das duas tabelas."""
+    consultas = []
+    for tabela in (Chamado.__table__, ChamadoArquivo.__table__):
+        condicao = db.or_(*[tabela.c[campo].like(f'%{termo}%') for campo in upline.CAMPOS_BUSCA])
+        consultas.append(db.select(tabela.c.id).where(condicao).order_by(tabela.c.id.desc()).limit(20))
+    return db.session.execute(upline.unir_historico(consultas, ('id', True)).limit(20)).all()
+
+def medir(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chamados', type=int, default=1000000)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    falhas = []
+
+    with app.app_context():
+        upline.inicializar_base_dados()
+    cliente = app.test_client()
+    cabecalhos = {'x-access-token': cliente.post('/admin/login', json={'username': 'admin', 'password': 'password'}).get_json()['token']}
+
+    def buscar(q, **filtros):
+        resposta = cliente.get('/admin/chamados/busca', query_string=dict(filtros, q=q), headers=cabecalhos)
+        if resposta.status_code != 200:
+            falhas.append(f"busca '{q}' respondeu {resposta.status_code}: {resposta.get_json()}")
+            return []
+        return resposta.get_json()['chamados']
+
+    with app.app_context():
+        agora = datetime.datetime.utcnow()
+        frota_sintetica.gerar(elevadores=2000, tecnicos=200, anos=1, chamados_por_elevador_ano=0, ate=agora, seed=args.seed)
+        elevadores = [e for (e,) in db.session.query(Elevador.id)]
+        tecnicos = [t for (t,) in db.session.query(upline.Tecnico.id)]
+        inicio = time.perf_counter()
+        gerar_chamados(args.chamados, elevadores, tecnicos, agora - datetime.timedelta(days=1), rng)
+        print(f"{args.chamados} chamados inseridos e indexados em {time.perf_counter() - inicio:.1f}s")
+        upline.reconstruir_resumos()
+        inicio = time.perf_counter()
+        movidos = upline.arquivar_chamados()
+        print(f"{movidos} chamados arquivados em {time.perf_counter() - inicio:.1f}s; "
+              f"{db.session.query(db.func.count(Chamado.id)).scalar()} ficam na tabela quente")
+
+        pecas = db.session.query(ChamadoArquivo.pecas_trocadas).filter(ChamadoArquivo.pecas_trocadas.isnot(None)).order_by(ChamadoArquivo.id.desc()).first()[0]
+        codigo = re.search(r'XR-\d{5}', pecas).group()
+        for rotulo, q, termo_like in [('código de peça (raro)', codigo, codigo), ('duas palavras', 'sapata freio', 'Sapata de freio'),
+                                      ('palavra comum', 'porta', 'porta'), ('frase', '"elevador parado"', 'Elevador parado')]:
+            tempo_busca, resultados = medir(lambda: buscar(q), args.repeticoes)
+            tempo_like, _ = medir(lambda: like(termo_like), max(1, args.repeticoes // 10))
+            print(f"{rotulo:<24} busca {tempo_busca:8.2f} ms ({len(resultados)} resultados)   LIKE {tempo_like:9.1f} ms")
+            if not resultados:
+                falhas.append(f"'{q}' não encontrou nada")
+        tempo, resultados = medir(lambda: buscar('porta', data_inicio=f'{agora - datetime.timedelta(days=30):%Y-%m-%d}'), args.repeticoes)
+        print(f"{'palavra comum, 30 dias':<24} busca {tempo:8.2f} ms ({len(resultados)} resultados)")
+        pagina = buscar('sapata freio', limit=5, cursor=5)
+        if [r['id_chamado'] for r in buscar('sapata freio', limit=10)][5:] != [r['id_chamado'] for r in pagina]:
+            falhas.append("a segunda página não continua a primeira")
+
+    # Sincronização: abrir, finalizar, arquivar e apagar o elevador.
+    with app.app_context():
+        elevador, outro = db.session.query(Elevador).order_by(Elevador.id).limit(2).all()
+        codigo_qr, elevador_id, outro_qr = elevador.codigo_qr, elevador.id, outro.codigo_qr
+    palavra = f'zumbido{rng.randrange(10 ** 9)}'
+    chamado_id = cliente.post('/chamado/abrir', json={'codigo_qr': codigo_qr, 'pessoa_presa': False, 'descricao': f'Elevador não desce, {palavra} forte'}).get_json()['id_chamado']
+    # Noutro elevador: no mesmo seria juntado ao primeiro, que deixaria de ser arquivável (o id mais recente fica).
+    cliente.post('/chamado/abrir', json={'codigo_qr': outro_qr, 'pessoa_presa': False, 'descricao': 'Outro chamado'})
+    if [r['id_chamado'] for r in buscar(f'{palavra} nao desce')] != [chamado_id]:
+        falhas.append("o chamado aberto não aparece na busca (ou os acentos não são ignorados)")
+    cliente.post(f'/chamado/{chamado_id}/finalizar', json={'servicos_realizados': 'Troca do rolete', 'pecas_trocadas': 'Rolete ZQ-99999', 'observacao_texto': 'Ok'})
+    if [r['id_chamado'] for r in buscar('ZQ-99999')] != [chamado_id]:
+        falhas.append("a busca não acompanha a finalização")
+    with app.app_context():
+        db.session.execute(Chamado.__table__.update().where(Chamado.id == chamado_id).values(data_finalizacao=agora - datetime.timedelta(days=365)))
+        db.session.commit()
+        upline.arquivar_chamados()
+    encontrados = buscar('ZQ-99999 rolete')
+    if [(r['id_chamado'], r['arquivado']) for r in encontrados] != [(chamado_id, True)]:
+        falhas.append(f"depois de arquivado: {encontrados}")
+    cliente.delete(f'/admin/elevador/{elevador_id}', headers=cabecalhos)
+    if buscar('ZQ-99999') or buscar(palavra):
+        falhas.append("o chamado do elevador apagado continua na busca")
+    with app.app_context():
+        if upline.verificar_resumos():
+            falhas.append("resumos divergentes")
+        # 'integrity-check' com rank=1 compara o índice com chamado (e chamado_arquivo) e falha se divergirem.
+        db.session.execute(db.text("INSERT INTO chamado_busca(chamado_busca, rank) VALUES('integrity-check', 1)"))
+        db.session.commit()
+
+    upline.estado_app(app).buffer_localizacoes.parar()
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    print("Busca OK." if not falhas else f"{len(falhas)} verificações falharam.")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# benchmarks/bench_engine.py
+# Compara o débito de escritas concorrentes com o perfil do engine desligado (BD_PERFIL=padrao)
+# e ligado (BD_PERFIL=producao). Vários processos, como os workers do gunicorn, abrem e
+# finalizam chamados em várias threads contra a mesma base de dados, com leituras à mistura.
+# Uso: python benchmarks/bench_engine.py [--processos 4] [--threads 8] [--duracao 15] [--postgres postgresql://...]
+# (sem --postgres cada perfil corre num ficheiro SQLite novo: o modo WAL fica gravado no ficheiro)
+# (no PostgreSQL a base de dados é reutilizada e os chamados do benchmark ficam lá)
+
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def trabalhador(indice, threads, duracao, seed, barreira, saida):
+    """Corre num processo próprio (herda DATABASE_URL e BD_PERFIL); envia (estado, segundos, tipo) de cada pedido."""
+    sys.path.insert(0, RAIZ)
+    import app as upline
+    logging.disable(logging.CRITICAL)
+    app = upline.criar_app()
+    with app.app_context():
+        codigos = [c for (c,) in upline.db.session.query(upline.Elevador.codigo_qr).all()]
+        tecnicos = [t for (t,) in upline.db.session.query(upline.Tecnico.id).all()]
+    resultados = []
+    barreira.wait()  # todos os processos já criaram a app: a carga começa ao mesmo tempo
+    fim = time.perf_counter() + duracao
+
+    def correr(n):
+        rng = random.Random(seed * 1000 + indice * 100 + n)
+        cliente = app.test_client()
+        locais = []
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            resposta = cliente.post('/chamado/abrir', json={'codigo_qr': rng.choice(codigos), 'pessoa_presa': rng.random() < 0.1, 'descricao': 'Bench engine'})
+            locais.append((resposta.status_code, time.perf_counter() - inicio, 'escrita'))
+            chamado_id = (resposta.get_json() or {}).get('id_chamado')
+            if chamado_id:
+                inicio = time.perf_counter()
+                resposta = cliente.post(f'/chamado/{chamado_id}/finalizar', json={'servicos_realizados': 'Bench engine'})
+                locais.append((resposta.status_code, time.perf_counter() - inicio, 'escrita'))
+            inicio = time.perf_counter()
+            resposta = cliente.get(f'/tecnico/{rng.choice(tecnicos)}/chamados')
+            locais.append((resposta.status_code, time.perf_counter() - inicio, 'leitura'))
+        resultados.extend(locais)
+
+    lista = [threading.Thread(target=correr, args=(n,)) for n in range(threads)]
+    for t in lista:
+        t.start()
+    for t in lista:
+        t.join()
+    upline.estado_app(app).buffer_localizacoes.parar()
+    saida.put(resultados)
+
+def preparar(url, perfil):
+    """Cria o esquema e uma frota pequena num processo à parte, com o perfil a medir."""
+    ambiente = dict(os.environ, DATABASE_URL=url, BD_PERFIL=perfil)
+    subprocess.run([sys.executable, os.path.join(RAIZ, 'benchmarks', 'frota_sintetica.py'), '--banco', url, '--clientes', '20',
+                    '--elevadores', '500', '--tecnicos', '200', '--anos', '0', '--plantao', '1'], env=ambiente, check=True, stdout=subprocess.DEVNULL)
+
+def medir(url, perfil, args):
+    preparar(url, perfil)
+    os.environ['DATABASE_URL'] = url
+    os.environ['BD_PERFIL'] = perfil
+    contexto = multiprocessing.get_context('spawn')
+    barreira, saida = contexto.Barrier(args.processos), contexto.Queue()
+    processos = [contexto.Process(target=trabalhador, args=(i, args.threads, args.duracao, args.seed, barreira, saida)) for i in range(args.processos)]
+    for processo in processos:
+        processo.start()
+    resultados = [r for _ in processos for r in saida.get()]
+    for processo in processos:
+        processo.join()
+    escritas = [r for r in resultados if r[2] == 'escrita']
+    ok = sorted(t for estado, t, _ in escritas if estado < 300)
+    erros = sum(1 for estado, _, _ in resultados if estado >= 500)
+    p99 = ok[max(int(len(ok) * 0.99) - 1, 0)] * 1000 if ok else 0
+    print(f"{perfil:<9} {len(ok) / args.duracao:7.0f} escritas/s  p50 {statistics.median(ok) * 1000 if ok else 0:6.1f} ms  p99 {p99:7.1f} ms  "
+          f"{sum(1 for r in resultados if r[2] == 'leitura')} leituras  {erros} erros 5xx")
+    return len(ok) / args.duracao, erros
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processos', type=int, default=4, help='processos, como os workers do gunicorn')
+    parser.add_argument('--threads', type=int, default=8, help='threads por processo')
+    parser.add_argument('--duracao', type=float, default=15, help='segundos de carga por perfil')
+    parser.add_argument('--postgres', default=os.environ.get('BENCH_POSTGRES_URL'))
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    print(f"{args.processos} processos x {args.threads} threads, {args.duracao:.0f}s por perfil, {'PostgreSQL' if args.postgres else 'SQLite'}")
+
+    medidas = {}
+    for perfil in ('padrao', 'producao'):
+        url = args.postgres or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix=f'upline-engine-{perfil}-'), 'engine.db')
+        medidas[perfil] = medir(url, perfil, args)
+    (antes, erros_antes), (depois, erros_depois) = medidas['padrao'], medidas['producao']
+    print(f"débito de escritas: {depois / antes:.2f}x ({antes:.0f} -> {depois:.0f}/s); erros 5xx: {erros_antes} -> {erros_depois}")
+    sys.exit(1 if erros_depois else 0)
+
+if __name__ == '__main__':
+    main()
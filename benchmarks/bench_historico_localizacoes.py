@@ -0,0 +1,178 @@
+# benchmarks/bench_historico_localizacoes.py
+# Gera dias de trajetos sintéticos de técnicos, mede as consultas do histórico (trajeto de um
+# técnico e quem estava perto de um elevador) antes e depois da compactação, compara com uma
+# pesquisa exaustiva sobre os dados gerados e confirma que vários processos a acrescentar ao
+# mesmo tempo não corrompem os ficheiros. Mede também o ping com e sem histórico.
+# Uso: python benchmarks/bench_historico_localizacoes.py [--tecnicos 300] [--dias 4] [--periodo 15]
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+DIRETORIO = tempfile.mkdtemp(prefix='upline-historico-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(DIRETORIO, 'historico.db')
+os.environ['LOCALIZACAO_HISTORICO_DIR'] = os.path.join(DIRETORIO, 'historico')
+os.environ['LOCALIZACAO_FLUSH_INTERVALO'] = '0.5'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from geo import calcular_distancia
+from historico_localizacoes import HistoricoLocalizacoes, REGISTO
+
+CENTRO = (-23.55, -46.63)
+
+def gerar_trajetos(tecnicos, dias, periodo, inicio, rng):
+    """Passeios aleatórios à volta de São Paulo: (ts em ms desde a época, tecnico, lat, lon) por ordem de tempo."""
+    passos = dias * 86400 // periodo
+    lat = CENTRO[0] + rng.uniform(-0.15, 0.15, tecnicos)
+    lon = CENTRO[1] + rng.uniform(-0.15, 0.15, tecnicos)
+    base = int((inicio - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
+    for passo in range(passos):
+        lat = np.clip(lat + rng.normal(0, 0.0005, tecnicos), -23.8, -23.3)
+        lon = np.clip(lon + rng.normal(0, 0.0005, tecnicos), -46.9, -46.3)
+        yield base + passo * periodo * 1000 + rng.integers(0, periodo * 1000, tecnicos), np.arange(1, tecnicos + 1), lat, lon
+
+def para_datetime(ms):
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=int(ms))
+
+def medir(funcao, repeticoes=5):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos), resultado
+
+def escritor(diretorio, tecnico_id, lotes, tamanho, dia):
+    historico = HistoricoLocalizacoes(diretorio)
+    for lote in range(lotes):
+        historico.acrescentar([(tecnico_id, -23.0 - tecnico_id / 1000, -46.0 - (lote * tamanho + i) / 1e6, dia + datetime.timedelta(milliseconds=lote * tamanho + i)) for i in range(tamanho)])
+
+def verificar_concorrencia(falhas, processos=4, lotes=200, tamanho=250):
+    diretorio = os.path.join(DIRETORIO, 'concorrencia')
+    dia = datetime.datetime(2026, 1, 1)
+    contexto = multiprocessing.get_context('spawn')
+    filhos = [contexto.Process(target=escritor, args=(diretorio, p + 1, lotes, tamanho, dia)) for p in range(processos)]
+    inicio = time.perf_counter()
+    for filho in filhos:
+        filho.start()
+    for filho in filhos:
+        filho.join()
+    duracao = time.perf_counter() - inicio
+    registos = np.fromfile(os.path.join(diretorio, '2026-01-01.pos'), dtype=REGISTO)
+    corretos = all(np.array_equal(np.sort(registos['ms'][registos['tecnico'] == p]), np.arange(lotes * tamanho)) and
+                   np.all(registos['lat'][registos['tecnico'] == p] == round((-23.0 - p / 1000) * 1e7)) for p in range(1, processos + 1))
+    print(f"concorrência: {processos} processos acrescentaram {len(registos)} amostras em {duracao:.2f}s; ficheiro {'íntegro' if corretos else 'CORROMPIDO'}")
+    if len(registos) != processos * lotes * tamanho or not corretos:
+        falhas.append("escritas concorrentes perderam ou misturaram registos")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tecnicos', type=int, default=300)
+    parser.add_argument('--dias', type=int, default=4)
+    parser.add_argument('--periodo', type=int, default=15, help='segundos entre pings de cada técnico')
+    parser.add_argument('--intervalo', type=int, default=60, help='segundos entre amostras depois da compactação')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+    falhas = []
+
+    historico = HistoricoLocalizacoes(os.environ['LOCALIZACAO_HISTORICO_DIR'])
+    inicio = datetime.datetime(2026, 3, 2)
+    colunas = {'ms': [], 'tecnico': [], 'lat': [], 'lon': []}
+    escrita = time.perf_counter()
+    pendentes = []
+    for ms, tecnicos, lat, lon in gerar_trajetos(args.tecnicos, args.dias, args.periodo, inicio, rng):
+        for nome, valores in zip(colunas, (ms, tecnicos, lat, lon)):
+            colunas[nome].append(valores)
+        pendentes.extend(zip(tecnicos.tolist(), lat.tolist(), lon.tolist(), map(para_datetime, ms.tolist())))
+        if len(pendentes) >= 20000:
+            historico.acrescentar(pendentes)
+            pendentes = []
+    historico.acrescentar(pendentes)
+    escrita = time.perf_counter() - escrita
+    todas = {nome: np.concatenate(valores) for nome, valores in colunas.items()}
+    total = len(todas['ms'])
+    tamanho = sum(os.path.getsize(os.path.join(historico.diretorio, f)) for f in os.listdir(historico.diretorio))
+    print(f"{total} amostras ({args.tecnicos} técnicos, {args.dias} dias, a cada {args.periodo}s) gravadas em {escrita:.1f}s "
+          f"(incluindo gerar as tuplas); {tamanho / 1e6:.1f} MB, {tamanho / total:.0f} bytes por amostra")
+
+    # Verdade: pesquisa exaustiva sobre os arrays gerados.
+    tecnico = args.tecnicos // 2
+    t1, t2 = inicio + datetime.timedelta(days=1, hours=9), inicio + datetime.timedelta(days=1, hours=11)
+    ms1, ms2 = [int((t - datetime.datetime(1970, 1, 1)).total_seconds() * 1000) for t in (t1, t2)]
+    esperado = np.sort(todas['ms'][(todas['tecnico'] == tecnico) & (todas['ms'] >= ms1) & (todas['ms'] <= ms2)])
+    elevador = (CENTRO[0] + 0.02, CENTRO[1] - 0.03)
+    instante, janela, raio = inicio + datetime.timedelta(days=1, hours=14), datetime.timedelta(minutes=10), 3.0
+    ms_instante = int((instante - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
+    na_janela = np.flatnonzero((todas['ms'] <= ms_instante) & (todas['ms'] >= ms_instante - janela.total_seconds() * 1000))
+    ultimos = {}
+    for i in na_janela[np.argsort(todas['ms'][na_janela], kind='stable')]:
+        ultimos[int(todas['tecnico'][i])] = i
+    perto = sorted(t for t, i in ultimos.items() if calcular_distancia(elevador[0], elevador[1], todas['lat'][i], todas['lon'][i]) <= raio)
+
+    def consultas(rotulo):
+        tempo_trajeto, posicoes = medir(lambda: historico.posicoes(tecnico, t1, t2))
+        tempo_proximos, proximos = medir(lambda: historico.proximos(elevador[0], elevador[1], raio, instante, janela))
+        print(f"{rotulo:<22} trajeto de 2 h: {tempo_trajeto:7.1f} ms ({len(posicoes)} posições)   "
+              f"técnicos a {raio:.0f} km do elevador: {tempo_proximos:7.1f} ms ({len(proximos)} técnicos)")
+        return posicoes, proximos
+
+    posicoes, proximos = consultas('antes de compactar')
+    if [int((p[0] - datetime.datetime(1970, 1, 1)) / datetime.timedelta(milliseconds=1)) for p in posicoes] != esperado.tolist():
+        falhas.append("o trajeto não coincide com as amostras gravadas")
+    if sorted(p[0] for p in proximos) != perto:
+        falhas.append(f"técnicos próximos: {sorted(p[0] for p in proximos)} != {perto}")
+
+    hoje = (inicio + datetime.timedelta(days=args.dias + 2)).date()
+    duracao, resumo = medir(lambda: historico.manter(hoje, dias_completos=2, intervalo=args.intervalo), repeticoes=1)
+    tamanho_depois = sum(os.path.getsize(os.path.join(historico.diretorio, f)) for f in os.listdir(historico.diretorio))
+    print(f"compactação ({args.intervalo}s): {resumo['dias_compactados']} dias, {resumo['registos_antes']} -> {resumo['registos_depois']} amostras "
+          f"em {duracao / 1000:.1f}s; {tamanho / 1e6:.1f} MB -> {tamanho_depois / 1e6:.1f} MB")
+    posicoes_compactadas, proximos_compactados = consultas('depois de compactar')
+    ms_compactados = [int((p[0] - datetime.datetime(1970, 1, 1)) / datetime.timedelta(milliseconds=1)) for p in posicoes_compactadas]
+    if not set(ms_compactados) <= set(esperado.tolist()) or len(set(m // (args.intervalo * 1000) for m in ms_compactados)) != len(ms_compactados):
+        falhas.append("a compactação deixou amostras inventadas ou mais de uma por intervalo")
+    if not proximos_compactados:
+        falhas.append("depois de compactar, ninguém perto do elevador")
+    if historico.manter(hoje, dias_completos=2, intervalo=args.intervalo)['dias_compactados']:
+        falhas.append("uma segunda manutenção voltou a compactar")
+    if historico.manter(hoje, dias_completos=2, intervalo=args.intervalo, retencao_dias=args.dias)['dias_apagados'] != 2:
+        falhas.append("a retenção não apagou os dias mais antigos")
+
+    verificar_concorrencia(falhas)
+
+    # Ping: o histórico é gravado no flush, fora do pedido.
+    import app as upline
+    app = upline.criar_app()
+    buffer = upline.estado_app(app).buffer_localizacoes
+    with app.app_context():
+        upline.inicializar_base_dados()
+    cliente = app.test_client()
+    ping = lambda i: cliente.post('/tecnico/atualizar_localizacao', json={'tecnico_id': 1, 'latitude': -23.55 + i * 1e-6, 'longitude': -46.63, 'ts': time.time()})
+    gravar_historico = buffer.gravar_historico
+    for rotulo, funcao in (('ping sem histórico', None), ('ping com histórico', gravar_historico)):
+        buffer.gravar_historico = funcao
+        tempos = []
+        for i in range(2000):
+            inicio_ping = time.perf_counter()
+            ping(i)
+            tempos.append((time.perf_counter() - inicio_ping) * 1000)
+        print(f"{rotulo:<22} p50 {statistics.median(tempos):.2f} ms, p99 {sorted(tempos)[int(len(tempos) * 0.99)]:.2f} ms")
+    buffer.parar()
+    agora = datetime.datetime.utcnow()
+    if not historico.posicoes(1, agora - datetime.timedelta(minutes=5), agora):
+        falhas.append("os pings não chegaram ao histórico")
+
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    print("Histórico OK." if not falhas else f"{len(falhas)} verificações falharam.")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
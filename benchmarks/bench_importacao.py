@@ -0,0 +1,92 @@
+# benchmarks/bench_importacao.py
+# Mede POST /admin/importar com um ficheiro sintético de elevadores (CSV e NDJSON) e
+# confirma o relatório de erros por linha de um ficheiro com problemas.
+# Uso: python benchmarks/bench_importacao.py [--elevadores 50000] [--clientes 500]
+
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-importacao-'), 'importacao.db')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import func
+import app as upline
+from app import db, Cliente, Elevador
+
+app = upline.criar_app()
+
+CAMPOS = ['cliente', 'possui_contrato', 'codigo_qr', 'endereco', 'latitude', 'longitude']
+
+def gerar_linhas(prefixo, total_elevadores, total_clientes, rng):
+    for i in range(total_elevadores):
+        yield {'cliente': f'{prefixo} Cliente {i % total_clientes}', 'possui_contrato': 'sim', 'codigo_qr': f'{prefixo}-{i:06d}',
+               'endereco': f'Rua {i}, São Paulo, SP', 'latitude': round(-23.5 + rng.uniform(-0.5, 0.5), 6), 'longitude': round(-46.6 + rng.uniform(-0.5, 0.5), 6)}
+
+def como_csv(linhas):
+    saida = io.StringIO()
+    escritor = csv.DictWriter(saida, fieldnames=CAMPOS)
+    escritor.writeheader()
+    escritor.writerows(linhas)
+    return saida.getvalue().encode('utf-8')
+
+def como_ndjson(linhas):
+    return ''.join(json.dumps(linha, ensure_ascii=False) + '\n' for linha in linhas).encode('utf-8')
+
+def importar(cliente_http, token, conteudo, nome_ficheiro, parametros=''):
+    inicio = time.perf_counter()
+    resposta = cliente_http.post(f'/admin/importar{parametros}', headers={'x-access-token': token}, data={'ficheiro': (io.BytesIO(conteudo), nome_ficheiro)}, content_type='multipart/form-data')
+    return resposta, time.perf_counter() - inicio
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--elevadores', type=int, default=50000)
+    parser.add_argument('--clientes', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    with app.app_context():
+        upline.inicializar_base_dados()
+    cliente_http = app.test_client()
+    token = cliente_http.post('/admin/login', json={'username': 'admin', 'password': 'password'}).get_json()['token']
+    falhou = False
+
+    for formato, serializar in (('csv', como_csv), ('ndjson', como_ndjson)):
+        conteudo = serializar(gerar_linhas(formato.upper(), args.elevadores, args.clientes, rng))
+        resposta, duracao = importar(cliente_http, token, conteudo, f'elevadores.{formato}')
+        corpo = resposta.get_json()
+        print(f"{formato:<7} {args.elevadores} linhas ({len(conteudo) / 1e6:.1f} MB) em {duracao:.2f}s ({args.elevadores / duracao:,.0f} linhas/s): "
+              f"HTTP {resposta.status_code}, {corpo['clientes_criados']} clientes e {corpo['elevadores_criados']} elevadores criados")
+        falhou = falhou or resposta.status_code != 201 or corpo['elevadores_criados'] != args.elevadores
+
+    # Ficheiro com problemas: nada é gravado e cada linha inválida aparece no relatório.
+    linhas = list(gerar_linhas('ERROS', 6, 2, rng))
+    linhas[1]['latitude'] = 'abc'
+    linhas[2]['codigo_qr'] = linhas[0]['codigo_qr']
+    linhas[3]['codigo_qr'] = 'CSV-000000'
+    linhas[4]['cliente'] = ''
+    with app.app_context():
+        antes = db.session.query(func.count(Elevador.id)).scalar()
+    resposta, _ = importar(cliente_http, token, como_csv(linhas), 'erros.csv')
+    corpo = resposta.get_json()
+    print(f"ficheiro com erros: HTTP {resposta.status_code}, {corpo['total_erros']} linhas com erros")
+    for erro in corpo['erros']:
+        print(f"  linha {erro['linha']}: {'; '.join(erro['erros'])}")
+    with app.app_context():
+        depois = db.session.query(func.count(Elevador.id)).scalar()
+    falhou = falhou or resposta.status_code != 400 or [e['linha'] for e in corpo['erros']] != [3, 4, 5, 6] or antes != depois
+    resposta, _ = importar(cliente_http, token, como_csv(linhas), 'erros.csv', '?parcial=1')
+    print(f"mesmo ficheiro com ?parcial=1: HTTP {resposta.status_code}, {resposta.get_json()['elevadores_criados']} elevadores criados")
+    falhou = falhou or resposta.get_json()['elevadores_criados'] != 2
+
+    upline.estado_app(app).buffer_localizacoes.parar()
+    sys.exit(1 if falhou else 0)
+
+if __name__ == '__main__':
+    main()
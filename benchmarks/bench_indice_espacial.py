@@ -0,0 +1,54 @@
+# benchmarks/bench_indice_espacial.py
+# Compara a escolha do técnico mais próximo feita com min() sobre todos os técnicos
+# (comportamento antigo de /chamado/abrir) com a pesquisa no IndiceEspacial.
+# Uso: python benchmarks/bench_indice_espacial.py [--consultas 200]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from geo import calcular_distancia, IndiceEspacial
+
+# Caixas aproximadas (lat_min, lat_max, lon_min, lon_max) de algumas capitais.
+CIDADES = {
+    'sao_paulo': (-23.80, -23.35, -46.83, -46.36),
+    'rio_de_janeiro': (-23.08, -22.75, -43.79, -43.10),
+    'belo_horizonte': (-20.06, -19.78, -44.06, -43.86),
+    'curitiba': (-25.64, -25.35, -49.39, -49.18),
+    'porto_alegre': (-30.27, -29.93, -51.27, -51.08),
+}
+
+def ponto_aleatorio(rng):
+    lat_min, lat_max, lon_min, lon_max = CIDADES[rng.choice(list(CIDADES))]
+    return rng.uniform(lat_min, lat_max), rng.uniform(lon_min, lon_max)
+
+def medir(funcao, consultas):
+    inicio = time.perf_counter()
+    resultados = [funcao(lat, lon) for lat, lon in consultas]
+    return (time.perf_counter() - inicio) / len(consultas), resultados
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--consultas', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'técnicos':>10} {'min() ms':>10} {'índice ms':>10} {'ganho':>8}")
+    for total in (10, 1000, 50000):
+        rng = random.Random(args.seed)
+        tecnicos = [(i, *ponto_aleatorio(rng)) for i in range(total)]
+        consultas = [ponto_aleatorio(rng) for _ in range(args.consultas)]
+        indice = IndiceEspacial()
+        indice.carregar(tecnicos)
+
+        tempo_scan, por_scan = medir(lambda lat, lon: min(tecnicos, key=lambda t: calcular_distancia(lat, lon, t[1], t[2]))[0], consultas)
+        tempo_indice, por_indice = medir(lambda lat, lon: indice.mais_proximos(lat, lon, k=1)[0][1], consultas)
+        if por_scan != por_indice:
+            raise SystemExit(f"Resultados divergentes com {total} técnicos.")
+        print(f"{total:>10} {tempo_scan * 1000:>10.3f} {tempo_indice * 1000:>10.3f} {tempo_scan / tempo_indice:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
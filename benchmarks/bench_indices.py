@@ -0,0 +1,115 @@
+# benchmarks/bench_indices.py
+# Corre EXPLAIN sobre as consultas de cada rota e confirma que nenhuma faz varrimento
+# completo das tabelas grandes. Mede também o tempo de cada consulta.
+# Uso: python benchmarks/bench_indices.py [--chamados 200000] [--postgres postgresql://...]
+# (o PostgreSQL também pode vir de BENCH_POSTGRES_URL; sem ele só corre em SQLite)
+
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+DIRETORIO = tempfile.mkdtemp(prefix='upline-indices-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(DIRETORIO, 'app.db')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, select, tuple_, text, func
+from app import db, Cliente, Elevador, Tecnico, Chamado
+
+STATUS = ['finalizado'] * 90 + ['atribuido'] * 7 + ['aberto'] * 3
+LOTE = 5000
+
+def popular(engine, total_chamados, total_tecnicos, total_elevadores, rng):
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    inicio = datetime.datetime(2021, 1, 1)
+    segundos = int((datetime.datetime(2025, 1, 1) - inicio).total_seconds())
+    with engine.begin() as conexao:
+        conexao.execute(Cliente.__table__.insert(), [{'id': i, 'nome': f'Cliente {i}', 'possui_contrato': True} for i in range(1, total_elevadores // 10 + 2)])
+        conexao.execute(Elevador.__table__.insert(), [{'id': i, 'codigo_qr': f'ELEV-{i}', 'endereco': f'Rua {i}', 'latitude': -23.5, 'longitude': -46.6, 'cliente_id': i // 10 + 1} for i in range(1, total_elevadores + 1)])
+        conexao.execute(Tecnico.__table__.insert(), [{'id': i, 'nome': f'Técnico {i}', 'username': f't{i}', 'password': 'x', 'de_plantao': rng.random() < 0.05, 'last_latitude': -23.5, 'last_longitude': -46.6} for i in range(1, total_tecnicos + 1)])
+        for base in range(0, total_chamados, LOTE):
+            conexao.execute(Chamado.__table__.insert(), [{
+                'timestamp': inicio + datetime.timedelta(seconds=rng.randrange(segundos)), 'descricao_problema': 'Porta não fecha', 'pessoa_presa': rng.random() < 0.1,
+                'status': rng.choice(STATUS), 'elevador_id': rng.randint(1, total_elevadores), 'tecnico_id': rng.randint(1, total_tecnicos),
+            } for _ in range(base, min(base + LOTE, total_chamados))])
+    with engine.begin() as conexao:
+        conexao.execute(text('ANALYZE'))
+
+def consultas_das_rotas(rng, total_tecnicos, total_elevadores):
+    limite = datetime.datetime(2024, 6, 1, 12, 0)
+    colunas_listagem = [Chamado.id, Chamado.status, Chamado.timestamp]
+    return [
+        ('GET /tecnico/<id>/chamados', select(Chamado.id, Chamado.status, Chamado.descricao_problema).where(Chamado.tecnico_id == rng.randint(1, total_tecnicos)).order_by(Chamado.timestamp.desc())),
+        ('GET /admin/chamados?limit=100', select(*colunas_listagem).order_by(Chamado.timestamp.desc(), Chamado.id.desc()).limit(101)),
+        ('GET /admin/chamados?cursor=...', select(*colunas_listagem).where(tuple_(Chamado.timestamp, Chamado.id) < tuple_(limite, 1000)).order_by(Chamado.timestamp.desc(), Chamado.id.desc()).limit(101)),
+        ('GET /admin/chamados?elevador_id', select(*colunas_listagem).where(Chamado.elevador_id == rng.randint(1, total_elevadores)).order_by(Chamado.timestamp.desc(), Chamado.id.desc()).limit(101)),
+        ('GET /admin/chamados?cliente_id', select(*colunas_listagem).where(Chamado.elevador_id.in_(select(Elevador.id).where(Elevador.cliente_id == 7))).order_by(Chamado.timestamp.desc(), Chamado.id.desc()).limit(101)),
+        ('GET /admin/chamados?data_inicio&data_fim', select(*colunas_listagem).where(Chamado.timestamp >= datetime.datetime(2024, 3, 1), Chamado.timestamp <= datetime.datetime(2024, 3, 7, 23, 59, 59)).order_by(Chamado.timestamp.desc(), Chamado.id.desc())),
+        ('chamados em aberto (status)', select(Chamado.id, Chamado.elevador_id).where(Chamado.status == 'aberto').order_by(Chamado.timestamp)),
+        ('POST /chamado/abrir (técnicos de plantão)', select(Tecnico.id, Tecnico.last_latitude, Tecnico.last_longitude).where(Tecnico.de_plantao.is_(True), Tecnico.last_latitude.isnot(None))),
+        ('despacho: próximo da fila', select(Chamado.id, Elevador.latitude, Elevador.longitude).join(Elevador, Chamado.elevador_id == Elevador.id).where(Chamado.status == 'aberto').order_by(Chamado.pessoa_presa.desc(), Chamado.timestamp, Chamado.id).limit(1)),
+        ('despacho: carga dos candidatos', select(Chamado.tecnico_id, func.count(Chamado.id)).where(Chamado.tecnico_id.in_(rng.sample(range(1, total_tecnicos + 1), 10)), Chamado.status == 'atribuido').group_by(Chamado.tecnico_id)),
+    ]
+
+def executar_explain(conexao, consulta):
+    compilada = consulta.compile(dialect=conexao.dialect, compile_kwargs={'render_postcompile': True})
+    parametros = tuple(compilada.params[k] for k in compilada.positiontup) if compilada.positional else compilada.params
+    prefixo = 'EXPLAIN QUERY PLAN ' if conexao.dialect.name == 'sqlite' else 'EXPLAIN '
+    linhas = conexao.exec_driver_sql(prefixo + str(compilada), parametros).all()
+    plano = [linha[-1] for linha in linhas]
+    return plano, compilada, parametros
+
+def varrimento_completo(dialeto, plano):
+    for linha in plano:
+        if dialeto == 'sqlite' and linha.startswith('SCAN ') and 'USING' not in linha:
+            return linha
+        if dialeto != 'sqlite' and 'Seq Scan on' in linha:
+            return linha.strip()
+    return None
+
+def medir(conexao, compilada, parametros, repeticoes=5):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        conexao.exec_driver_sql(str(compilada), parametros).all()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chamados', type=int, default=200000)
+    parser.add_argument('--tecnicos', type=int, default=2000)
+    parser.add_argument('--elevadores', type=int, default=20000)
+    parser.add_argument('--postgres', default=os.environ.get('BENCH_POSTGRES_URL'))
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    urls = {'sqlite': 'sqlite:///' + os.path.join(DIRETORIO, 'indices.db')}
+    if args.postgres:
+        urls['postgresql'] = args.postgres.replace('postgres://', 'postgresql://', 1)
+
+    falhas = 0
+    for nome, url in urls.items():
+        engine = create_engine(url)
+        rng = random.Random(args.seed)
+        inicio = time.perf_counter()
+        popular(engine, args.chamados, args.tecnicos, args.elevadores, rng)
+        print(f"\n== {nome}: {args.chamados} chamados, {args.tecnicos} técnicos, {args.elevadores} elevadores (carga em {time.perf_counter() - inicio:.1f}s)")
+        with engine.connect() as conexao:
+            for rota, consulta in consultas_das_rotas(rng, args.tecnicos, args.elevadores):
+                plano, compilada, parametros = executar_explain(conexao, consulta)
+                problema = varrimento_completo(conexao.dialect.name, plano)
+                falhas += bool(problema)
+                print(f"{'FULL SCAN' if problema else 'índice':<10} {medir(conexao, compilada, parametros) * 1000:>9.2f} ms  {rota}")
+                for linha in plano:
+                    print(f"{'':<24}{linha}")
+        engine.dispose()
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# benchmarks/bench_purga.py
+# Apagar um cliente grande: um cliente com 500 elevadores e 1M de chamados (parte no arquivo)
+# é removido pelo DELETE /admin/cliente/<id>, que responde logo, e a purga em lotes corre em
+# segundo plano enquanto outros clientes continuam a abrir chamados. Mede também a purga síncrona
+# de um cliente mais pequeno (memória e duração). Confirma que nada do
+# cliente fica para trás, que os outros clientes não mudam e que resumos e busca continuam certos.
+# Uso: python benchmarks/bench_purga.py [--elevadores 500] [--chamados 1000000] [--antigo 20000]
+
+import argparse
+import datetime
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-purga-'), 'purga.db')
+# A geração insere lotes grandes; os avisos de SQL lenta só enchem a saída.
+os.environ.setdefault('SQL_LENTA_SEGUNDOS', '5')
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import func
+import app as upline
+from app import db, Cliente, Elevador, Tecnico, Chamado, ChamadoArquivo, ResumoChamado, RemocaoCatalogo, Purga
+import frota_sintetica
+
+app = upline.criar_app()
+
+LOTE = 20000
+
+def criar_cliente(nome, elevadores, rng):
+    cliente = Cliente(nome=nome, possui_contrato=True)
+    db.session.add(cliente)
+    db.session.flush()
+    primeiro = (db.session.query(func.max(Elevador.id)).scalar() or 0) + 1
+    db.session.execute(Elevador.__table__.insert(), [{'id': primeiro + i, 'codigo_qr': f'{nome}-{i}', 'endereco': f'Rua {i}', 'latitude': -23.5 + rng.uniform(-0.3, 0.3),
+                                                       'longitude': -46.6 + rng.uniform(-0.3, 0.3), 'cliente_id': cliente.id} for i in range(elevadores)])
+    db.session.commit()
+    return cliente.id, list(range(primeiro, primeiro + elevadores))
+
+def gerar_chamados(total, elevadores, tecnicos, ate, rng):
+    """`total` chamados finalizados ao longo de 3 anos, inseridos por lotes fora dos eventos do ORM."""
+    inicio = ate - datetime.timedelta(days=3 * 365)
+    passo = (ate - inicio) / max(total, 1)
+    for base in range(0, total, LOTE):
+        linhas = []
+        for i in range(base, min(base + LOTE, total)):
+            timestamp = inicio + passo * i
+            linhas.append({'timestamp': timestamp, 'descricao_problema': rng.choice(frota_sintetica.PROBLEMAS), 'pessoa_presa': False, 'elevador_id': rng.choice(elevadores),
+                           'tecnico_id': rng.choice(tecnicos), 'status': 'finalizado', 'servicos_realizados': rng.choice(frota_sintetica.SERVICOS),
+                           'data_finalizacao': timestamp + datetime.timedelta(hours=2)})
+        db.session.execute(Chamado.__table__.insert(), linhas)
+        db.session.commit()
+
+def contar(elevadores):
+    return sum(db.session.query(func.count(t.id)).filter(t.elevador_id.in_(elevadores)).scalar() for t in (Chamado, ChamadoArquivo))
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--elevadores', type=int, default=500)
+    parser.add_argument('--chamados', type=int, default=1000000)
+    parser.add_argument('--antigo', type=int, default=20000, help='chamados do cliente pequeno purgado de forma síncrona')
+    parser.add_argument('--lote', type=int, default=upline.PURGA_LOTE)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    falhas = []
+    upline.PURGA_LOTE = args.lote
+
+    with app.app_context():
+        upline.inicializar_base_dados()
+        agora = datetime.datetime.utcnow()
+        frota_sintetica.gerar(clientes=1, elevadores=0, tecnicos=100, anos=1, chamados_por_elevador_ano=0, ate=agora, seed=args.seed)
+        tecnicos = [t for (t,) in db.session.query(Tecnico.id)]
+        grande_id, grandes = criar_cliente('GRANDE', args.elevadores, rng)
+        antigo_id, antigos = criar_cliente('ANTIGO', 20, rng)
+        outro_id, outros = criar_cliente('OUTRO', 50, rng)
+        inicio = time.perf_counter()
+        gerar_chamados(args.chamados, grandes, tecnicos, agora - datetime.timedelta(days=1), rng)
+        gerar_chamados(args.antigo, antigos, tecnicos, agora - datetime.timedelta(days=1), rng)
+        gerar_chamados(20000, outros, tecnicos, agora - datetime.timedelta(days=1), rng)
+        upline.reconstruir_resumos()
+        movidos = upline.arquivar_chamados()
+        print(f"{args.chamados + args.antigo + 20000} chamados gerados em {time.perf_counter() - inicio:.1f}s, {movidos} arquivados")
+        outros_antes = contar(outros)
+        resumos_outros = db.session.query(func.sum(ResumoChamado.total)).filter(ResumoChamado.elevador_id.in_(outros)).scalar()
+
+    # Cliente pequeno purgado de seguida no mesmo processo, sem thread: memória e duração da purga em lotes.
+    with app.app_context():
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        purga = upline.agendar_purga(cliente=db.session.get(Cliente, antigo_id))
+        upline.executar_purga(purga.id, lote=args.lote)
+        duracao = time.perf_counter() - inicio
+        pico = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        estado_antigo = db.session.get(Purga, purga.id).estado
+    print(f"purga síncrona, {args.antigo} chamados: {estado_antigo} em {duracao:.1f}s, pico de {pico:.0f} MB alocados")
+    if estado_antigo != 'concluida':
+        falhas.append(f"a purga do cliente pequeno ficou {estado_antigo}")
+
+    cliente_http = app.test_client()
+    cabecalhos = {'x-access-token': cliente_http.post('/admin/login', json={'username': 'admin', 'password': 'password'}).get_json()['token']}
+
+    rss_antes = rss_mb()
+    inicio = time.perf_counter()
+    resposta = cliente_http.delete(f'/admin/cliente/{grande_id}', headers=cabecalhos)
+    pedido = time.perf_counter() - inicio
+    corpo = resposta.get_json()
+    print(f"DELETE /admin/cliente/{grande_id}: {resposta.status_code} em {pedido * 1000:.0f} ms: {corpo}")
+    if resposta.status_code != 202:
+        falhas.append(f"a remoção do cliente grande respondeu {resposta.status_code}")
+    if cliente_http.post('/chamado/abrir', json={'codigo_qr': 'GRANDE-0', 'pessoa_presa': False, 'descricao': 'Depois de apagar'}).status_code != 404:
+        falhas.append("um elevador do cliente removido ainda aceita chamados")
+    listados = {c['id'] for c in cliente_http.get('/admin/clientes', headers=cabecalhos).get_json()}
+    if grande_id in listados:
+        falhas.append("o cliente removido continua na listagem")
+
+    # Durante a purga: outros clientes abrem chamados e o progresso é consultado.
+    tempos, progresso, i = [], [], 0
+    while True:
+        estado = cliente_http.get(corpo['progresso'], headers=cabecalhos).get_json()
+        progresso.append(estado['progresso'])
+        if estado['estado'] in ('concluida', 'erro'):
+            break
+        inicio_abrir = time.perf_counter()
+        cliente_http.post('/chamado/abrir', json={'codigo_qr': f'OUTRO-{i % len(outros)}', 'pessoa_presa': False, 'descricao': 'Durante a purga'})
+        tempos.append((time.perf_counter() - inicio_abrir) * 1000)
+        i += 1
+        time.sleep(0.2)
+    purga = time.perf_counter() - inicio
+    print(f"purga em segundo plano: {estado['estado']} em {purga:.1f}s, {estado['chamados_apagados']}/{estado['chamados_total']} chamados, "
+          f"lotes de {args.lote}; RSS máximo do processo {rss_antes:.0f} -> {rss_mb():.0f} MB")
+    if tempos:
+        print(f"/chamado/abrir de outro cliente durante a purga: {len(tempos)} pedidos, p50 {statistics.median(tempos):.1f} ms, máximo {max(tempos):.1f} ms")
+    if estado['estado'] != 'concluida' or estado['chamados_apagados'] != estado['chamados_total']:
+        falhas.append(f"purga: {estado}")
+    if progresso != sorted(progresso):
+        falhas.append("o progresso andou para trás")
+
+    with app.app_context():
+        restantes = contar(grandes)
+        if restantes or db.session.query(Elevador.id).filter(Elevador.id.in_(grandes)).first() or db.session.get(Cliente, grande_id):
+            falhas.append(f"o cliente removido deixou {restantes} chamados, elevadores ou o próprio cliente")
+        if db.session.query(ResumoChamado.id).filter(ResumoChamado.elevador_id.in_(grandes + antigos), ResumoChamado.total != 0).first():
+            falhas.append("ficaram resumos dos elevadores removidos")
+        # Com a deduplicação, só o primeiro relato de cada elevador cria chamado.
+        if contar(outros) != outros_antes + min(i, len(outros)):
+            falhas.append(f"o outro cliente tinha {outros_antes} chamados e ficou com {contar(outros)}")
+        if db.session.query(func.count(RemocaoCatalogo.id)).filter(RemocaoCatalogo.tabela == 'elevador', RemocaoCatalogo.registo_id.in_(grandes)).scalar() != len(grandes):
+            falhas.append("faltam lápides dos elevadores removidos")
+        if db.session.query(func.sum(ResumoChamado.total)).filter(ResumoChamado.elevador_id.in_(outros)).scalar() < resumos_outros:
+            falhas.append("os resumos do outro cliente diminuíram")
+        if upline.verificar_resumos():
+            falhas.append("resumos divergentes")
+        # 'integrity-check' com rank=1 compara o índice de busca com chamado e chamado_arquivo.
+        db.session.execute(db.text("INSERT INTO chamado_busca(chamado_busca, rank) VALUES('integrity-check', 1)"))
+        db.session.commit()
+
+    upline.estado_app(app).buffer_localizacoes.parar()
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    print("Purga OK." if not falhas else f"{len(falhas)} verificações falharam.")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
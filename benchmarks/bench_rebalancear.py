@@ -0,0 +1,113 @@
+# benchmarks/bench_rebalancear.py
+# Mede rebalancear_fila com uma fila grande (10k chamados em aberto x 2k técnicos por omissão)
+# e verifica o resultado: capacidade dos técnicos, pessoa presa primeiro, rejeições
+# respeitadas, eventos e resumos do dashboard consistentes com os chamados.
+# Uso: python benchmarks/bench_rebalancear.py [--chamados 10000] [--tecnicos 2000] [--ocupados 0.3]
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-rebalancear-'), 'rebalancear.db')
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import func
+import app as upline
+from app import db, Elevador, Tecnico, Chamado, EventoChamado
+from geo import calcular_distancia, matriz_distancias
+import frota_sintetica
+
+app = upline.criar_app()
+
+def popular(args, rng):
+    """Frota sem histórico, alguns técnicos já com chamados atribuídos e a fila em aberto."""
+    frota_sintetica.gerar(clientes=50, elevadores=args.elevadores, tecnicos=args.tecnicos, anos=0, plantao=1, seed=args.seed)
+    elevadores = [e for (e,) in db.session.query(Elevador.id)]
+    tecnicos = [t for (t,) in db.session.query(Tecnico.id).filter(Tecnico.de_plantao.is_(True), Tecnico.last_latitude.isnot(None))]
+    agora = datetime.datetime.utcnow()
+    linhas = []
+    for tecnico_id in rng.sample(tecnicos, int(len(tecnicos) * args.ocupados)):
+        for _ in range(rng.randint(1, upline.DESPACHO_CARGA_MAXIMA)):
+            linhas.append({'timestamp': agora - datetime.timedelta(hours=2), 'descricao_problema': 'Em curso', 'pessoa_presa': False, 'elevador_id': rng.choice(elevadores), 'tecnico_id': tecnico_id, 'status': 'atribuido'})
+    for i in range(args.chamados):
+        linhas.append({'timestamp': agora - datetime.timedelta(seconds=args.chamados - i), 'descricao_problema': 'Na fila', 'pessoa_presa': rng.random() < args.presa, 'elevador_id': rng.choice(elevadores), 'tecnico_id': None, 'status': 'aberto'})
+    frota_sintetica.inserir_em_lotes(db.session.connection(), Chamado.__table__, linhas)
+    db.session.commit()
+    # Algumas rejeições: esses técnicos não podem voltar a receber o mesmo chamado.
+    abertos = [c for (c,) in db.session.query(Chamado.id).filter(Chamado.status == 'aberto')]
+    rejeicoes = [{'chamado_id': c, 'tecnico_id': rng.choice(tecnicos), 'tipo': 'rejeitado', 'criado_em': agora} for c in rng.sample(abertos, min(len(abertos), 200))]
+    db.session.execute(EventoChamado.__table__.insert(), rejeicoes)
+    db.session.commit()
+    upline.reconstruir_resumos()
+    return {(r['chamado_id'], r['tecnico_id']) for r in rejeicoes}
+
+def verificar(rejeicoes, atribuidos_antes):
+    falhas = []
+    cargas = dict(db.session.query(Chamado.tecnico_id, func.count(Chamado.id)).filter(Chamado.status == 'atribuido').group_by(Chamado.tecnico_id).all())
+    acima = {t: n for t, n in cargas.items() if n > upline.DESPACHO_CARGA_MAXIMA}
+    if acima:
+        falhas.append(f"{len(acima)} técnicos acima da carga máxima")
+    abertos_presa = db.session.query(func.count(Chamado.id)).filter(Chamado.status == 'aberto', Chamado.pessoa_presa.is_(True)).scalar()
+    novos_normais = db.session.query(func.count(Chamado.id)).filter(Chamado.status == 'atribuido', Chamado.pessoa_presa.is_(False), Chamado.descricao_problema == 'Na fila').scalar()
+    if abertos_presa and novos_normais:
+        falhas.append(f"{abertos_presa} chamados com pessoa presa ficaram na fila e {novos_normais} normais foram atribuídos")
+    atribuicoes = set(db.session.query(Chamado.id, Chamado.tecnico_id).filter(Chamado.status == 'atribuido'))
+    if atribuicoes & rejeicoes:
+        falhas.append(f"{len(atribuicoes & rejeicoes)} chamados voltaram para quem os rejeitou")
+    eventos = db.session.query(func.count(EventoChamado.id)).filter(EventoChamado.tipo == 'atribuido').scalar()
+    if eventos != len(atribuicoes) - atribuidos_antes:
+        falhas.append(f"{eventos} eventos 'atribuido' para {len(atribuicoes) - atribuidos_antes} atribuições")
+    revisoes = db.session.query(func.count(Chamado.id)).filter(Chamado.descricao_problema == 'Na fila', Chamado.status == 'atribuido', Chamado.revisao != 2).scalar()
+    if revisoes:
+        falhas.append(f"{revisoes} chamados atribuídos sem incrementar a revisão")
+    divergencias = upline.verificar_resumos()
+    if divergencias:
+        falhas.append(f"{len(divergencias)} chaves de resumo divergentes")
+    return falhas
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chamados', type=int, default=10000)
+    parser.add_argument('--tecnicos', type=int, default=2000)
+    parser.add_argument('--elevadores', type=int, default=5000)
+    parser.add_argument('--ocupados', type=float, default=0.3, help='fração de técnicos que já têm chamados atribuídos')
+    parser.add_argument('--presa', type=float, default=0.1, help='fração de chamados com pessoa presa')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        upline.inicializar_base_dados()
+        rejeicoes = popular(args, rng)
+        atribuidos_antes = db.session.query(func.count(Chamado.id)).filter(Chamado.status == 'atribuido').scalar()
+        resumo = upline.rebalancear_fila()
+        print(', '.join(f"{chave}={valor}" for chave, valor in resumo.items()))
+        falhas = verificar(rejeicoes, atribuidos_antes)
+
+        # A mesma matriz com a função escalar, estimada a partir de uma amostra.
+        pontos = db.session.query(Elevador.latitude, Elevador.longitude).limit(100).all()
+        tecnicos = db.session.query(Tecnico.last_latitude, Tecnico.last_longitude).filter(Tecnico.last_latitude.isnot(None)).all()
+        inicio = time.perf_counter()
+        for lat, lon in pontos:
+            for t_lat, t_lon in tecnicos:
+                calcular_distancia(lat, lon, t_lat, t_lon)
+        escalar = (time.perf_counter() - inicio) * resumo['abertos'] / len(pontos)
+        inicio = time.perf_counter()
+        matriz_distancias([lat for lat, _ in pontos] * (resumo['abertos'] // len(pontos)), [lon for _, lon in pontos] * (resumo['abertos'] // len(pontos)),
+                          [lat for lat, _ in tecnicos], [lon for _, lon in tecnicos])
+        vetorial = time.perf_counter() - inicio
+        print(f"matriz {resumo['abertos']}x{len(tecnicos)}: NumPy {vetorial:.2f}s, calcular_distancia por par ~{escalar:.1f}s ({escalar / vetorial:.0f}x)")
+
+    upline.estado_app(app).buffer_localizacoes.parar()
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    print("Rebalanceamento OK." if not falhas else f"{len(falhas)} verificações falharam.")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
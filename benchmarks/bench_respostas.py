@@ -0,0 +1,109 @@
+# benchmarks/bench_respostas.py
+# Tamanho e CPU das listagens grandes na frota sintética: JSON do Flask (como antes) contra
+# orjson, formato colunar (?formato=colunas) e compressão gzip/brotli pelo Accept-Encoding.
+# Confirma que todas as variantes descodificam para os mesmos dados.
+# Uso: python benchmarks/bench_respostas.py [--elevadores 5000] [--anos 3] [--repeticoes 10]
+
+import argparse
+import datetime
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-respostas-'), 'respostas.db')
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask.json.provider import DefaultJSONProvider
+import app as upline
+import respostas
+from app import db, Chamado
+import frota_sintetica
+
+app = upline.criar_app()
+
+def descomprimir(resposta):
+    codificacao = resposta.headers.get('Content-Encoding')
+    if codificacao == 'gzip':
+        return gzip.decompress(resposta.data)
+    if codificacao == 'br':
+        return respostas.brotli.decompress(resposta.data)
+    return resposta.data
+
+def de_colunas(corpo):
+    """Volta a pôr o formato colunar como lista de dicionários, para comparar com o normal."""
+    if isinstance(corpo, dict) and set(corpo) == {'campos', 'linhas'}:
+        return [dict(zip(corpo['campos'], linha)) for linha in corpo['linhas']]
+    if isinstance(corpo, dict):
+        return {chave: de_colunas(valor) for chave, valor in corpo.items()}
+    return corpo
+
+def medir(cliente, caminho, cabecalhos, repeticoes):
+    """(bytes transferidos, mediana de CPU do processo em ms, corpo descodificado)."""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.process_time()
+        resposta = cliente.get(caminho, headers=cabecalhos)
+        tempos.append((time.process_time() - inicio) * 1000)
+    return len(resposta.data), statistics.median(tempos), de_colunas(json.loads(descomprimir(resposta)))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--elevadores', type=int, default=5000)
+    parser.add_argument('--tecnicos', type=int, default=300)
+    parser.add_argument('--anos', type=int, default=3)
+    parser.add_argument('--repeticoes', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    falhas = []
+
+    with app.app_context():
+        upline.inicializar_base_dados()
+        resumo = frota_sintetica.gerar(elevadores=args.elevadores, tecnicos=args.tecnicos, anos=args.anos, ate=datetime.datetime.utcnow(), seed=args.seed)
+        tecnico_id = db.session.query(Chamado.tecnico_id).group_by(Chamado.tecnico_id).order_by(db.func.count().desc()).first()[0]
+    print(f"frota: {resumo['elevadores']} elevadores, {resumo['chamados']} chamados; orjson {'instalado' if respostas.orjson else 'EM FALTA'}, "
+          f"brotli {'instalado' if respostas.brotli else 'em falta (só gzip)'}")
+    cliente = app.test_client()
+    token = {'x-access-token': cliente.post('/admin/login', json={'username': 'admin', 'password': 'password'}).get_json()['token']}
+    rotas = [('admin: todos os chamados', '/admin/chamados'), ('admin: página de 500', '/admin/chamados?limit=500'),
+             ('elevadores', '/admin/elevadores'), ('técnico: os seus chamados', f'/tecnico/{tecnico_id}/chamados')]
+    codificacoes = ['gzip'] + (['br'] if respostas.brotli else [])
+
+    provedor = app.json
+    for rotulo, caminho in rotas:
+        repeticoes = max(1, args.repeticoes // 5) if caminho == '/admin/chamados' else args.repeticoes
+        # Antes: o provedor JSON por omissão do Flask (chaves ordenadas, ASCII), sem compressão.
+        app.json = DefaultJSONProvider(app)
+        referencia = medir(cliente, caminho, token, repeticoes)
+        app.json = provedor
+        variantes = [('orjson', caminho, {})] + [(c, caminho, {'Accept-Encoding': c}) for c in codificacoes]
+        separador = '&' if '?' in caminho else '?'
+        variantes += [('colunas', caminho + separador + 'formato=colunas', {})] + [(f'colunas+{c}', caminho + separador + 'formato=colunas', {'Accept-Encoding': c}) for c in codificacoes]
+        print(f"\n{rotulo} ({caminho})")
+        print(f"  {'antes (json do Flask)':<22} {referencia[0]:>11,} bytes  {referencia[1]:8.1f} ms CPU")
+        for nome, url, extra in variantes:
+            tamanho, cpu, corpo = medir(cliente, url, dict(token, **extra), repeticoes)
+            print(f"  {nome:<22} {tamanho:>11,} bytes  {cpu:8.1f} ms CPU   ({tamanho / referencia[0]:6.1%} do tamanho, {cpu / referencia[1]:6.1%} do CPU)")
+            if corpo != referencia[2]:
+                falhas.append(f"{nome} em {caminho} não devolve os mesmos dados")
+
+    agora = datetime.datetime.utcnow()
+    datas = [agora - datetime.timedelta(minutes=17 * i) for i in range(10000)]
+    antes = timeit.timeit(lambda: [d.strftime('%d/%m/%Y %H:%M') for d in datas], number=10)
+    depois = timeit.timeit(lambda: [respostas.formatar_data(d) for d in datas], number=10)
+    print(f"\ndatas dd/mm/AAAA HH:MM: strftime {antes / 1e5 * 1e9:.0f} ns, formatar_data {depois / 1e5 * 1e9:.0f} ns")
+    if any(respostas.formatar_data(d) != d.strftime('%d/%m/%Y %H:%M') for d in datas):
+        falhas.append("formatar_data difere de strftime")
+
+    upline.estado_app(app).buffer_localizacoes.parar()
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
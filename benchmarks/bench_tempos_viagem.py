@@ -0,0 +1,117 @@
+# benchmarks/bench_tempos_viagem.py
+# Gera um CSV sintético de tempos de viagem para São Paulo (um rio que custa 20 min a atravessar),
+# constrói a grelha binária, mede as consultas e confirma que o despacho passa a escolher o
+# técnico mais rápido em vez do mais próximo em linha reta.
+# Uso: python benchmarks/bench_tempos_viagem.py [--celula 0.02] [--consultas 200000]
+
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+DIRETORIO = tempfile.mkdtemp(prefix='upline-tempos-')
+GRELHA = os.path.join(DIRETORIO, 'sao_paulo.uptv')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(DIRETORIO, 'tempos.db')
+os.environ['TEMPOS_VIAGEM_FICHEIROS'] = GRELHA
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from geo import calcular_distancia
+from tempos_viagem import construir_de_csv, GrelhaTempos
+
+LIMITES = (-23.78, -23.45, -46.83, -46.37)
+RIO_LATITUDE = -23.60
+VELOCIDADE_KMH = 30
+TRAVESSIA_SEGUNDOS = 20 * 60
+
+def tempo_sintetico(lat1, lon1, lat2, lon2):
+    segundos = calcular_distancia(lat1, lon1, lat2, lon2) / VELOCIDADE_KMH * 3600
+    if (lat1 < RIO_LATITUDE) != (lat2 < RIO_LATITUDE):
+        segundos += TRAVESSIA_SEGUNDOS
+    return round(segundos)
+
+def gerar_csv(caminho, celula):
+    lat_min, lat_max, lon_min, lon_max = LIMITES
+    centros = [(lat_min + (i + 0.5) * celula, lon_min + (j + 0.5) * celula)
+               for i in range(int((lat_max - lat_min) // celula) + 1) for j in range(int((lon_max - lon_min) // celula) + 1)]
+    with open(caminho, 'w', newline='', encoding='utf-8') as ficheiro:
+        escritor = csv.writer(ficheiro)
+        escritor.writerow(['lat_origem', 'lon_origem', 'lat_destino', 'lon_destino', 'segundos'])
+        for lat1, lon1 in centros:
+            escritor.writerows([f'{lat1:.5f}', f'{lon1:.5f}', f'{lat2:.5f}', f'{lon2:.5f}', tempo_sintetico(lat1, lon1, lat2, lon2)] for lat2, lon2 in centros)
+    return len(centros) ** 2
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--celula', type=float, default=0.02)
+    parser.add_argument('--consultas', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    falhas = []
+
+    entrada = os.path.join(DIRETORIO, 'tempos.csv')
+    pares = gerar_csv(entrada, args.celula)
+    inicio = time.perf_counter()
+    resumo = construir_de_csv(entrada, GRELHA, celula=args.celula, limites=LIMITES)
+    print(f"grelha construída em {time.perf_counter() - inicio:.2f}s a partir de {pares} pares ({os.path.getsize(entrada) / 1e6:.1f} MB de CSV): " + ', '.join(f'{k}={v}' for k, v in resumo.items()))
+
+    grelha = GrelhaTempos(GRELHA)
+    pontos = [(rng.uniform(LIMITES[0], LIMITES[1]), rng.uniform(LIMITES[2], LIMITES[3])) for _ in range(1000)]
+    consultas = [pontos[rng.randrange(1000)] + pontos[rng.randrange(1000)] for _ in range(args.consultas)]
+    inicio = time.perf_counter()
+    for consulta in consultas:
+        grelha.segundos(*consulta)
+    duracao = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    for consulta in consultas:
+        calcular_distancia(*consulta)
+    referencia = time.perf_counter() - inicio
+    print(f"consulta de ETA: {duracao / args.consultas * 1e6:.2f} us (calcular_distancia: {referencia / args.consultas * 1e6:.2f} us)")
+
+    import app as upline
+    from app import db, Elevador, Tecnico, Cliente
+    app = upline.criar_app()
+    # Chamado a sul do rio; o técnico A está a 3 km do outro lado, o B a 8 km do mesmo lado.
+    with app.app_context():
+        upline.inicializar_base_dados()
+        db.session.execute(Tecnico.__table__.update().values(de_plantao=False))
+        cliente = Cliente(nome='Cliente ETA', possui_contrato=True)
+        db.session.add(cliente)
+        db.session.flush()
+        db.session.add(Elevador(codigo_qr='ETA-1', endereco='Sul do rio', latitude=RIO_LATITUDE - 0.012, longitude=-46.60, cliente_id=cliente.id))
+        db.session.add_all([Tecnico(nome='Técnico A (outra margem)', username='eta_a', password='x', de_plantao=True, last_latitude=RIO_LATITUDE + 0.015, last_longitude=-46.60),
+                            Tecnico(nome='Técnico B (mesma margem)', username='eta_b', password='x', de_plantao=True, last_latitude=RIO_LATITUDE - 0.012, last_longitude=-46.60 + 0.078)])
+        db.session.commit()
+        upline.estado_app().indice_tecnicos.carregado_em = None
+        a = upline.custo_viagem_km(RIO_LATITUDE + 0.015, -46.60, RIO_LATITUDE - 0.012, -46.60)
+        b = upline.custo_viagem_km(RIO_LATITUDE - 0.012, -46.60 + 0.078, RIO_LATITUDE - 0.012, -46.60)
+        print(f"custo em km equivalentes: A {a:.1f} (linha reta {calcular_distancia(RIO_LATITUDE + 0.015, -46.60, RIO_LATITUDE - 0.012, -46.60):.1f} km), "
+              f"B {b:.1f} (linha reta {calcular_distancia(RIO_LATITUDE - 0.012, -46.60 + 0.078, RIO_LATITUDE - 0.012, -46.60):.1f} km)")
+    resposta = app.test_client().post('/chamado/abrir', json={'codigo_qr': 'ETA-1', 'pessoa_presa': False, 'descricao': 'Teste ETA'}).get_json()
+    print(f"abrir_chamado atribuiu a: {resposta.get('tecnico_atribuido')}")
+    if resposta.get('tecnico_atribuido') != 'Técnico B (mesma margem)':
+        falhas.append("o despacho não escolheu o técnico mais rápido")
+
+    chamados = np.array([(rng.uniform(LIMITES[0], LIMITES[1]), rng.uniform(LIMITES[2], LIMITES[3])) for _ in range(10000)])
+    tecnicos = np.array([(rng.uniform(LIMITES[0], LIMITES[1]), rng.uniform(LIMITES[2], LIMITES[3])) for _ in range(2000)])
+    with app.app_context():
+        inicio = time.perf_counter()
+        custos = upline.matriz_custos_viagem(chamados[:, 0], chamados[:, 1], tecnicos[:, 0], tecnicos[:, 1])
+        duracao = time.perf_counter() - inicio
+        amostra = [(rng.randrange(10000), rng.randrange(2000)) for _ in range(1000)]
+        divergentes = sum(1 for i, j in amostra if abs(custos[i, j] - upline.custo_viagem_km(tecnicos[j, 0], tecnicos[j, 1], chamados[i, 0], chamados[i, 1])) > 0.01)
+    print(f"matriz de custos 10000x2000 com ETA: {duracao:.2f}s; {divergentes} de {len(amostra)} pares diferentes de custo_viagem_km")
+    if divergentes:
+        falhas.append("matriz_custos_viagem diverge de custo_viagem_km")
+
+    upline.estado_app(app).buffer_localizacoes.parar()
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+# benchmarks/carga.py
+# Teste de carga: reproduz uma mistura realista de pedidos (chatbot a abrir chamados,
+# técnicos a enviar posições e a consultar chamados, admin no dashboard e nas listagens)
+# e reporta p50/p95/p99 e débito por rota. Compara duas execuções para apanhar regressões.
+#
+#   python benchmarks/carga.py correr [--gerar] [--banco URL | --url http://localhost:8000] [--duracao 30] [--threads 8] [--saida base.json]
+#   python benchmarks/carga.py comparar base.json novo.json [--tolerancia 0.2]
+#
+# Com --banco (ou DATABASE_URL) a app corre neste processo, sobre SQLite ou PostgreSQL;
+# --gerar popula primeiro uma base temporária (ou a de --banco) com frota_sintetica.py.
+# Com --url os pedidos vão por HTTP para um servidor já a correr (p.ex. gunicorn, com o gunicorn.conf.py da raiz).
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import frota_sintetica
+
+# Mistura de pedidos: (rota, peso). Os pesos aproximam um dia normal de operação.
+MISTURA = [
+    ('POST /tecnico/atualizar_localizacao', 45),
+    ('GET /tecnico/<id>/chamados/alteracoes', 30),
+    ('POST /chamado/abrir', 4),
+    ('POST /chamado/<id>/finalizar', 4),
+    ('GET /admin/dashboard/stats', 4),
+    ('GET /admin/chamados?limit=100', 5),
+    ('GET /admin/elevadores', 3),
+    ('GET /admin/tecnicos', 3),
+    ('GET /admin/clientes', 2),
+]
+
+class ClienteApp:
+    """Pedidos à app Flask no mesmo processo (sem rede)."""
+    def __init__(self, app):
+        self.http = app.test_client()
+
+    def pedir(self, metodo, caminho, corpo=None, cabecalhos=None):
+        resposta = self.http.open(caminho, method=metodo, json=corpo, headers=cabecalhos or {})
+        return resposta.status_code, resposta.headers, resposta.get_json(silent=True)
+
+class ClienteHTTP:
+    """Pedidos HTTP com uma ligação keep-alive por thread."""
+    def __init__(self, url):
+        partes = urllib.parse.urlsplit(url)
+        classe = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+        self.conexao = classe(partes.hostname, partes.port, timeout=60)
+        self.base = partes.path.rstrip('/')
+
+    def pedir(self, metodo, caminho, corpo=None, cabecalhos=None):
+        cabecalhos = dict(cabecalhos or {})
+        dados = None
+        if corpo is not None:
+            dados = json.dumps(corpo).encode('utf-8')
+            cabecalhos['Content-Type'] = 'application/json'
+        try:
+            self.conexao.request(metodo, self.base + caminho, body=dados, headers=cabecalhos)
+            resposta = self.conexao.getresponse()
+            conteudo = resposta.read()
+        except (http.client.HTTPException, OSError):
+            self.conexao.close()
+            raise
+        try:
+            corpo_resposta = json.loads(conteudo) if conteudo and 'json' in (resposta.getheader('Content-Type') or '') else None
+        except ValueError:
+            corpo_resposta = None
+        return resposta.status, resposta.headers, corpo_resposta
+
+class Contexto:
+    """Estado partilhado pelas threads: token, ids conhecidos, cursores e ETags."""
+    def __init__(self, cliente):
+        self.lock = threading.Lock()
+        estado, _, corpo = cliente.pedir('POST', '/admin/login', {'username': 'admin', 'password': 'password'})
+        if estado != 200:
+            raise SystemExit(f"Login do admin falhou (HTTP {estado}).")
+        self.token = corpo['token']
+        _, _, elevadores = cliente.pedir('GET', '/admin/elevadores', cabecalhos={'x-access-token': self.token})
+        _, _, tecnicos = cliente.pedir('GET', '/admin/tecnicos', cabecalhos={'x-access-token': self.token})
+        self.codigos_qr = [e['codigo_qr'] for e in elevadores]
+        self.tecnicos = [t['id'] for t in tecnicos if t['de_plantao']] or [t['id'] for t in tecnicos]
+        self.cursores = {}
+        self.etags = {}
+        self.abertos = []
+
+    def admin(self, caminho):
+        cabecalhos = {'x-access-token': self.token}
+        with self.lock:
+            if caminho in self.etags:
+                cabecalhos['If-None-Match'] = self.etags[caminho]
+        return cabecalhos
+
+def preparar_pedido(rota, contexto, rng):
+    """Devolve (metodo, caminho, corpo, cabecalhos) para uma rota da mistura."""
+    if rota == 'POST /tecnico/atualizar_localizacao':
+        _, (lat_min, lat_max, lon_min, lon_max), _ = rng.choice(frota_sintetica.CIDADES)
+        return 'POST', '/tecnico/atualizar_localizacao', {'tecnico_id': rng.choice(contexto.tecnicos), 'latitude': rng.uniform(lat_min, lat_max), 'longitude': rng.uniform(lon_min, lon_max), 'ts': time.time()}, None
+    if rota == 'GET /tecnico/<id>/chamados/alteracoes':
+        tecnico_id = rng.choice(contexto.tecnicos)
+        cursor = contexto.cursores.get(tecnico_id)
+        return 'GET', f'/tecnico/{tecnico_id}/chamados/alteracoes' + (f'?desde={cursor}' if cursor is not None else ''), None, None
+    if rota == 'POST /chamado/abrir':
+        return 'POST', '/chamado/abrir', {'codigo_qr': rng.choice(contexto.codigos_qr), 'pessoa_presa': rng.random() < 0.08, 'descricao': rng.choice(frota_sintetica.PROBLEMAS)}, None
+    if rota == 'POST /chamado/<id>/finalizar':
+        with contexto.lock:
+            chamado_id = contexto.abertos.pop(rng.randrange(len(contexto.abertos))) if contexto.abertos else None
+        if chamado_id is None:
+            return None
+        return 'POST', f'/chamado/{chamado_id}/finalizar', {'servicos_realizados': rng.choice(frota_sintetica.SERVICOS)}, None
+    caminho = rota.split(' ', 1)[1]
+    return 'GET', caminho, None, contexto.admin(caminho)
+
+def registar_resposta(rota, pedido, estado, cabecalhos, corpo, contexto):
+    if rota == 'GET /tecnico/<id>/chamados/alteracoes' and corpo:
+        tecnico_id = int(pedido[1].split('/')[2])
+        contexto.cursores[tecnico_id] = corpo['cursor']
+    elif rota == 'POST /chamado/abrir' and corpo and 'id_chamado' in corpo:
+        with contexto.lock:
+            contexto.abertos.append(corpo['id_chamado'])
+    elif rota.startswith('GET /admin/') and estado == 200 and cabecalhos.get('ETag'):
+        with contexto.lock:
+            contexto.etags[pedido[1]] = cabecalhos.get('ETag')
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return None
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))]
+
+def correr(criar_cliente, duracao, threads, seed, pedidos_max=None):
+    contexto = Contexto(criar_cliente())
+    rotas, pesos = zip(*MISTURA)
+    medicoes = {rota: [] for rota in rotas}
+    erros = {rota: 0 for rota in rotas}
+    restantes = [pedidos_max]
+    fim = time.perf_counter() + duracao
+
+    def trabalhador(indice):
+        rng = random.Random(seed * 1000 + indice)
+        cliente = criar_cliente()
+        while time.perf_counter() < fim:
+            if pedidos_max is not None:
+                with contexto.lock:
+                    if restantes[0] <= 0:
+                        return
+                    restantes[0] -= 1
+            rota = rng.choices(rotas, pesos)[0]
+            pedido = preparar_pedido(rota, contexto, rng)
+            if pedido is None:
+                continue
+            inicio = time.perf_counter()
+            try:
+                estado, cabecalhos, corpo = cliente.pedir(*pedido)
+            except (http.client.HTTPException, OSError):
+                estado, cabecalhos, corpo = 599, {}, None
+                cliente = criar_cliente()
+            decorrido = time.perf_counter() - inicio
+            with contexto.lock:
+                medicoes[rota].append(decorrido)
+                if estado >= 400:
+                    erros[rota] += 1
+            registar_resposta(rota, pedido, estado, cabecalhos, corpo, contexto)
+
+    inicio = time.perf_counter()
+    trabalhadores = [threading.Thread(target=trabalhador, args=(i,), daemon=True) for i in range(threads)]
+    for t in trabalhadores:
+        t.start()
+    for t in trabalhadores:
+        t.join()
+    total_segundos = time.perf_counter() - inicio
+
+    resultado = {}
+    for rota in list(rotas) + ['total']:
+        tempos = sorted(sum(medicoes.values(), []) if rota == 'total' else medicoes[rota])
+        if not tempos:
+            continue
+        resultado[rota] = {'pedidos': len(tempos), 'erros': sum(erros.values()) if rota == 'total' else erros[rota], 'por_segundo': len(tempos) / total_segundos,
+                           **{f'p{p}_ms': percentil(tempos, p) * 1000 for p in (50, 95, 99)}}
+    return {'meta': {'duracao_s': round(total_segundos, 2), 'threads': threads, 'seed': seed}, 'rotas': resultado}
+
+def imprimir(resultado):
+    print(f"{'rota':<42} {'pedidos':>8} {'erros':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for rota, r in resultado['rotas'].items():
+        print(f"{rota:<42} {r['pedidos']:>8} {r['erros']:>6} {r['por_segundo']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+def comparar(base, novo, tolerancia, minimo_ms, minimo_amostras):
+    """Imprime as diferenças por rota; devolve as rotas com regressão acima da tolerância."""
+    regressoes = []
+    print(f"{'rota':<42} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18} {'req/s':>16}")
+    for rota, r_novo in novo['rotas'].items():
+        r_base = base['rotas'].get(rota)
+        if not r_base:
+            print(f"{rota:<42} (rota nova)")
+            continue
+        colunas, problemas = [], []
+        # Com poucas amostras o p95 é praticamente o máximo: mostra-se mas não conta como regressão.
+        amostras_suficientes = min(r_base['pedidos'], r_novo['pedidos']) >= minimo_amostras
+        for chave in ('p50_ms', 'p95_ms', 'p99_ms'):
+            antes, depois = r_base[chave], r_novo[chave]
+            variacao = (depois - antes) / antes if antes else 0
+            regressao = chave == 'p95_ms' and amostras_suficientes and variacao > tolerancia and depois - antes > minimo_ms
+            colunas.append(f"{antes:>7.2f}→{depois:<7.2f}{'!' if regressao else ' ':>2}")
+            if regressao:
+                problemas.append(f"p95 +{variacao:.0%}")
+        variacao_debito = (r_novo['por_segundo'] - r_base['por_segundo']) / r_base['por_segundo'] if r_base['por_segundo'] else 0
+        if rota == 'total' and variacao_debito < -tolerancia:
+            problemas.append(f"débito {variacao_debito:.0%}")
+        print(f"{rota:<42} {' '.join(colunas)} {variacao_debito:>+15.0%}")
+        if problemas:
+            regressoes.append((rota, problemas))
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser()
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    p_correr = subcomandos.add_parser('correr', help='executa a mistura de pedidos e reporta latências')
+    p_correr.add_argument('--url', help='servidor já a correr (sem isto a app corre neste processo)')
+    p_correr.add_argument('--banco', default=os.environ.get('DATABASE_URL'), help='base de dados da app neste processo (sqlite:///... ou postgresql://...)')
+    p_correr.add_argument('--gerar', action='store_true', help='popula a base com a frota sintética antes de medir')
+    p_correr.add_argument('--duracao', type=float, default=30)
+    p_correr.add_argument('--pedidos', type=int, help='pára ao fim deste número de pedidos (além do limite de --duracao)')
+    p_correr.add_argument('--threads', type=int, default=8)
+    p_correr.add_argument('--saida', help='grava o resultado em JSON para comparar mais tarde')
+    frota_sintetica.argumentos_frota(p_correr)
+    p_comparar = subcomandos.add_parser('comparar', help='compara duas execuções gravadas com --saida')
+    p_comparar.add_argument('base')
+    p_comparar.add_argument('novo')
+    p_comparar.add_argument('--tolerancia', type=float, default=0.2, help='aumento relativo do p95 (e queda do débito total) tolerado')
+    p_comparar.add_argument('--minimo-ms', type=float, default=1.0, help='diferenças de p95 abaixo disto são ruído')
+    p_comparar.add_argument('--minimo-amostras', type=int, default=100, help='rotas com menos pedidos numa das execuções não são avaliadas')
+    args = parser.parse_args()
+
+    if args.comando == 'comparar':
+        with open(args.base) as f_base, open(args.novo) as f_novo:
+            regressoes = comparar(json.load(f_base), json.load(f_novo), args.tolerancia, args.minimo_ms, args.minimo_amostras)
+        for rota, problemas in regressoes:
+            print(f"REGRESSÃO: {rota}: {', '.join(problemas)}")
+        sys.exit(1 if regressoes else 0)
+
+    app = None
+    if args.url:
+        criar_cliente = lambda: ClienteHTTP(args.url)
+    else:
+        os.environ['DATABASE_URL'] = args.banco or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-carga-'), 'carga.db')
+        sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+        import app as upline
+        app = upline.criar_app()
+        with app.app_context():
+            upline.inicializar_base_dados()
+        if args.gerar:
+            inicio = time.perf_counter()
+            with app.app_context():
+                resumo = frota_sintetica.gerar_com_argumentos(args)
+            print(f"Frota gerada em {time.perf_counter() - inicio:.1f}s: " + ', '.join(f'{valor} {chave}' for chave, valor in resumo.items()))
+        criar_cliente = lambda: ClienteApp(app)
+
+    resultado = correr(criar_cliente, args.duracao, args.threads, args.seed, args.pedidos)
+    resultado['meta'].update(destino=args.url or os.environ['DATABASE_URL'].split('@')[-1])
+    imprimir(resultado)
+    if args.saida:
+        with open(args.saida, 'w') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    if app:
+        upline.estado_app(app).buffer_localizacoes.parar()
+
+if __name__ == '__main__':
+    main()
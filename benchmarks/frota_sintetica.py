@@ -0,0 +1,137 @@
+# benchmarks/frota_sintetica.py
+# Gerador determinístico de uma frota sintética: clientes, elevadores espalhados pelas
+# áreas urbanas de cidades brasileiras reais, técnicos com posição e anos de histórico de
+# chamados. A mesma semente produz sempre a mesma base de dados.
+# Uso: python benchmarks/frota_sintetica.py --banco sqlite:////tmp/frota.db [--elevadores 5000 --anos 3 ...]
+#      (--banco aceita também postgresql://...; por omissão usa DATABASE_URL)
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+# (nome, (lat_min, lat_max, lon_min, lon_max), peso na distribuição de elevadores e técnicos)
+CIDADES = [
+    ('São Paulo', (-23.78, -23.45, -46.83, -46.37), 40),
+    ('Rio de Janeiro', (-23.08, -22.75, -43.79, -43.10), 20),
+    ('Belo Horizonte', (-20.06, -19.78, -44.06, -43.86), 8),
+    ('Brasília', (-15.90, -15.70, -48.10, -47.80), 7),
+    ('Curitiba', (-25.64, -25.35, -49.39, -49.19), 7),
+    ('Porto Alegre', (-30.27, -29.93, -51.27, -51.09), 6),
+    ('Salvador', (-13.02, -12.79, -38.53, -38.30), 6),
+    ('Recife', (-8.16, -7.93, -35.02, -34.86), 6),
+]
+PROBLEMAS = ['Porta não fecha', 'Elevador parado entre andares', 'Ruído excessivo na casa de máquinas', 'Botoeira sem resposta',
+             'Desnivelamento na parada', 'Luz de emergência apagada', 'Elevador não atende chamadas', 'Trepidação durante a viagem']
+SERVICOS = ['Ajuste do operador de porta', 'Troca de botoeira', 'Regulagem do freio', 'Limpeza das guias', 'Reset do quadro de comando']
+PREFIXO_QR = 'FROTA'
+LOTE = 5000
+
+def ponto_em(cidade, rng):
+    _, (lat_min, lat_max, lon_min, lon_max), _ = cidade
+    return round(rng.uniform(lat_min, lat_max), 6), round(rng.uniform(lon_min, lon_max), 6)
+
+def inserir_em_lotes(conexao, tabela, linhas):
+    for i in range(0, len(linhas), LOTE):
+        conexao.execute(tabela.insert(), linhas[i:i + LOTE])
+
+def gerar(clientes=200, elevadores=5000, tecnicos=300, anos=3, chamados_por_elevador_ano=4, plantao=0.3, ate=datetime.datetime(2026, 1, 1), seed=42):
+    """Acrescenta a frota à base de dados da app (tem de correr dentro de app.app_context()).
+
+    Os inserts são feitos com executemany, fora dos eventos do ORM; no fim os resumos do
+    dashboard são reconstruídos e as versões dos catálogos incrementadas. Devolve um resumo.
+    """
+    import app as upline
+    from app import db, Cliente, Elevador, Tecnico, Chamado
+
+    rng = random.Random(seed)
+    cidades = [c for c in CIDADES for _ in range(c[2])]
+    proximo_id = {modelo: (db.session.query(db.func.max(modelo.id)).scalar() or 0) + 1 for modelo in (Cliente, Elevador, Tecnico)}
+
+    linhas_clientes = [{'id': proximo_id[Cliente] + i, 'nome': f'Cliente Sintético {proximo_id[Cliente] + i}', 'possui_contrato': rng.random() < 0.9} for i in range(clientes)]
+    linhas_elevadores = []
+    for i in range(elevadores):
+        elevador_id = proximo_id[Elevador] + i
+        cidade = rng.choice(cidades)
+        latitude, longitude = ponto_em(cidade, rng)
+        linhas_elevadores.append({'id': elevador_id, 'codigo_qr': f'{PREFIXO_QR}-{elevador_id:07d}', 'endereco': f'Rua Sintética {elevador_id}, {cidade[0]}',
+                                  'latitude': latitude, 'longitude': longitude, 'cliente_id': rng.choice(linhas_clientes)['id']})
+    linhas_tecnicos = []
+    for i in range(tecnicos):
+        tecnico_id = proximo_id[Tecnico] + i
+        latitude, longitude = ponto_em(rng.choice(cidades), rng)
+        linhas_tecnicos.append({'id': tecnico_id, 'nome': f'Técnico Sintético {tecnico_id}', 'username': f'frota{tecnico_id}', 'password': 'frota',
+                                'de_plantao': rng.random() < plantao, 'last_latitude': latitude, 'last_longitude': longitude, 'localizacao_atualizada_em': ate})
+
+    # Histórico: quase tudo finalizado; nos dois últimos dias cada técnico de plantão fica
+    # com no máximo um chamado 'atribuido', para não esgotar a capacidade do despacho.
+    inicio = ate - datetime.timedelta(days=365 * anos)
+    segundos = int((ate - inicio).total_seconds())
+    recentes = ate - datetime.timedelta(days=2)
+    livres = [t['id'] for t in linhas_tecnicos if t['de_plantao']]
+    linhas_chamados = []
+    for _ in range(int(elevadores * anos * chamados_por_elevador_ano)):
+        timestamp = inicio + datetime.timedelta(seconds=rng.randrange(segundos))
+        chamado = {'timestamp': timestamp, 'descricao_problema': rng.choice(PROBLEMAS), 'pessoa_presa': rng.random() < 0.08,
+                   'elevador_id': rng.choice(linhas_elevadores)['id'], 'tecnico_id': rng.choice(linhas_tecnicos)['id'] if linhas_tecnicos else None,
+                   'status': 'finalizado', 'servicos_realizados': rng.choice(SERVICOS), 'data_finalizacao': timestamp + datetime.timedelta(minutes=rng.randint(30, 600))}
+        if timestamp >= recentes and livres:
+            chamado.update(status='atribuido', tecnico_id=livres.pop(), servicos_realizados=None, data_finalizacao=None)
+        if chamado['tecnico_id'] is None:
+            chamado.update(status='aberto', servicos_realizados=None, data_finalizacao=None)
+        linhas_chamados.append(chamado)
+    linhas_chamados.sort(key=lambda c: c['timestamp'])
+
+    conexao = db.session.connection()
+    inserir_em_lotes(conexao, Cliente.__table__, linhas_clientes)
+    inserir_em_lotes(conexao, Elevador.__table__, linhas_elevadores)
+    inserir_em_lotes(conexao, Tecnico.__table__, linhas_tecnicos)
+    inserir_em_lotes(conexao, Chamado.__table__, linhas_chamados)
+    if conexao.dialect.name == 'postgresql':
+        # Os ids explícitos não avançam as sequências: sem isto, o próximo POST /admin/... repetia um id.
+        for modelo in (Cliente, Elevador, Tecnico):
+            tabela = modelo.__table__.name
+            conexao.execute(db.text(f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), coalesce(max(id), 0) + 1, false) FROM {tabela}"))
+    for nome in upline.TABELAS_CATALOGO:
+        upline.incrementar_versao_tabela(nome)
+    db.session.commit()
+    upline.reconstruir_resumos()
+    upline.estado_app().indice_tecnicos.carregado_em = None  # o próximo despacho recarrega o índice da base de dados
+    return {'clientes': clientes, 'elevadores': elevadores, 'tecnicos': tecnicos, 'de_plantao': sum(t['de_plantao'] for t in linhas_tecnicos), 'chamados': len(linhas_chamados)}
+
+def argumentos_frota(parser):
+    parser.add_argument('--clientes', type=int, default=200)
+    parser.add_argument('--elevadores', type=int, default=5000)
+    parser.add_argument('--tecnicos', type=int, default=300)
+    parser.add_argument('--anos', type=int, default=3)
+    parser.add_argument('--chamados-por-elevador-ano', type=float, default=4)
+    parser.add_argument('--plantao', type=float, default=0.3, help='fração de técnicos de plantão')
+    parser.add_argument('--seed', type=int, default=42)
+
+def gerar_com_argumentos(args):
+    return gerar(clientes=args.clientes, elevadores=args.elevadores, tecnicos=args.tecnicos, anos=args.anos,
+                 chamados_por_elevador_ano=args.chamados_por_elevador_ano, plantao=args.plantao, seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--banco', default=os.environ.get('DATABASE_URL'), help='URL da base de dados a popular')
+    argumentos_frota(parser)
+    args = parser.parse_args()
+    if not args.banco:
+        parser.error('indique --banco ou DATABASE_URL')
+    os.environ['DATABASE_URL'] = args.banco
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    import app as upline
+
+    app = upline.criar_app()
+    inicio = time.perf_counter()
+    with app.app_context():
+        upline.inicializar_base_dados()
+        resumo = gerar_com_argumentos(args)
+    upline.estado_app(app).buffer_localizacoes.parar()
+    print(f"Frota gerada em {time.perf_counter() - inicio:.1f}s: " + ', '.join(f'{valor} {chave}' for chave, valor in resumo.items()))
+
+if __name__ == '__main__':
+    main()
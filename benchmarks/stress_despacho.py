@@ -0,0 +1,153 @@
+# benchmarks/stress_despacho.py
+# Abre milhares de chamados em paralelo (várias threads contra a app) e verifica as
+# invariantes do despacho: nenhum técnico acima de DESPACHO_CARGA_MAXIMA, nenhum chamado
+# atribuído duas vezes, a fila despachada até à capacidade, pessoa presa à frente da fila
+# e resumos do dashboard consistentes.
+# Uso: python benchmarks/stress_despacho.py [--chamados 2000] [--threads 12] [--postgres postgresql://...]
+# (mais threads do que o pool do SQLAlchemy, 5 + 10 por omissão, só medem a espera por ligações)
+# (o PostgreSQL também pode vir de BENCH_POSTGRES_URL; sem ele corre num SQLite temporário)
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--chamados', type=int, default=2000)
+parser.add_argument('--threads', type=int, default=12)
+parser.add_argument('--tecnicos', type=int, default=200)
+parser.add_argument('--elevadores', type=int, default=500)
+parser.add_argument('--finalizar', type=int, default=300, help='chamados finalizados na 2ª fase (liberta lugares para a fila)')
+parser.add_argument('--presa', type=float, default=0.2, help='fração de chamados com pessoa presa')
+parser.add_argument('--postgres', default=os.environ.get('BENCH_POSTGRES_URL'))
+parser.add_argument('--seed', type=int, default=42)
+args = parser.parse_args()
+
+if args.postgres:
+    os.environ['DATABASE_URL'] = args.postgres
+else:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='upline-despacho-'), 'despacho.db')
+# Vários chamados por elevador de propósito: sem deduplicação, cada pedido cria o seu chamado.
+os.environ.setdefault('CHAMADO_DEDUP_MINUTOS', '0')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import func
+import app as upline
+from app import db, Cliente, Elevador, Tecnico, Chamado, EventoChamado
+
+app = upline.criar_app()
+
+def popular(rng):
+    with app.app_context():
+        upline.inicializar_base_dados()
+        for tabela in (EventoChamado.__table__, upline.ResumoChamado.__table__, Chamado.__table__):
+            db.session.execute(tabela.delete())
+        cliente = Cliente(nome='Cliente Stress', possui_contrato=True)
+        db.session.add(cliente)
+        db.session.flush()
+        db.session.execute(Elevador.__table__.insert(), [{'codigo_qr': f'STRESS-{i}', 'endereco': f'Rua {i}', 'latitude': -23.5 + rng.uniform(-0.3, 0.3), 'longitude': -46.6 + rng.uniform(-0.3, 0.3), 'cliente_id': cliente.id} for i in range(args.elevadores)])
+        db.session.execute(Tecnico.__table__.insert(), [{'nome': f'Técnico {i}', 'username': f'stress{i}', 'password': 'x', 'de_plantao': True, 'last_latitude': -23.5 + rng.uniform(-0.3, 0.3), 'last_longitude': -46.6 + rng.uniform(-0.3, 0.3)} for i in range(args.tecnicos)])
+        db.session.commit()
+        upline.estado_app(app).indice_tecnicos.carregar(db.session.query(Tecnico.id, Tecnico.last_latitude, Tecnico.last_longitude).filter(Tecnico.de_plantao.is_(True), Tecnico.last_latitude.isnot(None)).all())
+        return db.session.query(func.count(Tecnico.id)).filter(Tecnico.de_plantao.is_(True), Tecnico.last_latitude.isnot(None)).scalar() * upline.DESPACHO_CARGA_MAXIMA
+
+def em_paralelo(pedidos):
+    """Executa [(metodo, caminho, json)] em `args.threads` threads; devolve [(status, segundos)]."""
+    locais = threading.local()
+    def executar(pedido):
+        if not hasattr(locais, 'cliente'):
+            locais.cliente = app.test_client()
+        metodo, caminho, corpo = pedido
+        inicio = time.perf_counter()
+        resposta = locais.cliente.open(caminho, method=metodo, json=corpo)
+        return resposta.status_code, time.perf_counter() - inicio
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        return list(executor.map(executar, pedidos))
+
+def relatorio(nome, resultados, duracao):
+    tempos = sorted(t for _, t in resultados)
+    erros = sum(1 for status, _ in resultados if status >= 300)
+    print(f"{nome}: {len(resultados)} pedidos em {duracao:.1f}s ({len(resultados) / duracao:.0f}/s), "
+          f"p50 {statistics.median(tempos) * 1000:.0f} ms, p99 {tempos[int(len(tempos) * 0.99) - 1] * 1000:.0f} ms, {erros} erros")
+    return erros
+
+def estado():
+    with app.app_context():
+        chamados = db.session.query(Chamado.id, Chamado.status, Chamado.tecnico_id, Chamado.pessoa_presa).all()
+        atribuicoes = db.session.query(EventoChamado.chamado_id, func.count(EventoChamado.id)).filter(EventoChamado.tipo == 'atribuido').group_by(EventoChamado.chamado_id).all()
+        return chamados, dict(atribuicoes)
+
+def verificar(falhas, capacidade, finalizados=0):
+    chamados, atribuicoes = estado()
+    cargas = {}
+    for c in chamados:
+        if c.status == 'atribuido':
+            cargas[c.tecnico_id] = cargas.get(c.tecnico_id, 0) + 1
+    acima = {t: n for t, n in cargas.items() if n > upline.DESPACHO_CARGA_MAXIMA}
+    if acima:
+        falhas.append(f"técnicos acima da carga máxima: {acima}")
+    duplicados = [c for c, n in atribuicoes.items() if n > 1]
+    if duplicados:
+        falhas.append(f"{len(duplicados)} chamados atribuídos mais do que uma vez: {duplicados[:10]}")
+    atribuidos = sum(cargas.values())
+    esperado = min(len(chamados) - finalizados, capacidade)
+    if atribuidos != esperado:
+        falhas.append(f"{atribuidos} chamados atribuídos, esperados {esperado}")
+    with app.app_context():
+        divergencias = upline.verificar_resumos()
+    if divergencias:
+        falhas.append(f"{len(divergencias)} chaves de resumo divergentes")
+    return chamados
+
+def main():
+    rng = random.Random(args.seed)
+    capacidade = popular(rng)
+    print(f"{args.tecnicos} técnicos (capacidade {capacidade}), {args.elevadores} elevadores, {args.chamados} chamados, {args.threads} threads")
+    falhas = []
+
+    # 1ª fase: abertura concorrente; quando a capacidade acaba os chamados ficam na fila.
+    pedidos = [('POST', '/chamado/abrir', {'codigo_qr': f'STRESS-{rng.randrange(args.elevadores)}', 'pessoa_presa': rng.random() < args.presa, 'descricao': 'Stress'}) for _ in range(args.chamados)]
+    inicio = time.perf_counter()
+    erros = relatorio('abertura', em_paralelo(pedidos), time.perf_counter() - inicio)
+    if erros:
+        falhas.append(f"{erros} aberturas falharam")
+    with app.app_context():
+        # Despachos que desistiram por conflito deixam trabalho na fila para o próximo pedido.
+        restantes = upline.despachar_fila(limite=args.chamados)
+    print(f"despacho final após a abertura: {len(restantes)} chamados")
+    chamados = verificar(falhas, capacidade)
+
+    # 2ª fase: finalizar chamados liberta lugares; a fila tem de ser servida por prioridade.
+    fila = [c for c in chamados if c.status == 'aberto']
+    presos_na_fila = {c.id for c in fila if c.pessoa_presa}
+    atribuidos = [c.id for c in chamados if c.status == 'atribuido']
+    rng.shuffle(atribuidos)
+    a_finalizar = atribuidos[:args.finalizar]
+    inicio = time.perf_counter()
+    erros = relatorio('finalização', em_paralelo([('POST', f'/chamado/{i}/finalizar', {'servicos_realizados': 'Stress'}) for i in a_finalizar]), time.perf_counter() - inicio)
+    if erros:
+        falhas.append(f"{erros} finalizações falharam")
+    with app.app_context():
+        upline.despachar_fila(limite=args.chamados)
+    chamados = verificar(falhas, capacidade, finalizados=len(a_finalizar))
+    servidos = {c.id for c in chamados if c.status == 'atribuido'} & {c.id for c in fila}
+    if len(servidos) >= len(presos_na_fila):
+        if not presos_na_fila <= servidos:
+            falhas.append(f"{len(presos_na_fila - servidos)} chamados com pessoa presa ficaram na fila atrás de chamados normais")
+    elif not servidos <= presos_na_fila:
+        falhas.append(f"{len(servidos - presos_na_fila)} chamados normais foram servidos antes de chamados com pessoa presa")
+    print(f"fila antes da 2ª fase: {len(fila)} chamados ({len(presos_na_fila)} com pessoa presa); servidos depois de {len(a_finalizar)} finalizações: {len(servidos)}")
+
+    upline.estado_app(app).buffer_localizacoes.parar()
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    print("Invariantes do despacho OK." if not falhas else f"{len(falhas)} invariantes violadas.")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
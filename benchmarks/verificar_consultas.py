@@ -0,0 +1,115 @@
+# benchmarks/verificar_consultas.py
+# Verifica que as rotas de listagem fazem um número de consultas SQL que não cresce
+# com o número de linhas devolvidas (deteção de N+1 em relações lazy) e que a paginação por
+# cursor percorre chamados antigos, gravados com datas sem microssegundos, sem repetir nenhum.
+# Uso: python benchmarks/verificar_consultas.py  (termina com código 1 se alguma rota crescer)
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+CAMINHO_DB = os.path.join(tempfile.mkdtemp(prefix='upline-consultas-'), 'consultas.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + CAMINHO_DB
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+import app as upline
+from app import db, Cliente, Elevador, Tecnico, Chamado
+
+app = upline.criar_app()
+
+ROTAS = [
+    '/tecnico/{tecnico_id}/chamados',
+    '/admin/chamados',
+    '/admin/chamados?cliente_id={cliente_id}',
+    '/admin/chamados?limit=50&fields=id_chamado,status',
+    '/admin/chamados/busca?q=teste',
+    '/admin/chamados/busca?q=teste&tecnico_id={tecnico_id}',
+    '/admin/elevadores',
+    '/admin/clientes',
+    '/admin/tecnicos',
+]
+
+@contextmanager
+def contar_consultas():
+    contagem = {'total': 0}
+    def contar(*args):
+        contagem['total'] += 1
+    event.listen(db.engine, 'before_cursor_execute', contar)
+    try:
+        yield contagem
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', contar)
+
+def popular(linhas):
+    # Cada cliente/elevador/técnico novo garante que as relações não ficam em cache na sessão.
+    cliente = Cliente(nome='Cliente Consultas', possui_contrato=True)
+    tecnico = Tecnico(nome='Técnico Consultas', username=f'consultas{linhas}', password='x', de_plantao=True)
+    db.session.add_all([cliente, tecnico])
+    for i in range(linhas):
+        elevador = Elevador(codigo_qr=f'CONSULTAS-{linhas}-{i}', endereco=f'Rua {i}', latitude=-23.5, longitude=-46.6, cliente=Cliente(nome=f'Cliente {i}') if i % 2 else cliente)
+        db.session.add(elevador)
+        db.session.add(Chamado(descricao_problema='Teste', elevador=elevador, tecnico=tecnico if i % 3 else Tecnico(nome=f'T{linhas}-{i}', username=f'c{linhas}-{i}', password='x'), status='atribuido'))
+    db.session.commit()
+    return {'tecnico_id': tecnico.id, 'cliente_id': cliente.id}
+
+def medir(cliente_http, token, ids):
+    resultado = {}
+    for rota in ROTAS:
+        caminho = rota.format(**ids)
+        db.session.remove()
+        with contar_consultas() as contagem:
+            resposta = cliente_http.get(caminho, headers={'x-access-token': token})
+        if resposta.status_code != 200:
+            raise SystemExit(f"{caminho} respondeu {resposta.status_code}")
+        corpo = resposta.get_json()
+        resultado[rota] = (contagem['total'], len(corpo['chamados'] if isinstance(corpo, dict) else corpo))
+    return resultado
+
+def verificar_cursor_legado(cliente_http, token):
+    """Chamados gravados como antes (datas 'AAAA-MM-DD HH:MM:SS' do server_default) paginados de um em um."""
+    with app.app_context():
+        elevador_id = db.session.query(Elevador.id).first()[0]
+        for segundo in range(3):
+            db.session.execute(db.text("INSERT INTO chamado (timestamp, descricao_problema, pessoa_presa, elevador_id, status, revisao) "
+                                       f"VALUES ('2020-01-01 10:00:0{segundo}', 'Legado', 0, :elevador_id, 'finalizado', 1)"), {'elevador_id': elevador_id})
+        db.session.commit()
+        legados = {i for (i,) in db.session.query(Chamado.id).filter(Chamado.descricao_problema == 'Legado')}
+        upline.migrar_esquema()
+    vistos, cursor = [], None
+    for _ in range(len(legados) + 500):
+        resposta = cliente_http.get('/admin/chamados?limit=1&fields=id_chamado' + (f'&cursor={cursor}' if cursor else ''), headers={'x-access-token': token}).get_json()
+        vistos += [c['id_chamado'] for c in resposta['chamados']]
+        cursor = resposta['next_cursor']
+        if not cursor:
+            break
+    repetidos = len(vistos) != len(set(vistos))
+    print(f"cursor com {len(legados)} chamados antigos: {len(vistos)} páginas de 1, {'REPETIU' if repetidos or cursor else 'OK'}")
+    return repetidos or bool(cursor) or not legados <= set(vistos)
+
+def main():
+    with app.app_context():
+        upline.inicializar_base_dados()
+    cliente_http = app.test_client()
+    token = cliente_http.post('/admin/login', json={'username': 'admin', 'password': 'password'}).get_json()['token']
+    medicoes = []
+    for linhas in (5, 200):
+        with app.app_context():
+            ids = popular(linhas)
+        with app.app_context():
+            medicoes.append(medir(cliente_http, token, ids))
+
+    falhou = False
+    print(f"{'rota':<45} {'consultas (poucas linhas)':>26} {'consultas (muitas linhas)':>26}")
+    for rota in ROTAS:
+        (antes, linhas_antes), (depois, linhas_depois) = medicoes[0][rota], medicoes[1][rota]
+        estado = 'OK' if depois <= antes else 'CRESCEU'
+        falhou = falhou or depois > antes
+        print(f"{rota:<45} {antes:>14} ({linhas_antes:>5} linhas) {depois:>14} ({linhas_depois:>5} linhas)  {estado}")
+    falhou = verificar_cursor_legado(cliente_http, token) or falhou
+    upline.estado_app(app).buffer_localizacoes.parar()
+    sys.exit(1 if falhou else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# cache.py
+# Cache em memória (por processo) com limite de tamanho, expiração e contadores
+
+import threading
+import time
+from collections import OrderedDict
+
+AUSENTE = object()
+
+class CacheTTL:
+    """Cache LRU limitada a `tamanho_maximo` entradas, cada uma válida por até `ttl` segundos.
+
+    `guardar` aceita um instante de expiração próprio (epoch, como o `exp` de um JWT);
+    vale o que chegar primeiro. `obter` devolve AUSENTE quando não há entrada válida,
+    para que None possa ser guardado como resultado negativo.
+    """
+
+    def __init__(self, tamanho_maximo=1024, ttl=300.0):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.removidas = 0
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None or entrada[0] <= agora:
+                if entrada is not None:
+                    del self._entradas[chave]
+                self.falhas += 1
+                return AUSENTE
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return entrada[1]
+
+    def guardar(self, chave, valor, expira_em=None, ttl=None):
+        expira = time.time() + (self.ttl if ttl is None else ttl)
+        if expira_em is not None:
+            expira = min(expira, expira_em)
+        with self._lock:
+            self._entradas[chave] = (expira, valor)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.tamanho_maximo:
+                self._entradas.popitem(last=False)
+                self.removidas += 1
+
+    def remover(self, chave):
+        with self._lock:
+            self._entradas.pop(chave, None)
+
+    def remover_se(self, predicado):
+        """Remove todas as entradas cujo valor satisfaz `predicado(valor)`."""
+        with self._lock:
+            for chave in [c for c, (_, valor) in self._entradas.items() if predicado(valor)]:
+                del self._entradas[chave]
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {'entradas': len(self._entradas), 'tamanho_maximo': self.tamanho_maximo, 'acertos': self.acertos, 'falhas': self.falhas,
+                'removidas_por_limite': self.removidas, 'taxa_acerto': round(self.acertos / total, 4) if total else None}
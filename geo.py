@@ -0,0 +1,150 @@
+# geo.py
+# Funções geográficas e índice espacial dos técnicos de plantão da UpLine Elevadores
+
+import heapq
+import threading
+import time
+from math import radians, sin, cos, sqrt, atan2, floor
+import numpy as np
+
+RAIO_TERRA_KM = 6371.0
+KM_POR_GRAU = 111.19
+
+def calcular_distancia(lat1, lon1, lat2, lon2):
+    R = RAIO_TERRA_KM
+    lat1_rad, lon1_rad, lat2_rad, lon2_rad = map(radians, [lat1, lon1, lat2, lon2])
+    dlon = lon2_rad - lon1_rad
+    dlat = lat2_rad - lat1_rad
+    a = sin(dlat / 2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return R * c
+
+def _vetores_unitarios(lat, lon):
+    lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1).reshape(-1, 3)
+
+def matriz_distancias(lat_a, lon_a, lat_b, lon_b, bloco=64):
+    """Distâncias de círculo máximo (km) entre cada ponto de A e cada ponto de B, em float32 len(A) x len(B).
+
+    Usa o produto interno dos vetores unitários (uma multiplicação de matrizes) em vez de
+    trigonometria por par; coincide com calcular_distancia até ~1 m. Calcula em float64
+    por blocos de `bloco` linhas, pequenos o bastante para os temporários ficarem na cache.
+    """
+    a, b = _vetores_unitarios(lat_a, lon_a), _vetores_unitarios(lat_b, lon_b).T
+    distancias = np.empty((len(a), b.shape[1]), dtype=np.float32)
+    for i in range(0, len(a), bloco):
+        # |a - b| = 2 sin(θ/2) e (|a - b| / 2)² = (1 - a·b) / 2
+        x = a[i:i + bloco] @ b
+        np.subtract(1.0, x, out=x)
+        x *= 0.5
+        np.clip(x, 0.0, 1.0, out=x)
+        np.sqrt(x, out=x)
+        np.arcsin(x, out=x)
+        x *= 2 * RAIO_TERRA_KM
+        distancias[i:i + bloco] = x
+    return distancias
+
+# --- ÍNDICE ESPACIAL EM GRELHA ---
+class IndiceEspacial:
+    """Grelha de células lat/lon (em graus) com as posições conhecidas de cada técnico.
+
+    A pesquisa dos mais próximos percorre anéis de células à volta do ponto e termina
+    assim que nenhuma célula ainda não visitada pode conter um técnico mais perto.
+    """
+
+    def __init__(self, tamanho_celula=0.02):
+        self.tamanho_celula = tamanho_celula
+        self._celulas = {}
+        self._posicoes = {}
+        self._limites = None
+        self._lock = threading.RLock()
+        self.carregado_em = None
+
+    def __len__(self):
+        return len(self._posicoes)
+
+    def __contains__(self, item_id):
+        return item_id in self._posicoes
+
+    def _celula(self, lat, lon):
+        return (int(floor(lat / self.tamanho_celula)), int(floor(lon / self.tamanho_celula)))
+
+    def atualizar(self, item_id, lat, lon):
+        with self._lock:
+            self._remover(item_id)
+            celula = self._celula(lat, lon)
+            self._celulas.setdefault(celula, {})[item_id] = (lat, lon)
+            self._posicoes[item_id] = celula
+            i, j = celula
+            if self._limites is None:
+                self._limites = (i, i, j, j)
+            else:
+                imin, imax, jmin, jmax = self._limites
+                self._limites = (min(imin, i), max(imax, i), min(jmin, j), max(jmax, j))
+
+    def remover(self, item_id):
+        with self._lock:
+            self._remover(item_id)
+
+    def _remover(self, item_id):
+        celula = self._posicoes.pop(item_id, None)
+        if celula is None:
+            return
+        bucket = self._celulas[celula]
+        del bucket[item_id]
+        if not bucket:
+            del self._celulas[celula]
+
+    def carregar(self, posicoes):
+        """Substitui todo o conteúdo por uma sequência de (id, latitude, longitude)."""
+        with self._lock:
+            self._celulas = {}
+            self._posicoes = {}
+            self._limites = None
+            for item_id, lat, lon in posicoes:
+                self.atualizar(item_id, lat, lon)
+            self.carregado_em = time.monotonic()
+
+    def expirado(self, ttl):
+        return self.carregado_em is None or time.monotonic() - self.carregado_em > ttl
+
+    def mais_proximos(self, lat, lon, k=1, excluir=()):
+        """Devolve até k pares (distancia_km, id) ordenados do mais próximo para o mais distante."""
+        with self._lock:
+            if not self._celulas:
+                return []
+            ci, cj = self._celula(lat, lon)
+            # Os limites só crescem (até ao próximo carregar), o que apenas alarga a pesquisa.
+            imin, imax, jmin, jmax = self._limites
+            raio_max = max(abs(ci - imin), abs(ci - imax), abs(cj - jmin), abs(cj - jmax))
+            encontrados = []
+
+            def visitar(bucket):
+                for item_id, (t_lat, t_lon) in bucket.items():
+                    if item_id not in excluir:
+                        encontrados.append((calcular_distancia(lat, lon, t_lat, t_lon), item_id))
+
+            for r in range(raio_max + 1):
+                # Com anéis muito esparsos é mais barato varrer as células ocupadas restantes.
+                if 8 * r > len(self._celulas):
+                    for (i, j), bucket in self._celulas.items():
+                        if max(abs(i - ci), abs(j - cj)) >= r:
+                            visitar(bucket)
+                    break
+                for i in range(ci - r, ci + r + 1):
+                    passo = 1 if abs(i - ci) == r else 2 * r
+                    for j in range(cj - r, cj + r + 1, passo):
+                        bucket = self._celulas.get((i, j))
+                        if bucket:
+                            visitar(bucket)
+                if len(encontrados) >= k:
+                    encontrados = heapq.nsmallest(k, encontrados)
+                    if encontrados[-1][0] <= self._distancia_minima_fora(lat, r):
+                        break
+            return heapq.nsmallest(k, encontrados)
+
+    def _distancia_minima_fora(self, lat, r):
+        # Limite inferior (km) para qualquer ponto fora dos anéis 0..r já visitados.
+        graus = r * self.tamanho_celula
+        lat_extrema = min(89.9, abs(lat) + (r + 1) * self.tamanho_celula)
+        return graus * KM_POR_GRAU * cos(radians(lat_extrema))
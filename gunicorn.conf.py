@@ -0,0 +1,25 @@
+# gunicorn.conf.py
+# Lido automaticamente pelo gunicorn quando arrancado na raiz do projeto; a app vem da fábrica
+# criar_app (wsgi_app abaixo), por isso basta 'gunicorn'.
+# Os streams SSE de /tecnico/<id>/eventos ficam abertos até EVENTOS_DURACAO_MAXIMA segundos;
+# com o worker gthread cada ligação ocupa uma thread leve e não um worker inteiro.
+# Os workers não preparam a base de dados: corra antes 'flask --app app:criar_app esquema inicializar'.
+
+import os
+
+wsgi_app = 'app:criar_app()'
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+keepalive = 5
+
+def post_fork(server, worker):
+    # Com --preload a app (e o pool do engine) é criada no master: cada worker descarta as
+    # ligações herdadas, que não podem ser partilhadas entre processos, e abre as suas.
+    if not server.cfg.preload_app:
+        return
+    from app import db
+    with server.app.wsgi().app_context():
+        db.engine.dispose(close=False)
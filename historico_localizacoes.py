@@ -0,0 +1,180 @@
+# historico_localizacoes.py
+# Histórico das posições dos técnicos em ficheiros diários de registos binários de 16 bytes
+
+import datetime
+import os
+import re
+import numpy as np
+from geo import matriz_distancias
+
+# Um registo por amostra: milissegundos desde a meia-noite (UTC) do dia do ficheiro, id do
+# técnico e latitude/longitude em ponto fixo de 1e-7 graus (~1 cm). Os ficheiros não têm
+# cabeçalho: AAAA-MM-DD.pos recebe as amostras por ordem de chegada (só acrescentos) e
+# AAAA-MM-DD.c<segundos>.pos é o dia compactado, ordenado por (técnico, ms).
+REGISTO = np.dtype([('ms', '<i4'), ('tecnico', '<i4'), ('lat', '<i4'), ('lon', '<i4')])
+ESCALA = 10 ** 7
+_NOME = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:\.c(\d+))?\.pos(\.compactando)?$')
+_VAZIO = np.empty(0, dtype=REGISTO)
+
+def _ms_do_dia(ts):
+    return ((ts.hour * 60 + ts.minute) * 60 + ts.second) * 1000 + ts.microsecond // 1000
+
+def _ler(caminho):
+    # memmap: uma consulta por técnico num dia compactado só lê as páginas da pesquisa binária.
+    if os.path.getsize(caminho) < REGISTO.itemsize:
+        return _VAZIO
+    return np.memmap(caminho, dtype=REGISTO, mode='r', shape=(os.path.getsize(caminho) // REGISTO.itemsize,))
+
+class HistoricoLocalizacoes:
+    """Amostras de posição por dia em `diretorio`; vários processos podem acrescentar ao mesmo tempo.
+
+    Cada lote é uma única escrita O_APPEND, que o sistema de ficheiros local não intercala com
+    as de outros workers. As consultas juntam o ficheiro compactado e o de acrescentos do dia.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+
+    def __bool__(self):
+        return bool(self.diretorio)
+
+    def _caminho(self, dia, intervalo=None):
+        return os.path.join(self.diretorio, f"{dia.isoformat()}{'' if intervalo is None else f'.c{intervalo}'}.pos")
+
+    def _ficheiros(self):
+        """{dia: [(intervalo ou None, caminho), ...]}; os restos de uma compactação interrompida contam como acrescentos."""
+        dias = {}
+        if not os.path.isdir(self.diretorio):
+            return dias
+        for nome in os.listdir(self.diretorio):
+            encontrado = _NOME.match(nome)
+            if encontrado:
+                dia = datetime.date.fromisoformat(encontrado.group(1))
+                intervalo = int(encontrado.group(2)) if encontrado.group(2) and not encontrado.group(3) else None
+                dias.setdefault(dia, []).append((intervalo, os.path.join(self.diretorio, nome)))
+        return dias
+
+    def acrescentar(self, amostras):
+        """Grava [(tecnico_id, latitude, longitude, ts), ...] (ts UTC sem fuso); devolve quantas gravou.
+
+        Coordenadas fora do intervalo válido (ou NaN) são ignoradas.
+        """
+        por_dia = {}
+        for tecnico_id, latitude, longitude, ts in amostras:
+            if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+                por_dia.setdefault(ts.date(), []).append((_ms_do_dia(ts), tecnico_id, round(latitude * ESCALA), round(longitude * ESCALA)))
+        if por_dia:
+            os.makedirs(self.diretorio, exist_ok=True)
+        for dia, linhas in por_dia.items():
+            dados = np.array(linhas, dtype=REGISTO).tobytes()
+            fd = os.open(self._caminho(dia), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, dados)
+            finally:
+                os.close(fd)
+        return sum(len(linhas) for linhas in por_dia.values())
+
+    def _registos(self, dia, ficheiros, ms_inicio, ms_fim, tecnico_id=None):
+        partes = []
+        for intervalo, caminho in ficheiros:
+            registos = _ler(caminho)
+            if intervalo is not None and tecnico_id is not None:
+                inicio, fim = np.searchsorted(registos['tecnico'], [tecnico_id, tecnico_id + 1])
+                registos = registos[inicio:fim]
+                inicio, fim = np.searchsorted(registos['ms'], [ms_inicio, ms_fim + 1])
+                partes.append(np.array(registos[inicio:fim]))
+                continue
+            selecao = (registos['ms'] >= ms_inicio) & (registos['ms'] <= ms_fim)
+            if tecnico_id is not None:
+                selecao &= registos['tecnico'] == tecnico_id
+            partes.append(registos[selecao])
+        return np.concatenate(partes) if partes else _VAZIO
+
+    def _intervalo(self, inicio, fim, tecnico_id=None):
+        """Registos entre os instantes `inicio` e `fim`, com o instante absoluto em ms desde a época."""
+        ficheiros = self._ficheiros()
+        registos, instantes = [], []
+        dia = inicio.date()
+        while dia <= fim.date():
+            if dia in ficheiros:
+                ms_inicio = _ms_do_dia(inicio) if dia == inicio.date() else 0
+                ms_fim = _ms_do_dia(fim) if dia == fim.date() else 86399999
+                parte = self._registos(dia, ficheiros[dia], ms_inicio, ms_fim, tecnico_id)
+                registos.append(parte)
+                instantes.append(parte['ms'].astype(np.int64) + (dia - datetime.date(1970, 1, 1)).days * 86400000)
+            dia += datetime.timedelta(days=1)
+        if not registos:
+            return _VAZIO, np.empty(0, dtype=np.int64)
+        return np.concatenate(registos), np.concatenate(instantes)
+
+    def posicoes(self, tecnico_id, inicio, fim):
+        """Posições do técnico entre `inicio` e `fim`, por ordem: [(ts, latitude, longitude), ...]."""
+        registos, instantes = self._intervalo(inicio, fim, tecnico_id)
+        instantes, indices = np.unique(instantes, return_index=True)
+        registos = registos[indices]
+        return [(datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=int(t)), la / ESCALA, lo / ESCALA)
+                for t, la, lo in zip(instantes.tolist(), registos['lat'].tolist(), registos['lon'].tolist())]
+
+    def proximos(self, latitude, longitude, raio_km, instante, janela=datetime.timedelta(minutes=10)):
+        """Técnicos cuja última posição conhecida em [instante - janela, instante] estava a até `raio_km`.
+
+        Devolve [(tecnico_id, distancia_km, ts, latitude, longitude), ...] do mais perto para o mais longe.
+        """
+        registos, instantes = self._intervalo(instante - janela, instante)
+        if not len(registos):
+            return []
+        ordem = np.lexsort((instantes, registos['tecnico']))
+        tecnicos = registos['tecnico'][ordem]
+        ultimos = ordem[np.append(tecnicos[1:] != tecnicos[:-1], True)]
+        registos, instantes = registos[ultimos], instantes[ultimos]
+        lats, lons = registos['lat'] / ESCALA, registos['lon'] / ESCALA
+        distancias = matriz_distancias([latitude], [longitude], lats, lons)[0]
+        dentro = np.flatnonzero(distancias <= raio_km)
+        dentro = dentro[np.argsort(distancias[dentro], kind='stable')]
+        return [(int(registos['tecnico'][i]), float(distancias[i]), datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=int(instantes[i])), float(lats[i]), float(lons[i]))
+                for i in dentro]
+
+    def compactar(self, dia, intervalo):
+        """Deixa no dia no máximo uma amostra por técnico a cada `intervalo` segundos (0 = só tira
+        duplicados), num único ficheiro ordenado por (técnico, ms). Devolve (registos antes, depois)."""
+        ficheiros = self._ficheiros().get(dia, [])
+        # Os acrescentos passam para .compactando antes da leitura: um flush que chegue entretanto
+        # cria um ficheiro novo, que a próxima compactação junta.
+        origens = []
+        for anterior, caminho in ficheiros:
+            if caminho.endswith('.pos') and anterior is None:
+                os.replace(caminho, caminho + '.compactando')
+                caminho += '.compactando'
+            origens.append(caminho)
+        intervalo = max([intervalo] + [anterior for anterior, _ in ficheiros if anterior is not None])
+        registos = np.concatenate([np.array(_ler(caminho)) for caminho in origens]) if origens else _VAZIO
+        ordem = np.lexsort((registos['ms'], registos['tecnico']))
+        registos = registos[ordem]
+        grupo = registos['ms'] // (intervalo * 1000) if intervalo else registos['ms']
+        primeiros = np.ones(len(registos), dtype=bool)
+        primeiros[1:] = (registos['tecnico'][1:] != registos['tecnico'][:-1]) | (grupo[1:] != grupo[:-1])
+        compactados = registos[primeiros]
+        destino = self._caminho(dia, intervalo)
+        compactados.tofile(destino + '.tmp')
+        os.replace(destino + '.tmp', destino)
+        for caminho in origens:
+            if caminho != destino:
+                os.remove(caminho)
+        return len(registos), len(compactados)
+
+    def manter(self, hoje, dias_completos, intervalo, retencao_dias=0):
+        """Compacta os dias com mais de `dias_completos` dias (pelo menos 2, para não competir com
+        os acrescentos) e apaga os com mais de `retencao_dias` (0 = guarda tudo). Devolve um resumo."""
+        resumo = {'dias_compactados': 0, 'dias_apagados': 0, 'registos_antes': 0, 'registos_depois': 0}
+        for dia, ficheiros in sorted(self._ficheiros().items()):
+            idade = (hoje - dia).days
+            if retencao_dias and idade > retencao_dias:
+                for _, caminho in ficheiros:
+                    os.remove(caminho)
+                resumo['dias_apagados'] += 1
+            elif idade >= max(dias_completos, 2) and (len(ficheiros) > 1 or ficheiros[0][0] is None or ficheiros[0][0] < intervalo):
+                antes, depois = self.compactar(dia, intervalo)
+                resumo['dias_compactados'] += 1
+                resumo['registos_antes'] += antes
+                resumo['registos_depois'] += depois
+        return resumo
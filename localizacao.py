@@ -0,0 +1,102 @@
+# localizacao.py
+# Buffer de agregação das posições GPS enviadas pelos técnicos
+
+import threading
+
+class BufferLocalizacoes:
+    """Guarda apenas a amostra mais recente de cada técnico até ao próximo flush.
+
+    O flush é feito numa thread própria pela função `gravar`, que recebe a lista de amostras
+    {tecnico_id, latitude, longitude, ts}, a cada `intervalo` segundos ou mais cedo quando o
+    buffer atinge `tamanho_maximo` técnicos distintos. O pedido que enche o buffer só acorda
+    a thread; nunca escreve na base de dados.
+
+    Com `gravar_historico`, todas as amostras (não só a mais recente) são-lhe entregues no
+    mesmo flush como (tecnico_id, latitude, longitude, ts). Com `historico_maximo` amostras à
+    espera, as seguintes são descartadas (contadas em `descartadas`) até ao próximo flush; a
+    posição atual continua a ser atualizada. Essa função regista as próprias falhas e não
+    lança exceções.
+    """
+
+    def __init__(self, gravar, intervalo=5.0, tamanho_maximo=500, gravar_historico=None, historico_maximo=20000):
+        self.gravar = gravar
+        self.intervalo = intervalo
+        self.tamanho_maximo = tamanho_maximo
+        self.gravar_historico = gravar_historico
+        self.historico_maximo = historico_maximo
+        self._pendentes = {}
+        self._historico = []
+        self.descartadas = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._parar = threading.Event()
+        self._acordar = threading.Event()
+
+    def __len__(self):
+        return len(self._pendentes)
+
+    def adicionar(self, tecnico_id, latitude, longitude, ts):
+        """Devolve False se já existir no buffer uma amostra mais recente deste técnico."""
+        with self._lock:
+            if self.gravar_historico is not None:
+                if len(self._historico) < self.historico_maximo:
+                    self._historico.append((tecnico_id, latitude, longitude, ts))
+                else:
+                    self.descartadas += 1
+            atual = self._pendentes.get(tecnico_id)
+            if atual is not None and atual['ts'] >= ts:
+                return False
+            self._pendentes[tecnico_id] = {'tecnico_id': tecnico_id, 'latitude': latitude, 'longitude': longitude, 'ts': ts}
+            cheio = len(self._pendentes) >= self.tamanho_maximo or len(self._historico) >= self.historico_maximo
+        self._iniciar_thread()
+        if cheio:
+            self._acordar.set()
+        return True
+
+    def flush(self):
+        # O _flush_lock garante que dois flushes não gravam fora de ordem o mesmo técnico.
+        with self._flush_lock:
+            with self._lock:
+                amostras, self._pendentes = list(self._pendentes.values()), {}
+                historico, self._historico = self._historico, []
+            if historico:
+                self.gravar_historico(historico)
+            if not amostras:
+                return 0
+            try:
+                self.gravar(amostras)
+            except Exception:
+                with self._lock:
+                    for amostra in amostras:
+                        atual = self._pendentes.get(amostra['tecnico_id'])
+                        if atual is None or atual['ts'] < amostra['ts']:
+                            self._pendentes[amostra['tecnico_id']] = amostra
+                raise
+            return len(amostras)
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+        self.flush()
+
+    def _iniciar_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._ciclo, name='flush-localizacoes', daemon=True)
+                self._thread.start()
+
+    def _ciclo(self):
+        # Com intervalo <= 0 a thread só grava quando o buffer enche.
+        while not self._parar.is_set():
+            self._acordar.wait(self.intervalo if self.intervalo > 0 else None)
+            self._acordar.clear()
+            if self._parar.is_set():
+                break
+            try:
+                self.flush()
+            except Exception:
+                # A falha fica registada pela função gravar; as amostras voltam ao buffer.
+                self._parar.wait(max(self.intervalo, 1.0))
@@ -0,0 +1,115 @@
+# metricas.py
+# Contadores e histogramas em memória (por processo), exportados no formato de texto do Prometheus
+
+import abc
+import bisect
+import threading
+
+LIMITES_PEDIDO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LIMITES_SQL = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+def _rotulos(nomes, valores, extra=()):
+    partes = [f'{nome}="{_escapar(valor)}"' for nome, valor in list(zip(nomes, valores)) + list(extra)]
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+class Metrica(abc.ABC):
+    tipo = 'untyped'
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def linhas(self):
+        """Linhas de texto do Prometheus com as amostras desta métrica."""
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def incrementar(self, *valores_rotulos, valor=1):
+        with self._lock:
+            self._series[valores_rotulos] = self._series.get(valores_rotulos, 0) + valor
+
+    def linhas(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        for chave, valor in series:
+            yield f'{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}'
+
+class Histograma(Metrica):
+    """Histograma cumulativo: cada observação custa um bisect e duas somas sob o lock."""
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_PEDIDO):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(limites)
+
+    def observar(self, valor, *valores_rotulos):
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                serie = self._series[valores_rotulos] = [[0] * (len(self.limites) + 1), 0.0]
+            serie[0][bisect.bisect_left(self.limites, valor)] += 1
+            serie[1] += valor
+
+    def linhas(self):
+        with self._lock:
+            series = sorted((chave, list(contagens), soma) for chave, (contagens, soma) in self._series.items())
+        for chave, contagens, soma in series:
+            acumulado = 0
+            for limite, contagem in zip(self.limites + (float('inf'),), contagens):
+                acumulado += contagem
+                yield f'{self.nome}_bucket{_rotulos(self.rotulos, chave, [("le", _numero(limite))])} {acumulado}'
+            yield f'{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}'
+            yield f'{self.nome}_count{_rotulos(self.rotulos, chave)} {acumulado}'
+
+class Leitura(Metrica):
+    """Valores lidos no momento do scrape: `funcao` devolve um número ou {valores_rotulos: número}."""
+
+    def __init__(self, nome, ajuda, funcao, rotulos=(), tipo='gauge'):
+        super().__init__(nome, ajuda, rotulos)
+        self.funcao = funcao
+        self.tipo = tipo
+
+    def linhas(self):
+        valores = self.funcao()
+        if not isinstance(valores, dict):
+            valores = {(): valores}
+        for chave, valor in sorted(valores.items()):
+            yield f'{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}'
+
+class RegistoMetricas:
+    def __init__(self):
+        self._metricas = []
+
+    def _registar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), limites=LIMITES_PEDIDO):
+        return self._registar(Histograma(nome, ajuda, rotulos, limites))
+
+    def leitura(self, nome, ajuda, funcao, rotulos=(), tipo='gauge'):
+        return self._registar(Leitura(nome, ajuda, funcao, rotulos, tipo))
+
+    def texto(self):
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f'# HELP {metrica.nome} {metrica.ajuda}')
+            linhas.append(f'# TYPE {metrica.nome} {metrica.tipo}')
+            linhas.extend(metrica.linhas())
+        return '\n'.join(linhas) + '\n'
@@ -0,0 +1,91 @@
+# respostas.py
+# Serialização das respostas: JSON rápido, datas formatadas com cache, formato colunar e compressão
+
+import gzip
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Datas e dataclasses passam pelo `default` do Flask, para o JSON ser igual com e sem orjson.
+OPCOES_ORJSON = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+TIPOS_COMPRIMIVEIS = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html', 'text/css', 'application/javascript'}
+
+class ProvedorJSON(DefaultJSONProvider):
+    """JSON compacto, em UTF-8 e sem ordenar as chaves; com orjson quando está instalado."""
+
+    ensure_ascii = False
+    sort_keys = False
+
+    def _opcoes(self):
+        indentar = self.compact is False or (self.compact is None and self._app.debug)
+        return OPCOES_ORJSON | (orjson.OPT_INDENT_2 if indentar else 0)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=OPCOES_ORJSON).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=self._opcoes() | orjson.OPT_APPEND_NEWLINE), mimetype=self.mimetype)
+
+# dd/mm/AAAA HH:MM: o dia vem de uma cache (há poucos dias distintos numa listagem) e a hora
+# de uma tabela com os 1440 minutos; ~7x mais rápido do que strftime.
+_MINUTOS = [f'{h:02d}:{m:02d}' for h in range(24) for m in range(60)]
+_dias = {}
+
+def formatar_data(valor):
+    if valor is None:
+        return None
+    dia = _dias.get(valor.toordinal())
+    if dia is None:
+        if len(_dias) > 100000:
+            _dias.clear()
+        dia = _dias[valor.toordinal()] = valor.strftime('%d/%m/%Y ')
+    return dia + _MINUTOS[valor.hour * 60 + valor.minute]
+
+def colunas(itens):
+    """Lista de dicionários (todos com as mesmas chaves) -> {'campos': [...], 'linhas': [[...], ...]}."""
+    return {'campos': list(itens[0]) if itens else [], 'linhas': [list(item.values()) for item in itens]}
+
+def codificacao_aceite(accept_encodings):
+    """'br' ou 'gzip' conforme o Accept-Encoding do pedido (qualidades incluídas), ou None."""
+    return accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+
+def comprimir(resposta, codificacao, minimo=1024, nivel_gzip=6, qualidade_brotli=4):
+    """Comprime o corpo de uma resposta já completa; devolve True se a comprimiu.
+
+    Respostas em stream (exportações, SSE) e ficheiros ficam como estão. Um ETag forte passa
+    a fraco: o corpo comprimido não é byte a byte o mesmo que o original.
+    """
+    if resposta.direct_passthrough or resposta.is_streamed or resposta.mimetype not in TIPOS_COMPRIMIVEIS:
+        return False
+    resposta.vary.add('Accept-Encoding')
+    if not codificacao or resposta.status_code != 200 or 'Content-Encoding' in resposta.headers:
+        return False
+    dados = resposta.get_data()
+    if len(dados) < minimo:
+        return False
+    if codificacao == 'br':
+        resposta.set_data(brotli.compress(dados, quality=qualidade_brotli))
+    else:
+        resposta.set_data(gzip.compress(dados, compresslevel=nivel_gzip, mtime=0))
+    resposta.headers['Content-Encoding'] = codificacao
+    etag, fraco = resposta.get_etag()
+    if etag and not fraco:
+        resposta.set_etag(etag, weak=True)
+    return True
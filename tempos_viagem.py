@@ -0,0 +1,145 @@
+# tempos_viagem.py
+# Grelhas de tempos de viagem pré-calculados (célula x célula) em ficheiros binários mapeados em memória
+
+import csv
+import math
+import struct
+import numpy as np
+
+# Cabeçalho: assinatura, versão, linhas e colunas da grelha, canto sudoeste e tamanho da célula
+# (graus). Segue-se a matriz uint16 N x N (N = linhas * colunas) de segundos, origem x destino.
+FORMATO_CABECALHO = '<4sHIIddd'
+TAMANHO_CABECALHO = 64
+ASSINATURA = b'UPTV'
+VERSAO = 1
+SEM_DADOS = 65535
+COLUNAS_CSV = ('lat_origem', 'lon_origem', 'lat_destino', 'lon_destino', 'segundos')
+
+def _indices_celulas(lats, lons, lat_min, lon_min, celula, linhas, colunas):
+    i = np.floor((np.asarray(lats, dtype=np.float64) - lat_min) / celula).astype(np.int64)
+    j = np.floor((np.asarray(lons, dtype=np.float64) - lon_min) / celula).astype(np.int64)
+    dentro = (i >= 0) & (i < linhas) & (j >= 0) & (j < colunas)
+    return np.where(dentro, i * colunas + j, -1)
+
+class GrelhaTempos:
+    """Uma grelha aberta com np.memmap: só as páginas consultadas são lidas do disco e os
+    workers do gunicorn partilham a cache de páginas do sistema operativo."""
+
+    def __init__(self, caminho):
+        with open(caminho, 'rb') as ficheiro:
+            cabecalho = ficheiro.read(TAMANHO_CABECALHO)
+        if len(cabecalho) < TAMANHO_CABECALHO or cabecalho[:4] != ASSINATURA:
+            raise ValueError(f"{caminho} não é uma grelha de tempos de viagem.")
+        _, versao, self.linhas, self.colunas, self.lat_min, self.lon_min, self.celula = struct.unpack_from(FORMATO_CABECALHO, cabecalho)
+        if versao != VERSAO:
+            raise ValueError(f"{caminho}: versão {versao} da grelha não suportada.")
+        n = self.linhas * self.colunas
+        self.caminho = caminho
+        self.tempos = np.memmap(caminho, dtype='<u2', mode='r', offset=TAMANHO_CABECALHO, shape=(n, n))
+
+    def indice_celula(self, lat, lon):
+        i = math.floor((lat - self.lat_min) / self.celula)
+        j = math.floor((lon - self.lon_min) / self.celula)
+        if 0 <= i < self.linhas and 0 <= j < self.colunas:
+            return i * self.colunas + j
+        return None
+
+    def indices_celulas(self, lats, lons):
+        """Versão vetorial de indice_celula: -1 para pontos fora da grelha."""
+        return _indices_celulas(lats, lons, self.lat_min, self.lon_min, self.celula, self.linhas, self.colunas)
+
+    def segundos(self, lat1, lon1, lat2, lon2):
+        origem, destino = self.indice_celula(lat1, lon1), self.indice_celula(lat2, lon2)
+        if origem is None or destino is None:
+            return None
+        valor = int(self.tempos[origem, destino])
+        return None if valor == SEM_DADOS else valor
+
+class TemposViagem:
+    """Conjunto de grelhas (uma por cidade). Um par de pontos só tem ETA se ambos estiverem na mesma grelha."""
+
+    def __init__(self, grelhas=()):
+        self.grelhas = list(grelhas)
+
+    def __bool__(self):
+        return bool(self.grelhas)
+
+    @classmethod
+    def abrir(cls, caminhos):
+        return cls(GrelhaTempos(caminho) for caminho in caminhos if caminho)
+
+    def segundos(self, lat1, lon1, lat2, lon2):
+        for grelha in self.grelhas:
+            valor = grelha.segundos(lat1, lon1, lat2, lon2)
+            if valor is not None:
+                return valor
+        return None
+
+    def sobrepor(self, matriz, lat_destino, lon_destino, lat_origem, lon_origem, fator=1.0, bloco=256):
+        """Em `matriz` (destinos x origens), substitui cada par com ETA conhecido pelos segundos
+        da origem j até ao destino i multiplicados por `fator`. Onde as grelhas se sobrepõem vale,
+        como em segundos(), a primeira que tem o par: são aplicadas da última para a primeira."""
+        for grelha in reversed(self.grelhas):
+            destinos, origens = grelha.indices_celulas(lat_destino, lon_destino), grelha.indices_celulas(lat_origem, lon_origem)
+            linhas, colunas = np.flatnonzero(destinos >= 0), np.flatnonzero(origens >= 0)
+            if not linhas.size or not colunas.size:
+                continue
+            # Linhas da grelha só das origens usadas, transpostas: cada bloco é um np.take contíguo.
+            por_destino = np.ascontiguousarray(grelha.tempos[origens[colunas]].T)
+            todas_colunas = len(colunas) == matriz.shape[1]
+            for i in range(0, len(linhas), bloco):
+                parte = linhas[i:i + bloco]
+                tempos = np.take(por_destino, destinos[parte], axis=0)
+                indice = parte if todas_colunas else np.ix_(parte, colunas)
+                atual = matriz[indice]
+                np.copyto(atual, tempos * np.float32(fator), where=tempos != SEM_DADOS)
+                matriz[indice] = atual
+        return matriz
+
+def escrever_grelha(caminho, tempos, linhas, colunas, lat_min, lon_min, celula):
+    cabecalho = struct.pack(FORMATO_CABECALHO, ASSINATURA, VERSAO, linhas, colunas, lat_min, lon_min, celula)
+    with open(caminho, 'wb') as ficheiro:
+        ficheiro.write(cabecalho.ljust(TAMANHO_CABECALHO, b'\0'))
+        ficheiro.write(np.ascontiguousarray(tempos, dtype='<u2').tobytes())
+
+def construir_de_csv(entrada, saida, celula=0.01, limites=None):
+    """Agrega um CSV lat_origem,lon_origem,lat_destino,lon_destino,segundos numa grelha.
+
+    Cada par de células fica com a mediana dos tempos que lhe calham; um sentido sem dados
+    usa o sentido inverso e os restantes pares ficam SEM_DADOS (o despacho usa a distância).
+    `limites` = (lat_min, lat_max, lon_min, lon_max); por omissão, os extremos do CSV.
+    Devolve um resumo.
+    """
+    with open(entrada, newline='', encoding='utf-8') as ficheiro:
+        cabecalho = next(csv.reader(ficheiro), [])
+        em_falta = [coluna for coluna in COLUNAS_CSV if coluna not in cabecalho]
+        if em_falta:
+            raise ValueError(f"{entrada}: faltam as colunas {', '.join(em_falta)}.")
+        dados = np.loadtxt(ficheiro, delimiter=',', usecols=[cabecalho.index(coluna) for coluna in COLUNAS_CSV], dtype=np.float64, ndmin=2)
+    if not len(dados):
+        raise ValueError(f"{entrada} não tem linhas.")
+    if limites is None:
+        lats, lons = np.concatenate([dados[:, 0], dados[:, 2]]), np.concatenate([dados[:, 1], dados[:, 3]])
+        limites = (lats.min(), lats.max(), lons.min(), lons.max())
+    lat_min, lat_max, lon_min, lon_max = limites
+    linhas, colunas = int((lat_max - lat_min) // celula) + 1, int((lon_max - lon_min) // celula) + 1
+    n = linhas * colunas
+    if n > 8192:
+        raise ValueError(f"{linhas}x{colunas} células dão uma matriz de {n * n * 2 / 1e9:.1f} GB; use células maiores ou limites menores.")
+
+    origens = _indices_celulas(dados[:, 0], dados[:, 1], lat_min, lon_min, celula, linhas, colunas)
+    destinos = _indices_celulas(dados[:, 2], dados[:, 3], lat_min, lon_min, celula, linhas, colunas)
+    validos = (origens >= 0) & (destinos >= 0) & np.isfinite(dados[:, 4]) & (dados[:, 4] >= 0)
+    chaves, segundos = origens[validos] * n + destinos[validos], np.minimum(np.rint(dados[validos, 4]), SEM_DADOS - 1)
+    ordem = np.lexsort((segundos, chaves))
+    chaves, segundos = chaves[ordem], segundos[ordem]
+    unicas, inicio, contagem = np.unique(chaves, return_index=True, return_counts=True)
+
+    tempos = np.full(n * n, SEM_DADOS, dtype=np.uint16)
+    tempos[unicas] = segundos[inicio + (contagem - 1) // 2]
+    tempos = tempos.reshape(n, n)
+    inversos = (tempos == SEM_DADOS) & (tempos.T != SEM_DADOS)
+    tempos[inversos] = tempos.T[inversos]
+    escrever_grelha(saida, tempos, linhas, colunas, lat_min, lon_min, celula)
+    return {'linhas_csv': len(dados), 'linhas_ignoradas': int((~validos).sum()), 'celulas': n, 'grelha': f'{linhas}x{colunas}',
+            'pares_com_tempo': int((tempos != SEM_DADOS).sum()), 'bytes': TAMANHO_CABECALHO + tempos.nbytes}